@@ -0,0 +1,132 @@
+"""In-process stand-in for the Azure AD / B2C endpoints msal talks to, so benchmarks run without network.
+
+`FakeIdentityProvider` can be handed to msal as its `http_client`. It answers instance discovery,
+OpenID metadata and the token endpoint (authorization_code, refresh_token and client_credentials grants) for any
+authority, and issues ID tokens for a configurable set of users."""
+from urllib.parse import urlparse, parse_qs
+import base64
+import json
+import time
+import uuid
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+class FakeResponse(object):
+    def __init__(self, status_code: int, body: dict, headers: dict = None) -> None:
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self.headers = headers or {'Content-Type': 'application/json'}
+
+    def json(self) -> dict:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise RuntimeError(f"fake idp returned {self.status_code}: {self.text}")
+
+class FakeIdentityProvider(object):
+    TOKEN_LIFETIME = 3600
+
+    def __init__(self, tenant_id: str = 'fake-tenant-id', sign_id_token=None) -> None:
+        self.tenant_id = tenant_id
+        # sign_id_token(header: dict, claims: dict) -> str. unsigned ('alg': 'none') by default: msal doesn't check signatures
+        self.sign_id_token = sign_id_token or self._unsigned_id_token
+        self._codes = {} # authorization code -> (user, nonce)
+        self._refresh_tokens = {} # refresh token -> user
+        self.requests = 0
+        self.app_token_requests = 0 # client_credentials grants
+
+    @staticmethod
+    def _unsigned_id_token(header: dict, claims: dict) -> str:
+        header = dict(header, alg='none')
+        return f"{b64url(json.dumps(header).encode())}.{b64url(json.dumps(claims).encode())}."
+
+    @staticmethod
+    def make_user(index: int) -> dict:
+        return {'oid': f'00000000-0000-0000-0000-{index:012d}', 'name': f'User {index}',
+                'preferred_username': f'user{index}@contoso.example'}
+
+    def issue_code(self, user: dict, nonce: str = None) -> str:
+        """what the authorize endpoint would hand to the browser after a successful sign in"""
+        code = uuid.uuid4().hex
+        self._codes[code] = (user, nonce)
+        return code
+
+    @staticmethod
+    def _authority_base(url: str) -> str:
+        # https://host/tenant[/policy]/v2.0/.well-known/openid-configuration -> https://host/tenant[/policy]
+        path = urlparse(url).path
+        for marker in ('/v2.0/.well-known/openid-configuration', '/.well-known/openid-configuration', '/oauth2/v2.0/'):
+            if marker in path:
+                path = path[:path.index(marker)]
+                break
+        parsed = urlparse(url)
+        return f'{parsed.scheme}://{parsed.netloc}{path}'
+
+    def metadata(self, base: str) -> dict:
+        return {
+            'issuer': f'{base}/v2.0',
+            'authorization_endpoint': f'{base}/oauth2/v2.0/authorize',
+            'token_endpoint': f'{base}/oauth2/v2.0/token',
+            'end_session_endpoint': f'{base}/oauth2/v2.0/logout',
+            'jwks_uri': f'{base}/discovery/v2.0/keys',
+        }
+
+    def _token_response(self, base: str, client_id: str, user: dict, nonce: str = None, scope: str = '') -> dict:
+        now = int(time.time())
+        claims = {'iss': f'{base}/v2.0', 'aud': client_id, 'iat': now, 'nbf': now, 'exp': now + self.TOKEN_LIFETIME,
+                  'oid': user['oid'], 'sub': user['oid'], 'tid': self.tenant_id, 'name': user['name'],
+                  'preferred_username': user['preferred_username'], 'ver': '2.0'}
+        if nonce:
+            claims['nonce'] = nonce
+        refresh_token = uuid.uuid4().hex
+        self._refresh_tokens[refresh_token] = user
+        return {
+            'token_type': 'Bearer',
+            'scope': scope,
+            'expires_in': self.TOKEN_LIFETIME,
+            'access_token': uuid.uuid4().hex,
+            'refresh_token': refresh_token,
+            'id_token': self.sign_id_token({'typ': 'JWT', 'kid': 'fake-key'}, claims),
+            'client_info': b64url(json.dumps({'uid': user['oid'], 'utid': self.tenant_id}).encode()),
+        }
+
+    def handle(self, method: str, url: str, params: dict = None, data: dict = None) -> FakeResponse:
+        self.requests += 1
+        path = urlparse(url).path
+        if method == 'GET' and path.endswith('/discovery/instance'):
+            authorize_endpoint = (params or {}).get('authorization_endpoint', url)
+            base = self._authority_base(authorize_endpoint)
+            return FakeResponse(200, {'tenant_discovery_endpoint': f'{base}/v2.0/.well-known/openid-configuration',
+                                      'api-version': '1.1', 'metadata': []})
+        if method == 'GET' and path.endswith('/.well-known/openid-configuration'):
+            return FakeResponse(200, self.metadata(self._authority_base(url)))
+        if method == 'POST' and path.endswith('/oauth2/v2.0/token'):
+            data = data or {}
+            base = self._authority_base(url)
+            grant_type = data.get('grant_type', None)
+            if grant_type == 'authorization_code' and data.get('code') in self._codes:
+                user, nonce = self._codes.pop(data['code'])
+                return FakeResponse(200, self._token_response(base, data.get('client_id'), user, nonce, data.get('scope', '')))
+            if grant_type == 'refresh_token' and data.get('refresh_token') in self._refresh_tokens:
+                user = self._refresh_tokens.pop(data['refresh_token'])
+                return FakeResponse(200, self._token_response(base, data.get('client_id'), user, None, data.get('scope', '')))
+            if grant_type == 'client_credentials':
+                self.app_token_requests += 1
+                return FakeResponse(200, {'token_type': 'Bearer', 'expires_in': self.TOKEN_LIFETIME,
+                                          'access_token': uuid.uuid4().hex})
+            return FakeResponse(400, {'error': 'invalid_grant', 'error_description': 'fake idp: unknown code or refresh token'})
+        return FakeResponse(404, {'error': 'not_found'})
+
+    # msal http_client interface
+    def get(self, url: str, params: dict = None, headers: dict = None, **kwargs) -> FakeResponse:
+        return self.handle('GET', url, params=params)
+
+    def post(self, url: str, params: dict = None, data: dict = None, headers: dict = None, **kwargs) -> FakeResponse:
+        if isinstance(data, (str, bytes)):
+            data = {k: v[0] for k, v in parse_qs(data if isinstance(data, str) else data.decode()).items()}
+        return self.handle('POST', url, params=params, data=data)
+
+    def close(self) -> None:
+        pass
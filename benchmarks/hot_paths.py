@@ -0,0 +1,258 @@
+"""Microbenchmarks for the ms_identity_web hot paths, against both the Flask and the Django adapter.
+
+msal talks to an in-process fake identity provider (see fake_idp.py), so no network is involved.
+Each benchmark runs with token caches holding a varying number of accounts. Only the call under
+test is timed: building the request/session for each iteration is not.
+
+usage (from the repo root, with flask, django and msal installed):
+    python benchmarks/hot_paths.py --output results.json
+    python benchmarks/hot_paths.py --output new.json --compare results.json
+
+Results are written as json: one record per (benchmark, adapter, accounts) with timings in
+microseconds per call, plus metadata about the environment, so runs of different versions can be compared.
+"""
+from contextlib import contextmanager
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.insert(0, REPO_ROOT)
+
+from fake_idp import FakeIdentityProvider
+from msal import ConfidentialClientApplication, SerializableTokenCache
+import msal
+
+from ms_identity_web import IdentityWebPython
+from ms_identity_web.configuration import AADConfig
+from ms_identity_web.context import IdentityContextData
+
+BENCH_STATE = 'benchmark-state'
+REDIRECT_URI = 'http://localhost/auth/redirect'
+
+def build_token_cache(idp: FakeIdentityProvider, aad_config, accounts: int) -> str:
+    """serialized token cache holding `accounts` signed-in users"""
+    cache = SerializableTokenCache()
+    client_config = dict(aad_config.client.__dict__, token_cache=cache, http_client=idp)
+    client = ConfidentialClientApplication(**client_config)
+    for index in range(accounts):
+        code = idp.issue_code(idp.make_user(index))
+        client.acquire_token_by_authorization_code(code, aad_config.auth_request.scopes, REDIRECT_URI)
+    return cache.serialize()
+
+def signed_in_session(serialized_cache: str) -> dict:
+    """session encoding of a signed-in user, whose token cache is `serialized_cache`"""
+    user = FakeIdentityProvider.make_user(0)
+    id_context = IdentityContextData()
+    id_context.authenticated = True
+    id_context.username = user['name']
+    now = int(time.time())
+    id_context.id_token_claims = dict(user, iat=now, nbf=now, exp=now + 3600)
+    id_context.home_account_id = f"{user['oid']}.fake-tenant-id"
+    id_context._token_cache = serialized_cache
+    id_context.state = BENCH_STATE
+    return id_context.encode()
+
+class FlaskHarness(object):
+    name = 'flask'
+    config_file = 'aad.flask.config.json'
+
+    def __init__(self, idp: FakeIdentityProvider) -> None:
+        from flask import Flask
+        from ms_identity_web.adapters import FlaskContextAdapter
+        self.app = Flask(__name__)
+        self.app.secret_key = 'benchmark'
+        self.app.add_url_rule('/', 'index', lambda: 'index')
+        self.aad_config = AADConfig.parse_json(os.path.join(REPO_ROOT, self.config_file))
+        self.adapter = FlaskContextAdapter(self.app)
+        self.ms_identity_web = IdentityWebPython(self.aad_config, self.adapter)
+        self.ms_identity_web._http_client = idp
+
+    @contextmanager
+    def request(self, query: dict = None, session: dict = None):
+        from flask import session as flask_session
+        with self.app.test_request_context('/auth/redirect', query_string=query or {}):
+            if session is not None:
+                flask_session[IdentityContextData.SESSION_KEY] = dict(session)
+            self.app.preprocess_request()
+            yield self.adapter
+
+class DjangoHarness(object):
+    name = 'django'
+    config_file = 'aad.django.config.json'
+
+    def __init__(self, idp: FakeIdentityProvider) -> None:
+        import django
+        from django.conf import settings
+        from django.test import RequestFactory
+        if not settings.configured:
+            settings.configure(SECRET_KEY='benchmark', ALLOWED_HOSTS=['*'], INSTALLED_APPS=['django.contrib.sessions'],
+                               SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies', ROOT_URLCONF=__name__)
+            django.setup()
+        self.request_factory = RequestFactory()
+        self.aad_config = AADConfig.parse_json(os.path.join(REPO_ROOT, self.config_file))
+        self.ms_identity_web = IdentityWebPython(self.aad_config)
+        self.ms_identity_web._http_client = idp
+
+    @contextmanager
+    def request(self, query: dict = None, session: dict = None):
+        from django.contrib.sessions.backends.signed_cookies import SessionStore
+        from ms_identity_web.django.adapter import DjangoContextAdapter
+        request = self.request_factory.get('/auth/redirect', query or {})
+        request.session = SessionStore()
+        if session is not None:
+            request.session[IdentityContextData.SESSION_KEY] = dict(session)
+        adapter = DjangoContextAdapter(request)
+        token = self.ms_identity_web.bind_adapter(adapter)
+        try:
+            adapter._on_request_init()
+            yield adapter
+        finally:
+            self.ms_identity_web.unbind_adapter(token)
+
+urlpatterns = [] # ROOT_URLCONF of the django harness
+
+def time_calls(harness, setup, call, number: int, repeat: int) -> list:
+    """per-call seconds for each of `repeat` rounds of `number` calls. setup(adapter) -> args runs untimed"""
+    rounds = []
+    for round_index in range(repeat + 1): # the first round warms up and isn't reported
+        elapsed = 0.0
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(number):
+                with setup(harness) as args:
+                    start = time.perf_counter()
+                    call(harness, *args)
+                    elapsed += time.perf_counter() - start
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        if round_index:
+            rounds.append(elapsed / number)
+    return rounds
+
+def benchmarks(idp: FakeIdentityProvider, serialized_cache: str) -> dict:
+    """name -> (setup, call). setup is a context manager factory yielding the call's extra args"""
+    session = signed_in_session(serialized_cache)
+
+    @contextmanager
+    def anonymous(harness):
+        with harness.request(session={}):
+            yield ()
+
+    @contextmanager
+    def signed_in(harness):
+        with harness.request(session=session) as adapter:
+            yield (adapter,)
+
+    @contextmanager
+    def redirect_with_code(harness):
+        query = {'code': idp.issue_code(idp.make_user(0)), 'state': BENCH_STATE}
+        with harness.request(query=query, session=session):
+            yield ()
+
+    @contextmanager
+    def token_result(harness):
+        query = {'code': idp.issue_code(idp.make_user(0))}
+        result = idp.post(f'{harness.aad_config.client.authority}/oauth2/v2.0/token',
+                          data=dict(query, grant_type='authorization_code', client_id=harness.aad_config.client.client_id)).json()
+        now = int(time.time())
+        result['id_token_claims'] = dict(idp.make_user(0), iat=now, nbf=now, exp=now + 3600)
+        with harness.request(session=session) as adapter:
+            yield (result, adapter.identity_context_data.token_cache)
+
+    @contextmanager
+    def changed_context(harness):
+        with harness.request(session=session) as adapter:
+            adapter.identity_context_data.access_token = 'changed'
+            adapter.identity_context_data.token_cache.has_state_changed = True
+            yield (adapter,)
+
+    def protected_view():
+        return 'ok'
+
+    def login_required(harness, adapter):
+        harness.ms_identity_web.login_required(protected_view)()
+
+    return {
+        'get_auth_url': (anonymous, lambda harness: harness.ms_identity_web.get_auth_url(redirect_uri=REDIRECT_URI)),
+        'process_auth_redirect': (redirect_with_code, lambda harness: harness.ms_identity_web.process_auth_redirect(
+                                  redirect_uri=REDIRECT_URI, afterwards_go_to_url='/')),
+        '_process_result': (token_result, lambda harness, result, cache: harness.ms_identity_web._process_result(result, cache)),
+        'identity_context_deserialize': (signed_in, lambda harness, adapter: adapter._deserialize_identity_context_data_from_session().token_cache),
+        'identity_context_serialize': (changed_context, lambda harness, adapter: adapter._serialize_identity_context_data_to_session()),
+        'login_required': (signed_in, login_required),
+    }
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'git_commit': commit or None,
+            'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'platform': platform.platform(), 'msal': msal.__version__}
+
+def run(accounts_list: list, number: int, repeat: int, selected: list = None) -> dict:
+    records = []
+    for harness_class in (FlaskHarness, DjangoHarness):
+        idp = FakeIdentityProvider()
+        harness = harness_class(idp)
+        for accounts in accounts_list:
+            serialized_cache = build_token_cache(idp, harness.aad_config, accounts)
+            for name, (setup, call) in benchmarks(idp, serialized_cache).items():
+                if selected and name not in selected:
+                    continue
+                rounds = time_calls(harness, setup, call, number, repeat)
+                median = statistics.median(rounds)
+                records.append({
+                    'name': name, 'adapter': harness.name, 'accounts': accounts,
+                    'number': number, 'repeat': repeat,
+                    'min_us': min(rounds) * 1e6, 'median_us': median * 1e6, 'mean_us': statistics.mean(rounds) * 1e6,
+                    'stdev_us': (statistics.stdev(rounds) if len(rounds) > 1 else 0.0) * 1e6,
+                    'ops_per_sec': 1 / median if median else None,
+                    'session_bytes': len(json.dumps(signed_in_session(serialized_cache))),
+                })
+                print(f"{name:30} {harness.name:7} accounts={accounts:<3} median {median * 1e6:10.1f} us")
+    return {'environment': environment(), 'results': records}
+
+def compare(results: dict, baseline: dict) -> None:
+    def key(record):
+        return (record['name'], record['adapter'], record['accounts'])
+    previous = {key(record): record for record in baseline['results']}
+    print(f"\n{'benchmark':30} {'adapter':7} {'accounts':>8} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    for record in results['results']:
+        before = previous.get(key(record), None)
+        if before is None:
+            continue
+        change = (record['median_us'] - before['median_us']) / before['median_us'] * 100
+        print(f"{record['name']:30} {record['adapter']:7} {record['accounts']:>8} "
+              f"{before['median_us']:>12.1f} {record['median_us']:>12.1f} {change:>+7.1f}%")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, nargs='+', default=[1, 10, 50], help='token cache sizes to run with')
+    parser.add_argument('--number', type=int, default=200, help='calls per round')
+    parser.add_argument('--repeat', type=int, default=5, help='timed rounds')
+    parser.add_argument('--benchmark', nargs='+', help='only run these benchmarks')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='print the change against the results in this json file')
+    args = parser.parse_args()
+
+    results = run(args.accounts, args.number, args.repeat, args.benchmark)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
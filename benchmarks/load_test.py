@@ -0,0 +1,197 @@
+"""End-to-end load test: how many sign-ins per second one app worker sustains, for Flask and Django.
+
+Starts the mock identity provider (mock_idp_server.py) and, for each framework, an app worker
+(load_test_apps.py) in their own processes, then drives full browser-like cycles against them:
+    sign_in -> authorize (idp) -> redirect -> protected page -> sign_out -> logout (idp) -> post_sign_out
+at each requested concurrency. Every virtual user keeps its own cookie jar and connections.
+
+Reports throughput (cycles/s), p50/p95/p99 latency of the whole cycle and of each step, errors, and the
+size of the cookies after sign in (both frameworks use cookie-based sessions). With --session-codec the
+apps keep the identity context in compressed, chunked cookies of its own (session_codec.py); with
+--signed-state sign_in carries the state in a signed token instead of the session (signed_state.py).
+
+usage (from the repo root, with flask, django, msal and cryptography installed):
+    python benchmarks/load_test.py --concurrency 1 8 32 --duration 20 --output load.json
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_STEPS = ('sign_in', 'redirect', 'protected', 'sign_out', 'post_sign_out')
+
+def start_process(script: str, *args: str, env: dict = None) -> tuple:
+    """starts a benchmarks/ script and returns (process, the first line it prints)"""
+    process = subprocess.Popen([sys.executable, os.path.join(BENCHMARKS_DIR, script), *args], cwd=BENCHMARKS_DIR,
+                               stdout=subprocess.PIPE, text=True, env=dict(os.environ, **(env or {})))
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError(f"{script} exited before it was ready (exit code {process.wait()})")
+    return process, line.strip()
+
+def percentile(sorted_values: list, percent: float) -> float:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(percent / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def latency_summary(values: list) -> dict:
+    values = sorted(values)
+    return {'count': len(values),
+            'p50_ms': percentile(values, 50), 'p95_ms': percentile(values, 95), 'p99_ms': percentile(values, 99),
+            'max_ms': values[-1] if values else None}
+
+class VirtualUser(object):
+    """one browser: its own cookie jar and keep-alive connections"""
+
+    def __init__(self, app_url: str, framework: str, ca_bundle: str) -> None:
+        self.app_url = app_url
+        self.framework = framework
+        self.http = requests.Session()
+        self.http.trust_env = False # env CA bundles / proxies would override verify
+        self.http.verify = ca_bundle
+
+    def _get(self, step: str, url: str, timings: dict) -> requests.Response:
+        start = time.perf_counter()
+        response = self.http.get(url, allow_redirects=False)
+        timings[step] = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f"{step}: {url} returned {response.status_code}")
+        return response
+
+    def _follow(self, step: str, response: requests.Response, timings: dict) -> requests.Response:
+        if response.status_code not in (301, 302, 303, 307):
+            raise RuntimeError(f"expected a redirect before {step}, got {response.status_code}")
+        return self._get(step, urljoin(response.url, response.headers['Location']), timings)
+
+    def cycle(self) -> tuple:
+        """runs one sign in / sign out cycle. returns (per-step ms, cookie bytes after sign in)"""
+        timings = {}
+        response = self._get('sign_in', urljoin(self.app_url, '/auth/sign_in'), timings)
+        response = self._follow('authorize', response, timings)
+        self._follow('redirect', response, timings)
+        # the session cookie, and the identity context cookies if the app uses a session codec
+        session_bytes = sum(len(cookie.value or '') for cookie in self.http.cookies)
+        response = self._get('protected', urljoin(self.app_url, '/protected'), timings)
+        if not response.text.startswith('signed in as'):
+            raise RuntimeError(f"protected page didn't see a signed in user: {response.text[:100]}")
+        response = self._get('sign_out', urljoin(self.app_url, '/auth/sign_out'), timings)
+        response = self._follow('logout', response, timings)
+        self._follow('post_sign_out', response, timings)
+        return timings, session_bytes
+
+def drive(app_url: str, framework: str, ca_bundle: str, concurrency: int, duration: float, warmup: int) -> dict:
+    measure_start = stop_at = None
+    lock = threading.Lock()
+    cycles, errors, session_sizes = [], [], []
+
+    def run_user() -> None:
+        user = VirtualUser(app_url, framework, ca_bundle)
+        try:
+            for _ in range(warmup):
+                user.cycle()
+        except Exception:
+            barrier.abort() # don't leave the other users waiting
+            raise
+        barrier.wait()
+        while time.perf_counter() < stop_at:
+            try:
+                timings, session_bytes = user.cycle()
+            except Exception as ex:
+                with lock:
+                    errors.append(str(ex))
+                continue
+            with lock:
+                cycles.append(timings)
+                session_sizes.append(session_bytes)
+
+    def start_clock() -> None:
+        nonlocal measure_start, stop_at
+        measure_start = time.perf_counter()
+        stop_at = measure_start + duration
+
+    barrier = threading.Barrier(concurrency, action=start_clock)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(run_user) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - measure_start # includes the cycles in flight at stop_at
+
+    return {
+        'framework': framework,
+        'concurrency': concurrency,
+        'duration_s': elapsed,
+        'cycles': len(cycles),
+        'errors': len(errors),
+        'first_errors': errors[:5],
+        'sign_ins_per_sec': len(cycles) / elapsed if elapsed else None,
+        'cycle': latency_summary([sum(timings.values()) for timings in cycles]),
+        'app_time_per_cycle': latency_summary([sum(timings[step] for step in APP_STEPS) for timings in cycles]),
+        'steps': {step: latency_summary([timings[step] for timings in cycles])
+                  for step in ('sign_in', 'authorize', 'redirect', 'protected', 'sign_out', 'logout', 'post_sign_out')},
+        'session_bytes': {'mean': sum(session_sizes) / len(session_sizes) if session_sizes else None,
+                          'max': max(session_sizes) if session_sizes else None},
+    }
+
+def report(result: dict) -> None:
+    def ms(value):
+        return f"{value:8.1f}" if value is not None else '       -'
+    cycle = result['cycle']
+    print(f"{result['framework']:7} c={result['concurrency']:<4} {result['sign_ins_per_sec'] or 0:8.1f} sign-ins/s  "
+          f"cycle p50 {ms(cycle['p50_ms'])} p95 {ms(cycle['p95_ms'])} p99 {ms(cycle['p99_ms'])} ms  "
+          f"session {result['session_bytes']['max'] or 0} B  errors {result['errors']}")
+    for step, summary in result['steps'].items():
+        print(f"    {step:14} p50 {ms(summary['p50_ms'])} p95 {ms(summary['p95_ms'])} p99 {ms(summary['p99_ms'])} ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frameworks', nargs='+', choices=['flask', 'django'], default=['flask', 'django'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='virtual users driving the app at once')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to measure at each concurrency')
+    parser.add_argument('--warmup', type=int, default=2, help='unmeasured cycles per virtual user')
+    parser.add_argument('--users', type=int, default=1000, help='distinct users the mock idp signs in')
+    parser.add_argument('--session-codec', action='store_true', help='keep the identity context in its own compressed cookies')
+    parser.add_argument('--signed-state', action='store_true', help='carry the auth request state in a signed token, not the session')
+    parser.add_argument('--output', help='write the results to this json file')
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        idp_process, line = start_process('mock_idp_server.py', '--port', '0', '--users', str(args.users))
+        processes.append(idp_process)
+        idp = json.loads(line)
+        results = []
+        for framework in args.frameworks:
+            app_args = (['--session-codec'] if args.session_codec else []) + (['--signed-state'] if args.signed_state else [])
+            app_process, line = start_process('load_test_apps.py', framework, '--port', '0', '--authority', idp['authority'],
+                                              *app_args, env={'REQUESTS_CA_BUNDLE': idp['ca_bundle']})
+            processes.append(app_process)
+            app_url = line.split(' on ', 1)[1]
+            for concurrency in args.concurrency:
+                result = drive(app_url, framework, idp['ca_bundle'], concurrency, args.duration, args.warmup)
+                report(result)
+                results.append(result)
+            app_process.terminate()
+            app_process.wait()
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+
+    if args.output:
+        environment = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                       'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment, 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Minimal Flask and Django apps wired up the way the README describes, for the load test driver.
+
+Each exposes '/' (named 'index'), '/protected' (behind login_required) and the library's auth endpoints
+under /auth (FlaskAADEndpoints / MsalViews.url_patterns), with cookie-based sessions so the session
+payload travels with every response.
+
+usage (load_test.py starts these itself):
+    REQUESTS_CA_BUNDLE=<mock idp ca bundle> python benchmarks/load_test_apps.py flask --port 5000 --authority <mock idp authority>
+"""
+import argparse
+import logging
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.insert(0, REPO_ROOT)
+
+from ms_identity_web import IdentityWebPython
+from ms_identity_web.configuration import AADConfig
+from ms_identity_web.session_codec import SessionCodec
+from ms_identity_web.signed_state import SignedState
+
+def load_config(framework: str, authority: str):
+    aad_config = AADConfig.parse_json(os.path.join(REPO_ROOT, f'aad.{framework}.config.json'))
+    aad_config.client.authority = authority
+    aad_config.client.validate_authority = False # msal would check 127.0.0.1 against Microsoft's instance discovery
+    aad_config.client.client_id = 'load-test-client-id'
+    aad_config.client.client_credential = 'load-test-client-secret'
+    return aad_config
+
+def flask_app(authority: str, session_codec: SessionCodec = None, signed_state: SignedState = None):
+    from flask import Flask
+    from ms_identity_web.adapters import FlaskContextAdapter
+    app = Flask(__name__)
+    app.secret_key = 'load-test'
+    adapter = FlaskContextAdapter(app)
+    ms_identity_web = IdentityWebPython(load_config('flask', authority), adapter, session_codec=session_codec,
+                                        signed_state=signed_state)
+
+    @app.route('/')
+    def index():
+        return 'index'
+
+    @app.route('/protected')
+    @ms_identity_web.login_required
+    def protected():
+        return f'signed in as {ms_identity_web.id_data.username}'
+
+    return app
+
+urlpatterns = [] # filled in by django_app: this module is the ROOT_URLCONF
+
+def django_app(authority: str, session_codec: SessionCodec = None, signed_state: SignedState = None):
+    import django
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+    from django.http import HttpResponse
+    from django.urls import include, path
+
+    ms_identity_web = IdentityWebPython(load_config('django', authority), session_codec=session_codec,
+                                        signed_state=signed_state)
+    settings.configure(SECRET_KEY='load-test', ALLOWED_HOSTS=['*'], ROOT_URLCONF=__name__,
+                       INSTALLED_APPS=['django.contrib.sessions'],
+                       SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+                       MIDDLEWARE=['django.contrib.sessions.middleware.SessionMiddleware',
+                                   'ms_identity_web.django.middleware.MsalMiddleware'],
+                       MS_IDENTITY_WEB=ms_identity_web)
+    django.setup()
+    from ms_identity_web.django.msal_views_and_urls import MsalViews
+
+    def index(request):
+        return HttpResponse('index')
+
+    @ms_identity_web.login_required
+    def protected(request):
+        return HttpResponse(f'signed in as {request.identity_context_data.username}')
+
+    prefix = ms_identity_web.aad_config.django.auth_endpoints.prefix
+    urlpatterns.extend([
+        path('', index, name='index'),
+        path('protected', protected),
+        path(f'{prefix}/', include(MsalViews(ms_identity_web).url_patterns())),
+    ])
+    return get_wsgi_application()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('framework', choices=['flask', 'django'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--authority', required=True, help="the mock identity provider's authority")
+    parser.add_argument('--session-codec', action='store_true', help='keep the identity context in its own compressed cookies')
+    parser.add_argument('--signed-state', action='store_true', help='carry the auth request state in a signed token, not the session')
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # no per-request access log
+    session_codec = SessionCodec() if args.session_codec else None
+    signed_state = SignedState() if args.signed_state else None
+    app = (flask_app if args.framework == 'flask' else django_app)(args.authority, session_codec, signed_state)
+    # the same threaded wsgi server for both frameworks, so their numbers are comparable
+    server = make_server(args.host, args.port, app, threaded=True)
+    print(f'serving {args.framework} on http://{args.host}:{server.server_port}', flush=True)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
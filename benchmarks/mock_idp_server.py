@@ -0,0 +1,190 @@
+"""Local mock identity provider served over https, for load tests that go through a real browser-like flow.
+
+Serves, for any tenant path under https://127.0.0.1:<port>/:
+- /{tenant}/oauth2/v2.0/authorize: signs a user in without a prompt and redirects back with ?code=&state=
+  (the user is picked by login_hint, or round-robin over `users` users)
+- /{tenant}/oauth2/v2.0/logout: redirects to post_logout_redirect_uri
+- /{tenant}/discovery/v2.0/keys: JWKS for the RS256 key the ID tokens are signed with
+- instance discovery, OpenID metadata and the token endpoint, as FakeIdentityProvider does in-process
+The TLS certificate is self-signed: clients must trust `ca_bundle` (msal requires https authorities).
+
+usage:
+    python benchmarks/mock_idp_server.py --port 8443
+prints the authority and the ca bundle path, then serves until interrupted."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import urlencode, urlparse, parse_qs
+import argparse
+import datetime
+import ipaddress
+import itertools
+import json
+import os
+import ssl
+import tempfile
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+from fake_idp import FakeIdentityProvider, b64url
+
+class RS256Signer(object):
+    """signs ID tokens with a freshly generated RSA key, and publishes that key as a JWKS"""
+    KEY_ID = 'mock-idp-key'
+
+    def __init__(self) -> None:
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def __call__(self, header: dict, claims: dict) -> str:
+        header = dict(header, alg='RS256', kid=self.KEY_ID)
+        signing_input = f"{b64url(json.dumps(header).encode())}.{b64url(json.dumps(claims).encode())}"
+        signature = self.private_key.sign(signing_input.encode('ascii'), padding.PKCS1v15(), hashes.SHA256())
+        return f"{signing_input}.{b64url(signature)}"
+
+    def jwks(self) -> dict:
+        numbers = self.private_key.public_key().public_numbers()
+        def encode_int(value: int) -> str:
+            return b64url(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+        return {'keys': [{'kty': 'RSA', 'use': 'sig', 'alg': 'RS256', 'kid': self.KEY_ID,
+                          'n': encode_int(numbers.n), 'e': encode_int(numbers.e)}]}
+
+def self_signed_certificate(directory: str, host: str = '127.0.0.1') -> tuple:
+    """writes a certificate for `host` (and localhost) and its key to `directory`. returns (cert path, key path)"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder()
+                   .subject_name(name).issuer_name(name)
+                   .public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(minutes=5))
+                   .not_valid_after(now + datetime.timedelta(days=1))
+                   .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(host)),
+                                                               x509.DNSName('localhost')]), critical=False)
+                   .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+                   .sign(key, hashes.SHA256()))
+    cert_path = os.path.join(directory, 'mock_idp_cert.pem')
+    key_path = os.path.join(directory, 'mock_idp_key.pem')
+    with open(cert_path, 'wb') as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+class MockIdentityProviderServer(object):
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, tenant_id: str = 'fake-tenant-id', users: int = 1000) -> None:
+        self.signer = RS256Signer()
+        self.idp = FakeIdentityProvider(tenant_id, sign_id_token=self.signer)
+        self.users = users
+        self._next_user = itertools.cycle(range(users))
+        self._lock = Lock() # FakeIdentityProvider isn't thread safe
+        self._directory = tempfile.mkdtemp(prefix='mock_idp_')
+        self.ca_bundle, key_path = self_signed_certificate(self._directory, host)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.ca_bundle, key_path)
+        self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self.host, self.port = self.httpd.server_address[:2]
+
+    @property
+    def authority(self) -> str:
+        return f'https://{self.host}:{self.port}/{self.idp.tenant_id}'
+
+    @staticmethod
+    def _user_index(login_hint: str) -> int:
+        # a hint of one of make_user's usernames (user<index>@contoso.example) signs that same user in again
+        name, _, domain = (login_hint or '').partition('@')
+        if domain == 'contoso.example' and name.startswith('user') and name[len('user'):].isdigit():
+            return int(name[len('user'):])
+        return None
+
+    def _authorize(self, params: dict) -> tuple:
+        login_hint = params.get('login_hint', None)
+        with self._lock:
+            index = self._user_index(login_hint)
+            if index is None:
+                index = next(self._next_user)
+            user = self.idp.make_user(index)
+            if login_hint:
+                user = dict(user, preferred_username=login_hint)
+            code = self.idp.issue_code(user, params.get('nonce', None))
+        query = {'code': code, 'state': params.get('state', '')}
+        return 302, {'Location': f"{params['redirect_uri']}?{urlencode(query)}"}, b''
+
+    def respond(self, method: str, path: str, params: dict, data: dict = None) -> tuple:
+        """(status, headers, body) for a request"""
+        if path.endswith('/oauth2/v2.0/authorize'):
+            return self._authorize(params)
+        if path.endswith('/oauth2/v2.0/logout'):
+            location = params.get('post_logout_redirect_uri', None)
+            return (302, {'Location': location}, b'') if location else (200, {}, b'signed out')
+        if path.endswith('/discovery/v2.0/keys'):
+            return 200, {'Content-Type': 'application/json'}, json.dumps(self.signer.jwks()).encode()
+        url = f'https://{self.host}:{self.port}{path}'
+        with self._lock:
+            response = self.idp.handle(method, url, params=params, data=data)
+        return response.status_code, response.headers, response.text.encode()
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True # headers and body go out in separate writes
+
+            def _reply(self, status: int, headers: dict, body: bytes) -> None:
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                self._reply(*server.respond('GET', url.path, params))
+
+            def do_POST(self) -> None:
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length', 0))
+                data = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+                self._reply(*server.respond('POST', url.path, {}, data))
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> 'MockIdentityProviderServer':
+        Thread(target=self.httpd.serve_forever, name='mock_idp', daemon=True).start()
+        return self
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--tenant-id', default='fake-tenant-id')
+    parser.add_argument('--users', type=int, default=1000, help='number of distinct users to sign in round-robin')
+    args = parser.parse_args()
+
+    server = MockIdentityProviderServer(args.host, args.port, args.tenant_id, args.users)
+    print(json.dumps({'authority': server.authority, 'ca_bundle': server.ca_bundle}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Startup-cost guard: how long `import ms_identity_web` takes in a fresh interpreter, and what it drags in.
+
+Each scenario is imported in `--runs` fresh subprocesses. The check fails (exit code 1) if
+- the median import time of a scenario exceeds `--max-ms`, or
+- a scenario loads a module it has no use for: msal, the web frameworks, asyncio, sqlite3... are
+  only imported on first use, and each framework integration must not import the other framework.
+Framework integrations are timed with their framework already imported: only our own cost counts.
+Run it in CI next to the other checks:
+    python benchmarks/startup.py --max-ms 50
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+MAX_MS = 50 # budget for the median import time of each scenario
+RUNS = 7
+
+HEAVY = ['msal', 'requests', 'asyncio', 'sqlite3', 'concurrent.futures', 'tempfile']
+FRAMEWORKS = ['flask', 'werkzeug', 'django']
+
+# name -> (untimed setup, timed statement, modules the statement must not load)
+SCENARIOS = {
+    'package': ('pass', 'import ms_identity_web', HEAVY + FRAMEWORKS),
+    'configuration': ('pass', 'import ms_identity_web.configuration', HEAVY + FRAMEWORKS),
+    'flask integration': ('import flask', 'import ms_identity_web.flask_blueprint.adapter', HEAVY + ['django']),
+    'django integration': ('import django.http, django.shortcuts, django.urls', 'import ms_identity_web.django.adapter',
+                           HEAVY + ['flask', 'werkzeug']),
+}
+
+PROBE = """
+import sys, time, json
+{setup}
+before = set(sys.modules)
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'loaded': [m for m in {forbidden!r} if m in sys.modules and m not in before]}}))
+"""
+
+def probe(setup: str, statement: str, forbidden: list) -> dict:
+    code = PROBE.format(setup=setup, statement=statement, forbidden=forbidden)
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def available(setup: str, statement: str) -> bool:
+    return subprocess.run([sys.executable, '-c', f'{setup}\n{statement}'], cwd=REPO_ROOT, capture_output=True).returncode == 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=RUNS, help='fresh interpreters per scenario')
+    parser.add_argument('--max-ms', type=float, default=MAX_MS, help='budget for the median import time of each scenario')
+    parser.add_argument('--output', help='write the results to this json file')
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for name, (setup, statement, forbidden) in SCENARIOS.items():
+        if not available(setup, statement):
+            print(f"{name:20} skipped: `{statement}` fails here (framework not installed?)")
+            continue
+        runs = [probe(setup, statement, forbidden) for _ in range(args.runs)]
+        median = statistics.median(run['ms'] for run in runs)
+        loaded = sorted({module for run in runs for module in run['loaded']})
+        results[name] = {'statement': statement, 'median_ms': median, 'min_ms': min(run['ms'] for run in runs),
+                         'unexpected_modules': loaded}
+        print(f"{name:20} median {median:7.1f} ms" + (f"  loads {', '.join(loaded)}" if loaded else ''))
+        if median > args.max_ms:
+            failures.append(f"{name}: median import time {median:.1f} ms exceeds {args.max_ms} ms")
+        if loaded:
+            failures.append(f"{name}: `{statement}` loads {', '.join(loaded)}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
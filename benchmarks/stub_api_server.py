@@ -0,0 +1,110 @@
+"""Local stub of a downstream web API (such as Graph), to try call_downstream_api against without network.
+
+Serves over plain http, with keep-alive, under http://127.0.0.1:<port>/:
+- POST /revoke: revokes the bearer token of the request. The API then answers 401 to it, as an API
+  does to a token that was revoked or expired early: call_downstream_api refreshes and retries
+- any other GET or POST: 401 without a (non-revoked) bearer token, else 200 with a json body:
+  {"token": the bearer token, "connection_requests": requests served on this connection so far,
+   "connections": connections accepted so far}. `connection_requests` > 1 shows a reused connection
+- --delay adds latency to every reply, e.g. to see callers wait for a free pooled connection
+
+usage:
+    python benchmarks/stub_api_server.py --port 8080
+prints the api url, then serves until interrupted."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+import argparse
+import json
+import time
+
+class StubApiServer(object):
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, delay: float = 0) -> None:
+        self.delay = delay
+        self._lock = Lock()
+        self.revoked = set()
+        self.connections = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def respond(self, method: str, path: str, authorization: str, connection_requests: int) -> tuple:
+        """(status, body) for a request"""
+        token = authorization[len('Bearer '):] if authorization and authorization.startswith('Bearer ') else None
+        with self._lock:
+            if not token or token in self.revoked:
+                return 401, {'error': 'invalid_token'}
+            if method == 'POST' and path == '/revoke':
+                self.revoked.add(token)
+                return 200, {'revoked': token}
+            connections = self.connections
+        if self.delay:
+            time.sleep(self.delay)
+        return 200, {'token': token, 'connection_requests': connection_requests, 'connections': connections}
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # keep-alive
+            disable_nagle_algorithm = True
+
+            def setup(self) -> None:
+                super().setup()
+                self.connection_requests = 0
+                with server._lock:
+                    server.connections += 1
+
+            def _serve(self, method: str) -> None:
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.connection_requests += 1
+                status, body = server.respond(method, self.path, self.headers.get('Authorization', None),
+                                              self.connection_requests)
+                encoded = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def do_GET(self) -> None:
+                self._serve('GET')
+
+            def do_POST(self) -> None:
+                self._serve('POST')
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> 'StubApiServer':
+        Thread(target=self.httpd.serve_forever, name='stub_api', daemon=True).start()
+        return self
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--delay', type=float, default=0, help='seconds added to every reply')
+    args = parser.parse_args()
+
+    server = StubApiServer(args.host, args.port, args.delay)
+    print(json.dumps({'url': server.url}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,31 @@
-from msal import ConfidentialClientApplication, SerializableTokenCache
-
 from uuid import uuid4
 from logging import Logger
 from typing import Any
-from functools import wraps
+from functools import wraps, partial
+import time
+from contextvars import ContextVar, Token
+import base64
+import json
 from .context import IdentityContextData
 from .constants import *
+from .configuration import AADConfig, CompiledAADConfig
 from .adapters import IdentityWebContextAdapter
+from .client_pool import ConfidentialClientPool, RequestBoundTokenCache
+from .token_cache_stores import TokenCacheStore
+from .executor import BoundedExecutor
+from .metadata_cache import MetadataCache
+from .token_index import AccessTokenIndex
+from .auth_url import AuthUrlTemplateCache
+from .session_codec import SessionCodec
+from .signed_state import SignedState
+from .tenants import TenantResolver
+from .app_tokens import AppTokenCache
+from .downstream import DownstreamApiClient
+from .transport import PooledTransport
+from .authorization import ClaimIndex, ClaimPolicy
+from .refresh_scheduler import TokenRefreshScheduler
+from .single_flight import SingleFlight
+from .instrumentation import Instrumentation, instrumented
 from .errors import *
 
 # TODO: 
@@ -15,10 +34,7 @@ from .errors import *
 # - do configurations work on multi-threaded flask environment? if not, attach them to current_app. configurations aren't stateful so this may be a moot point?
 # - edit profile interaction required error on edit profile if no token_cache or expired?
 # - password reset should use login hint/no interaction?
-# - decorator for filter by security groups
-# - decorator for app roles RBAC
 # - auth failure handler to handle un-auth access?
-# - implement more client_type options (single and multi tenant)
 # - define django adapter: factor common adapter methods to a parent class that flask and django adapters inherit
 #
 # code quality:
@@ -29,6 +45,28 @@ from .errors import *
 # - replace is comparators with == ?
 # - cleanup / refactor constants file
 
+# msal and the framework integrations are imported on first use, not with this package:
+# cold starts of workers that haven't signed anyone in yet don't pay for them
+_LAZY_ATTRIBUTES = {
+    'ConfidentialClientApplication': 'msal',
+    'SerializableTokenCache': 'msal',
+    'NotAuthenticatedError': 'ms_identity_web.errors',
+    'NotAuthorizedError': 'ms_identity_web.errors',
+    'FlaskContextAdapter': 'ms_identity_web.flask_blueprint.adapter',
+    'TokenStoreMaintenance': 'ms_identity_web.maintenance',
+}
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRIBUTES:
+        from importlib import import_module
+        return getattr(import_module(_LAZY_ATTRIBUTES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# enum values compared on every request, resolved once
+_RESPONSE_TYPE_CODE = str(ResponseType.CODE)
+_ERROR_CODE_PARAM_KEY = str(AADErrorResponse.ERROR_CODE_PARAM_KEY)
+_B2C_FORGOT_PASSWORD_ERROR_CODE = str(AADErrorResponse.B2C_FORGOT_PASSWORD_ERROR_CODE)
+
 def require_context_adapter(f):
     @wraps(f)
     def assert_adapter(self, *args, **kwargs):
@@ -42,10 +80,73 @@ def require_context_adapter(f):
         
 class IdentityWebPython(object):
 
-    def __init__(self, aad_config: 'AADConfig', adapter: IdentityWebContextAdapter = None, logger: Logger = None) -> None:
+    def __init__(self, aad_config: 'AADConfig | CompiledAADConfig', adapter: IdentityWebContextAdapter = None, logger: Logger = None,
+                 token_cache_store: TokenCacheStore = None, instrumentation: Instrumentation = None,
+                 session_codec: SessionCodec = None, signed_state: SignedState = None,
+                 app_token_cache: AppTokenCache = None) -> None:
         self._logger = logger or Logger('IdentityWebPython')
-        self._adapter = None
-        self.aad_config = aad_config
+        self._default_adapter = None
+        # adapter bound to the current request (thread/asyncio task) only. Takes precedence over the default adapter
+        self._bound_adapter = ContextVar(f'ms_identity_web_adapter_{id(self)}', default=None)
+        # frozen, with the per-request values (authorities, logout url, ...) precomputed. see configuration.py
+        self.aad_config = AADConfig.compile(aad_config)
+        # B2C: users' tokens are redeemed at the sign in policy's authority, as on sign in (the bare B2C
+        # authority has no token endpoint). None: the configured authority
+        self._token_b2c_policy = self.aad_config.b2c.susi if self.aad_config.is_b2c else None
+        # phase timings (see instrumentation.py). None: disabled
+        self._instrumentation = instrumentation
+        instrumentation_config = getattr(aad_config, 'instrumentation', None)
+        if instrumentation is None and instrumentation_config:
+            self._instrumentation = Instrumentation.from_config(instrumentation_config)
+        # keeps the identity context in compressed, chunked cookies of its own (see session_codec.py). None: in the session
+        self.session_codec = session_codec
+        session_codec_config = getattr(aad_config, 'session_codec', None)
+        if session_codec is None and session_codec_config:
+            self.session_codec = SessionCodec.from_config(session_codec_config)
+        # set: state/nonce travel in a signed token instead of the session (see signed_state.py)
+        self._signed_state = signed_state
+        signed_state_config = getattr(aad_config, 'signed_state', None)
+        if signed_state is None and signed_state_config:
+            self._signed_state = SignedState.from_config(signed_state_config)
+        # multi-tenant mode: per-tenant authorities, issuer allow-list and client pool (see tenants.py)
+        self._tenants = None
+        if self.aad_config.is_multi_tenant:
+            self._tenants = TenantResolver.from_config(self.aad_config.authority, getattr(aad_config, 'multi_tenant', None))
+        self._client_pool = ConfidentialClientPool.process_pool()
+        pool_config = getattr(aad_config, 'client_pool', None)
+        if pool_config and getattr(pool_config, 'max_size', None):
+            self._client_pool.resize(pool_config.max_size)
+        # set: token caches are kept server-side in this store (see token_cache_stores.py). None: in the session
+        self.token_cache_store = None
+        store_config = getattr(aad_config, 'token_cache_store', None)
+        if token_cache_store is None and store_config:
+            token_cache_store = TokenCacheStore.from_config(store_config)
+        if token_cache_store is not None:
+            self.set_token_cache_store(token_cache_store)
+        # runs the blocking msal calls of the asyncio API (aget_auth_url etc.)
+        self._executor = BoundedExecutor.from_config(getattr(aad_config, 'executor', None))
+        self._access_token_index = AccessTokenIndex.from_config(getattr(aad_config, 'access_token_index', None))
+        # authorization request urls, compiled once per policy/redirect_uri/scopes (see auth_url.py)
+        self._auth_url_templates = AuthUrlTemplateCache.from_config(getattr(aad_config, 'auth_url_templates', None))
+        # app-only tokens of acquire_token_for_app, shared by the whole process (and with a store, by all workers)
+        self._app_tokens = app_token_cache or AppTokenCache.from_config(getattr(aad_config, 'app_tokens', None))
+        # pooled keep-alive http client of call_downstream_api
+        self._downstream_api = DownstreamApiClient.from_config(getattr(aad_config, 'downstream_api', None))
+        # roles and groups of the signed-in users' ID tokens, checked by roles_required/groups_required
+        self._claim_index = ClaimIndex.from_config(getattr(aad_config, 'claim_index', None))
+        # coalesces concurrent silent token acquisitions for the same account/scopes/authority
+        self._single_flight = SingleFlight()
+        self._refresh_scheduler = None
+        refresh_config = getattr(aad_config, 'token_refresh', None)
+        if refresh_config:
+            self.enable_token_refresh(TokenRefreshScheduler.from_config(refresh_config, self._logger))
+        # http_client handed to msal: the shared keep-alive transport (see transport.py), behind the metadata cache if any
+        self._transport = PooledTransport.from_config(getattr(aad_config, 'http_transport', None), self.aad_config.client)
+        self._transport.instrumentation = self._instrumentation
+        self._http_client = self._transport
+        metadata_cache_config = getattr(aad_config, 'metadata_cache', None)
+        if metadata_cache_config:
+            self._http_client = MetadataCache.from_config(metadata_cache_config, http_client=self._transport, logger=self._logger)
         if adapter is not None:
              self.set_adapter(adapter)
 
@@ -54,72 +155,176 @@ class IdentityWebPython(object):
     def id_data(self) -> IdentityContextData:
         return self._adapter.identity_context_data
     
+    @property
+    def _adapter(self) -> IdentityWebContextAdapter:
+        return self._bound_adapter.get() or self._default_adapter
+
     # TODO: make the call from the adapter to this and reverse the config process?
     def set_adapter(self, adapter: IdentityWebContextAdapter) -> None:                
+        """set the process-wide adapter, e.g. a FlaskContextAdapter which resolves its context per request itself"""
         # if isinstance(adapter, FlaskContextAdapter):
-        self._adapter = adapter
+        self._default_adapter = adapter
         adapter.attach_identity_web_util(self)
         # else:
         #     raise NotImplementedError(f"Currently, only the following adapters are supoprted: FlaskContextAdapter")
+
+    def bind_adapter(self, adapter: IdentityWebContextAdapter) -> Token:
+        """bind a per-request adapter (e.g. a DjangoContextAdapter) to the current thread/asyncio task only,
+        so concurrent requests never see each other's adapter. Pass the returned token to unbind_adapter
+        once the request is done."""
+        adapter.attach_identity_web_util(self)
+        return self._bound_adapter.set(adapter)
+
+    def unbind_adapter(self, token: Token) -> None:
+        self._bound_adapter.reset(token)
         
     def set_logger(self, logger: Logger) -> None:
         self._logger = logger
 
-    def _client_factory(self, token_cache: SerializableTokenCache = None, b2c_policy: str = None, **msal_client_kwargs) -> ConfidentialClientApplication:
-        client_config = self.aad_config.client.__dict__.copy() # need to make a copy since contents must be mutated
-        client_config['authority'] = f'{self.aad_config.client.authority}{b2c_policy or ""}'
-        if token_cache:
-            client_config['token_cache'] = token_cache
-        client_config.update(**msal_client_kwargs)
+    def enable_token_refresh(self, scheduler: TokenRefreshScheduler) -> None:
+        """refresh access tokens in the background shortly before they expire, for users who are still
+        active. Requires a token cache store, since session-held caches can't be reached outside a request."""
+        if self.token_cache_store is None:
+            self._logger.warning("enable_token_refresh: background token refresh requires a token cache store. not enabled")
+            return
+        self._refresh_scheduler = scheduler
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        return self._instrumentation
+
+    def set_instrumentation(self, instrumentation: Instrumentation) -> None:
+        """record phase timings with instrumentation (e.g. a PhaseMetrics), or stop recording them with None"""
+        self._instrumentation = instrumentation
+        self._transport.instrumentation = instrumentation
+
+    def set_session_codec(self, session_codec: SessionCodec) -> None:
+        """keep the identity context in its own compressed, chunked cookies (None: in the session)"""
+        self.session_codec = session_codec
+
+    def set_signed_state(self, signed_state: SignedState) -> None:
+        """carry the auth request state in a signed token rather than the session (None: in the session)"""
+        self._signed_state = signed_state
+
+    def set_app_token_cache(self, app_token_cache: AppTokenCache) -> None:
+        """keep the tokens of acquire_token_for_app in app_token_cache (e.g. one with a store shared by all workers)"""
+        self._app_tokens = app_token_cache
+
+    def set_token_cache_store(self, token_cache_store: TokenCacheStore) -> None:
+        """keep token caches server-side in token_cache_store instead of in the session.
+        Each IdentityWebPython has its own: the adapter hands it to the identity context of every request."""
+        self.token_cache_store = token_cache_store
+
+    def _client_factory(self, token_cache: 'SerializableTokenCache' = None, b2c_policy: str = None, tenant: str = None,
+                        **msal_client_kwargs) -> 'ConfidentialClientApplication':
+        from msal import ConfidentialClientApplication, SerializableTokenCache
+        client_config, pool_key = self.aad_config.client_config(b2c_policy)
+        pool = self._client_pool
+        if tenant is not None and self._tenants is not None:
+            # clients of the tenant's authority, kept in the (bounded) pool of the tenants
+            client_config, pool_key = self._tenants.client_config(tenant, client_config)
+            pool = self._tenants.clients
+        if msal_client_kwargs:
+            # clients with per-call options are one-offs: don't share them through the pool
+            client_config = dict(client_config, token_cache=token_cache)
+            if self._http_client is not None:
+                client_config['http_client'] = self._http_client
+            client_config.update(**msal_client_kwargs)
+            return ConfidentialClientApplication(**client_config)
 
-        return ConfidentialClientApplication(**client_config)        
+        # pooled clients are shared: attach this request's token cache to the current context instead
+        RequestBoundTokenCache.bind(token_cache or SerializableTokenCache())
+        return pool.get(client_config, b2c_policy, key=pool_key, http_client=self._http_client)
 
+    def warm_up(self) -> None:
+        """call at startup: builds (and pools) the client for the authority and every configured
+        B2C policy, which prefetches their OpenID metadata, before the first sign-in needs it."""
+        for b2c_policy in self.aad_config.b2c_policies or (None,):
+            try:
+                self._client_factory(b2c_policy=b2c_policy)
+            except Exception as ex:
+                self._logger.warning(f"warm_up: failed to prefetch metadata for policy {b2c_policy}\n{ex}")
+
+    @instrumented('get_auth_url')
     @require_context_adapter
-    def get_auth_url(self, redirect_uri:str = None, b2c_policy: str = None, **msal_auth_url_kwargs):
+    def get_auth_url(self, redirect_uri:str = None, b2c_policy: str = None, post_sign_in_url: str = None, **msal_auth_url_kwargs):
         """ Gets the auth URL that the user must be redirected to. Automatically
-            configures B2C if app type is set to B2C."""
-        auth_req_options = self.aad_config.auth_request.__dict__.copy()
-        auth_req_options.update(**msal_auth_url_kwargs)
+            configures B2C if app type is set to B2C. post_sign_in_url: where process_auth_redirect
+            sends the user once signed in."""
+        config = self.aad_config
+        # the kwargs for msal: configured options, overridden by the caller's
+        auth_req_options = {**config.auth_request_options, **msal_auth_url_kwargs}
         if redirect_uri:
             auth_req_options['redirect_uri'] = redirect_uri
-        self._generate_and_append_state_to_context_and_request(auth_req_options)
+        if config.is_b2c:
+            if not b2c_policy:
+                b2c_policy = config.b2c.susi
+        else:
+            b2c_policy = None
+        tenant = None
+        if self._tenants is not None:
+            # the signed-in user's tenant, or the tenant of the login_hint's domain
+            id_data = self.id_data
+            tenant = self._tenants.resolve(id_data._id_token_claims if id_data.authenticated else None,
+                                           auth_req_options.get('login_hint', None))
+
+        if self._signed_state is not None:
+            # nothing is written to the session: it all goes in the state
+            self._generate_and_append_signed_state_to_request(auth_req_options, b2c_policy, post_sign_in_url, tenant)
+        else:
+            self._generate_and_append_state_to_context_and_request(auth_req_options)
+            if config.is_b2c:
+                self._adapter.identity_context_data.last_used_b2c_policy = b2c_policy
+            if self._tenants is not None:
+                self._adapter.identity_context_data.last_used_tenant = tenant
+            if post_sign_in_url:
+                self._adapter.identity_context_data.post_sign_in_url = post_sign_in_url
 
         if self.id_data.authenticated:
             auth_req_options['login_hint'] = self.id_data._id_token_claims.get('preferred_username', None)
 
-        if self.aad_config.type.authority_type == str(AuthorityType.B2C):
-            if not b2c_policy:
-                b2c_policy = self.aad_config.b2c.susi
-            self._adapter.identity_context_data.last_used_b2c_policy = b2c_policy
-            return self._client_factory(b2c_policy=b2c_policy).get_authorization_request_url(**auth_req_options)
-
-        return self._client_factory().get_authorization_request_url(**auth_req_options)
+        # same url as the client's get_authorization_request_url, without building or calling the client once compiled
+        return self._auth_url_templates.get_url(b2c_policy or tenant, auth_req_options,
+                                                partial(self._client_factory, b2c_policy=b2c_policy, tenant=tenant))
 
+    @instrumented('process_auth_redirect')
     @require_context_adapter
     def process_auth_redirect(self, redirect_uri: str = None, response_type: str = None, afterwards_go_to_url: str = None) -> Any:
         req_params = self._adapter.get_request_params_as_dict() # grab the incoming request params
+        state_claims = None
         try:
             # CSRF protection: make sure to check that state matches the one placed in the session in the previous step.
             # This check ensures this app + this same user session made the /authorize request that resulted in this redirect
             # This should always be the first thing verified on redirect.
-            self._verify_state(req_params)
+            # with signed state, these are the claims the state carries (nonce, policy, post sign in url)
+            state_claims = self._verify_state(req_params)
             
             self._logger.info("process_auth_redirect: state matches. continuing.")
             self._parse_redirect_errors(req_params)
             self._logger.info("process_auth_redirect: no errors found in request params. continuing.")
             
             # get the response_type that was requested, and extract the payload:
-            resp_type = response_type or self.aad_config.auth_request.response_type or str(ResponseType.CODE)
+            resp_type = response_type or self.aad_config.response_type or _RESPONSE_TYPE_CODE
             payload = self._extract_auth_response_payload(req_params, resp_type)
-            cache = self._adapter.identity_context_data.token_cache
-            redirect_uri = redirect_uri or self.aad_config.auth_request.redirect_uri or None
+            # each sign in starts from an empty cache: whoever signed in before in this session must not end up
+            # in (and be committed under the account of) the new user's cache. it becomes the context's on success
+            from msal import SerializableTokenCache
+            cache = SerializableTokenCache()
+            redirect_uri = redirect_uri or self.aad_config.redirect_uri or None
 
-            if resp_type == str(ResponseType.CODE): # code request is default for msal-python if there is no response type specified
+            if resp_type == _RESPONSE_TYPE_CODE: # code request is default for msal-python if there is no response type specified
                 # we should have a code. Now we must exchange the code for tokens.
-                result = self._x_change_auth_code_for_token(payload, cache, redirect_uri)
+                result = self._x_change_auth_code_for_token(payload, cache, redirect_uri, state_claims)
             else:
                 raise NotImplementedError(f"response_type {resp_type} is not yet implemented by ms_identity_web_python")
+            if self._tenants is not None and 'error' not in result:
+                # multi-tenant authorities accept any tenant's users: only allowed tenants' may sign in
+                self._tenants.validate_issuer(result.get('id_token_claims', None))
             self._process_result(result, cache)
+            self._index_access_token(self.aad_config.scopes, result)
+            if self._signed_state is not None:
+                # signed in: spend the browser's state tokens, on every worker. the next sign in binds anew
+                self._adapter.set_response_cookie(self._signed_state.binding_cookie, '', 0)
             # self._verify_nonce() # one of the last steps TODO - is this required? msal python takes care of it?
         except AuthSecurityError as ase:
             self.remove_user()
@@ -132,7 +337,8 @@ class IdentityWebPython(object):
         except B2CPasswordError as b2cpwe:
             self.remove_user()
             self._logger.error(f"process_auth_redirect: b2c pwd {b2cpwe.args}")
-            pw_reset_url = self.get_auth_url(redirect_uri=redirect_uri, b2c_policy = self.aad_config.b2c.password)
+            pw_reset_url = self.get_auth_url(redirect_uri=redirect_uri, b2c_policy = self.aad_config.b2c.password,
+                                             post_sign_in_url=(state_claims or {}).get('r', None))
             return self._adapter.redirect_to_absolute_url(pw_reset_url)
             # don't raise
         except TokenExchangeError as ter:
@@ -146,42 +352,221 @@ class IdentityWebPython(object):
         
         #TODO: GET /auth/redirect?error=interaction_required&error_description=AADB2C90077%3a+User+does+not+have+an+existing+session+and+request+prompt+parameter+has+a+value+of+%27None%27.
         self._logger.info("process_auth_redirect: exiting auth code method. redirecting... ")
+        if state_claims and state_claims.get('r', None):
+            afterwards_go_to_url = state_claims['r'] # the post sign in url the sign in was started with
         return self._adapter.redirect_to_absolute_url(afterwards_go_to_url)
 
+    @instrumented('token_exchange')
     @require_context_adapter
-    def _x_change_auth_code_for_token(self, code: str, token_cache: SerializableTokenCache = None, redirect_uri = None) -> dict:
+    def _x_change_auth_code_for_token(self, code: str, token_cache: 'SerializableTokenCache' = None, redirect_uri = None,
+                                      state_claims: dict = None) -> dict:
         # use the same policy that got us here: depending on /authorize request initiation
         id_context = self._adapter.identity_context_data
-        if self.aad_config.type.authority_type == str(AuthorityType.B2C):
-            b2c_policy = id_context.last_used_b2c_policy or self.aad_config.b2c.susi
+        if state_claims is not None:
+            last_used_b2c_policy, tenant, nonce = state_claims.get('p', None), state_claims.get('m', None), state_claims.get('n', None)
+        else:
+            last_used_b2c_policy = id_context.last_used_b2c_policy if self.aad_config.is_b2c else None
+            tenant = id_context.last_used_tenant if self._tenants is not None else None
+            nonce = id_context.nonce
+        if self.aad_config.is_b2c:
+            b2c_policy = last_used_b2c_policy or self.aad_config.b2c.susi
             client = self._client_factory(token_cache=token_cache, b2c_policy=b2c_policy)
         else:
-            client = self._client_factory(token_cache=token_cache)
+            # the code is redeemed at the (tenant's) authority it was requested from
+            client = self._client_factory(token_cache=token_cache, tenant=tenant)
+            if tenant is not None and state_claims is None:
+                id_context.last_used_tenant = None
 
         result = client.acquire_token_by_authorization_code(code, 
-                                                   self.aad_config.auth_request.scopes,
+                                                   self.aad_config.scopes,
                                                    redirect_uri,
-                                                   id_context.nonce)
+                                                   nonce)
         return result
 
+    @instrumented('acquire_token_silently')
     @require_context_adapter
-    def acquire_token_silently(self, scopes=None, account=None, authority=None, token_cache=None, **kwargs):
+    def acquire_token_silently(self, scopes=None, account=None, authority=None, token_cache=None, **kwargs) -> dict:
+        """acquire an access token for the signed-in user from the token cache (redeeming the refresh token
+        if needed) and place it in the identity context. Returns the token result."""
         # the params take precedence over settings file.
         id_data = self.id_data
+        scopes = scopes or self.aad_config.scopes
+        home_account_id = id_data.home_account_id
+        # plain lookups for the signed-in user are answered from the index while the token is valid
+        if home_account_id and not (account or authority or token_cache or kwargs):
+            access_token = self._access_token_index.get(home_account_id, scopes, self._token_tenant())
+            token_cache_store = self.token_cache_store
+            if access_token is not None and token_cache_store is not None and not token_cache_store.contains(home_account_id):
+                # removed from the store (remove_user or TokenStoreMaintenance.evict, possibly in another worker):
+                # the tokens indexed here mustn't outlive it. msal finds out from the (now empty) cache
+                self._forget_accounts({home_account_id})
+                access_token = None
+            if access_token is not None:
+                if access_token != id_data.access_token:
+                    id_data.access_token = access_token
+                return {'access_token': access_token, 'token_type': 'Bearer', 'token_source': 'index'}
+
         token_cache = token_cache or id_data.token_cache
-        client = self._client_factory(token_cache=token_cache)
+        flight_key = self._silent_flight_key(scopes, account, authority, **kwargs)
+        if flight_key is None:
+            result = self._acquire_token_silent_result(scopes, account, token_cache, **kwargs)
+        else:
+            # concurrent callers (e.g. parallel XHRs of one user) share the first caller's msal call.
+            # only that caller's token cache is changed, so there's a single cache write-back
+            result, _ = self._single_flight.do(flight_key, self._acquire_token_silent_result, scopes, account, token_cache, **kwargs)
+
+        if result is not None and 'error' in result and token_cache is id_data._deserialized_token_cache:
+            id_data.discard_token_cache() # failed: don't commit what msal changed (e.g. removed tokens)
+        self._process_result(result, token_cache)
+        self._index_access_token(scopes, result)
+        return result
+
+    @instrumented('call_downstream_api')
+    @require_context_adapter
+    def call_downstream_api(self, method: str, url: str, scopes: list = None, **request_kwargs) -> 'requests.Response':
+        """call an API (e.g. Graph) with the signed-in user's access token for scopes (default: the configured
+        scopes) as bearer token, over the pooled keep-alive client (see downstream.py). If the API answers 401,
+        the token is refreshed silently and the call is sent once more, so bodies must be re-sendable (json=,
+        data= of bytes or a dict, ...). request_kwargs are requests' (params, json, headers, timeout...)."""
+        scopes = scopes or self.aad_config.scopes
+        downstream_api = self._downstream_api
+        result = self.acquire_token_silently(scopes)
+        response = downstream_api.request(method, url, result['access_token'], **request_kwargs)
+        if response.status_code == 401:
+            # the token was revoked or expired early: retry once with a fresh one
+            response.close()
+            downstream_api.retries += 1
+            result = self.acquire_token_silently(scopes, force_refresh=True)
+            response = downstream_api.request(method, url, result['access_token'], **request_kwargs)
+        return response
+
+    @instrumented('acquire_token_for_app')
+    def acquire_token_for_app(self, scopes: list, tenant: str = None) -> dict:
+        """acquire an app-only (client credentials) access token for background jobs and app-to-app calls,
+        e.g. scopes=['https://graph.microsoft.com/.default']. Needs no request context: the tokens are kept
+        in the process-wide app token cache (see app_tokens.py), not in a user's. tenant: in multi-tenant
+        mode, the tenant to get the token from. Returns the token result."""
+        result = self._app_tokens.acquire(scopes, partial(self._client_factory, tenant=tenant), client_key=tenant)
+        if 'error' in result:
+            raise TokenExchangeError("acquire_token_for_app: app token request resulted in error\n"
+                                     f"{result['error']}: {result.get('error_description', None)}")
+        return result
+
+    def _silent_flight_key(self, scopes: list, account: dict = None, authority: str = None, **kwargs) -> tuple:
+        home_account_id = account.get('home_account_id', None) if account else self.id_data.home_account_id
+        if not home_account_id:
+            return None
+        return (home_account_id, AccessTokenIndex.normalize_scopes(scopes), authority or self.aad_config.authority,
+                self._token_tenant(), tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+
+    def _token_tenant(self) -> str:
+        # multi-tenant mode: the tenant the signed-in user's tokens are acquired from. None: the configured authority
+        if self._tenants is None:
+            return None
+        return self._tenants.resolve(self.id_data._id_token_claims)
+
+    def _acquire_token_silent_result(self, scopes: list, account: dict, token_cache: 'SerializableTokenCache', **kwargs) -> dict:
+        client = self._client_factory(token_cache=token_cache, b2c_policy=self._token_b2c_policy, tenant=self._token_tenant())
+
+        if account is None:
+            # the signed-in user's account only: a cache may also hold accounts that signed in before on this browser
+            home_account_id = self.id_data.home_account_id
+            accounts = [a for a in client.get_accounts() if home_account_id and a.get('home_account_id', None) == home_account_id]
+            if not accounts:
+                return {'error': 'no_account', 'error_description': "the signed-in user's account isn't in the token cache"}
+            account = accounts[0]
 
         silent_opts = dict()
         silent_opts.update(**kwargs)
-        silent_opts['scopes'] = scopes or self.aad_config.auth_request.scopes
-        silent_opts['account'] = account or client.get_accounts()[0]
+        silent_opts['scopes'] = scopes
+        silent_opts['account'] = account
 
-        result = client.acquire_token_silent_with_error(**silent_opts)
+        return client.acquire_token_silent_with_error(**silent_opts)
 
-        self._process_result(result, token_cache)
+    def _index_access_token(self, scopes: list, result: dict) -> None:
+        home_account_id = self.id_data.home_account_id
+        if home_account_id and 'access_token' in result and 'expires_in' in result:
+            tenant = self._token_tenant()
+            self._access_token_index.put(home_account_id, scopes, result['access_token'], result['expires_in'], tenant)
+            self._schedule_refresh(home_account_id, scopes, result['expires_in'], tenant)
+
+    def _schedule_refresh(self, home_account_id: str, scopes: list, expires_in: int, tenant: str = None) -> None:
+        if self._refresh_scheduler is not None:
+            scopes = tuple(scopes)
+            self._refresh_scheduler.schedule((home_account_id, tenant, AccessTokenIndex.normalize_scopes(scopes)),
+                                             time.time() + int(expires_in),
+                                             partial(self._refresh_token_in_background, home_account_id, scopes, tenant))
+
+    def _refresh_token_in_background(self, home_account_id: str, scopes: tuple, tenant: str = None) -> None:
+        # runs on the refresh scheduler's threads, outside of any request
+        if not self._access_token_index.was_read(home_account_id, scopes, tenant):
+            return # idle since the last refresh: the user's next request refreshes on demand
+        result = self._refresh_account_tokens(home_account_id, scopes, tenant)
+        if result is not None:
+            self._schedule_refresh(home_account_id, scopes, result['expires_in'], tenant)
+
+    def _refresh_account_tokens(self, home_account_id: str, scopes: tuple, tenant: str = None) -> dict:
+        """force-refresh the account's tokens for scopes from its cache in the token cache store, outside of
+        any request. tenant: in multi-tenant mode, the tenant to refresh them from (by default the account's).
+        Returns the token result, or None if the store holds no refresh token for the account"""
+        token_cache_store = self.token_cache_store
+        serialized_cache = token_cache_store.load(home_account_id)
+        if not serialized_cache:
+            return None
+        from msal import SerializableTokenCache
+        token_cache = SerializableTokenCache()
+        token_cache.deserialize(serialized_cache)
+        client = self._client_factory(token_cache=token_cache, b2c_policy=self._token_b2c_policy)
+        accounts = [a for a in client.get_accounts() if a.get('home_account_id', None) == home_account_id]
+        if not accounts:
+            return None
+        if self._tenants is not None:
+            if tenant is None:
+                # the account's realm: the tenant whose tokens the user signed in with
+                tenant = self._tenants.resolve({'tid': accounts[0].get('realm', None)})
+            if tenant is not None:
+                client = self._client_factory(token_cache=token_cache, tenant=tenant)
+        result = client.acquire_token_silent_with_error(list(scopes), accounts[0], force_refresh=True)
+        if result is None:
+            return None # no refresh token for these scopes
+        if 'error' in result:
+            raise TokenExchangeError("_refresh_account_tokens: token refresh resulted in error\n"
+                                     f"{result['error']}: {result.get('error_description', None)}")
+        if token_cache.has_state_changed:
+            token_cache_store.save(home_account_id, token_cache.serialize())
+        self._access_token_index.put(home_account_id, scopes, result['access_token'], result['expires_in'], tenant)
+        return result
+
+    # asyncio API: the blocking msal calls run on the bounded executor (see executor.py)
+    # so they don't block the event loop. Configure it with an 'executor' section in the aad config.
+    async def aget_auth_url(self, redirect_uri: str = None, b2c_policy: str = None, **msal_auth_url_kwargs):
+        return await self._executor.run(self.get_auth_url, redirect_uri, b2c_policy, **msal_auth_url_kwargs)
+
+    async def aprocess_auth_redirect(self, redirect_uri: str = None, response_type: str = None, afterwards_go_to_url: str = None) -> Any:
+        return await self._executor.run(self.process_auth_redirect, redirect_uri, response_type, afterwards_go_to_url)
+
+    async def acall_downstream_api(self, method: str, url: str, scopes: list = None, **request_kwargs) -> 'requests.Response':
+        return await self._executor.run(self.call_downstream_api, method, url, scopes, **request_kwargs)
+
+    async def aacquire_token_for_app(self, scopes: list, tenant: str = None) -> dict:
+        return await self._executor.run(self.acquire_token_for_app, scopes, tenant)
+
+    async def aacquire_token_silently(self, scopes=None, account=None, authority=None, token_cache=None, **kwargs) -> dict:
+        scopes = scopes or self.aad_config.scopes
+        flight_key = self._silent_flight_key(scopes, account, authority, **kwargs)
+        run = partial(self._executor.run, self.acquire_token_silently, scopes, account, authority, token_cache, **kwargs)
+        if flight_key is None:
+            return await run()
+        # concurrent asyncio callers wait on the event loop for the first caller's result, instead of
+        # each holding an executor thread; they then take the token into their own identity context
+        result, shared = await self._single_flight.ado(flight_key, run)
+        if shared:
+            self._process_result(result, token_cache or self.id_data.token_cache)
+        return result
 
+    @instrumented('process_result')
     @require_context_adapter
-    def _process_result(self, result: dict, token_cache: SerializableTokenCache) -> None:
+    def _process_result(self, result: dict, token_cache: 'SerializableTokenCache') -> None:
         if "error" not in result:
             self._logger.debug("process result: successful token response result!")
             # now we will place the token(s) and auth status into the context for later use:
@@ -189,23 +574,41 @@ class IdentityWebPython(object):
             id_context = self._adapter.identity_context_data
             id_context.authenticated = True
             if 'id_token_claims' in result:
-                id_context._id_token_claims = result['id_token_claims'] # TODO: if this is to stay in ctxt, use proper getter/setter
-                id_context.username = id_context._id_token_claims.get('name', 'anonymous')
+                id_context.id_token_claims = result['id_token_claims']
+                id_context.username = id_context.id_token_claims.get('name', 'anonymous')
             if 'access_token' in result:
-                id_context._access_token = result['access_token']
-            id_context.has_changed = True                                   #TODO: update id_context to automatically do this when _id_token and accesstoken is assigned!!!!
+                id_context.access_token = result['access_token']
+            home_account_id = self._get_home_account_id(result)
+            if home_account_id and home_account_id != id_context.home_account_id:
+                id_context.home_account_id = home_account_id
             id_context.token_cache = token_cache
         else:
             raise TokenExchangeError("_process_result: auth failed: token request resulted in error\n"
                                         f"{result['error']}: {result.get('error_description', None)}")
 
+    @staticmethod
+    def _get_home_account_id(result: dict) -> str:
+        # msal keys accounts by uid.utid from the client_info in the token response
+        client_info = result.get('client_info', None)
+        if client_info:
+            try:
+                decoded = json.loads(base64.urlsafe_b64decode(client_info + '=' * (-len(client_info) % 4)))
+                return f"{decoded['uid']}.{decoded['utid']}"
+            except (ValueError, KeyError):
+                pass
+        claims = result.get('id_token_claims', None) or {}
+        if 'oid' in claims and 'tid' in claims:
+            return f"{claims['oid']}.{claims['tid']}"
+        return None
+
+    @instrumented('parse_redirect_errors')
     def _parse_redirect_errors(self, req_params: dict) -> None:
         # TODO implement all errors which affect program behaviour
         # https://docs.microsoft.com/en-us/azure/active-directory/develop/v2-oauth2-auth-code-flow
-        if str(AADErrorResponse.ERROR_CODE_PARAM_KEY) in req_params:
+        if _ERROR_CODE_PARAM_KEY in req_params:
             # we have an error. get the error code to interpret it:
-            error_code = req_params.get(str(AADErrorResponse.ERROR_CODE_PARAM_KEY), None)
-            if error_code.startswith(str(AADErrorResponse.B2C_FORGOT_PASSWORD_ERROR_CODE)):
+            error_code = req_params.get(_ERROR_CODE_PARAM_KEY, None)
+            if error_code.startswith(_B2C_FORGOT_PASSWORD_ERROR_CODE):
                 # it's a b2c password reset error
                 raise B2CPasswordError("B2C password reset request")
             else:
@@ -213,27 +616,31 @@ class IdentityWebPython(object):
                 raise OtherAuthError("Unknown error while parsing redirect")
 
     def _extract_auth_response_payload(self, req_params: dict, expected_response_type: str) -> str:
-        if expected_response_type == str(ResponseType.CODE):
+        if expected_response_type == _RESPONSE_TYPE_CODE:
             # if no response type in config, default response type of 'code' will have been assumed.
-            return req_params.get(str(ResponseType.CODE), None)
+            return req_params.get(_RESPONSE_TYPE_CODE, None)
         else:
             raise NotImplementedError("Only 'code' response is currently supported by identity utils")
 
     @require_context_adapter
     def sign_out(self, post_sign_out_url:str = None, username: str = None) -> Any:
-        authority_type = self.aad_config.type.authority_type
-        sign_out_url = self.aad_config.client.authority
-        if authority_type == str(AuthorityType.B2C):
-            sign_out_url = f'{sign_out_url}{self.aad_config.b2c.susi}{SignOut.ENDPOINT.value}'
-        else:
-            sign_out_url = f'{sign_out_url}{SignOut.ENDPOINT.value}'
-
+        # the logout url (of the B2C sign in policy) is precomputed by the compiled config
         if post_sign_out_url:
-            sign_out_url = f'{sign_out_url}?{SignOut.REDIRECT_PARAM_KEY.value}={post_sign_out_url}'
+            sign_out_url = self.aad_config.logout_redirect_url_prefix + post_sign_out_url
+        else:
+            sign_out_url = self.aad_config.logout_url
         return self._adapter.redirect_to_absolute_url(sign_out_url)
     
     @require_context_adapter
     def remove_user(self, username: str = None) -> None: #TODO: complete this so it doesn't just clear the session but removes user
+        token_cache_store = self.token_cache_store
+        home_account_id = self._adapter.identity_context_data.home_account_id
+        if home_account_id:
+            self._forget_accounts({home_account_id})
+        if token_cache_store is not None and home_account_id:
+            token_cache_store.delete(home_account_id)
+        # whatever adapter: the cache this request loaded must not be committed (back) at its end
+        self._adapter.identity_context_data.discard_token_cache()
         self._adapter.clear_session()
         # TODO e.g. if active username in id_context_'s username is not anonymous, remove it
         # remove id token
@@ -241,6 +648,12 @@ class IdentityWebPython(object):
         # remove token_cache
         # TODO: set auth_state_changed flag here
     
+    def _forget_accounts(self, home_account_ids: set) -> None:
+        # drop what this process keeps about the accounts besides their token caches
+        self._access_token_index.invalidate_matching(lambda key: key in home_account_ids)
+        if self._refresh_scheduler is not None:
+            self._refresh_scheduler.cancel_matching(lambda key: key[0] in home_account_ids)
+
     @require_context_adapter
     def _generate_and_append_state_to_context_and_request(self, req_param_dict: dict) -> str:
         state = str(uuid4())
@@ -249,7 +662,36 @@ class IdentityWebPython(object):
         return state
     
     @require_context_adapter
-    def _verify_state(self, req_params: dict) -> None:
+    def _generate_and_append_signed_state_to_request(self, req_param_dict: dict, b2c_policy: str = None,
+                                                     post_sign_in_url: str = None, tenant: str = None) -> str:
+        signed_state, adapter = self._signed_state, self._adapter
+        # the browser's binding cookie: the redirect must come back with it
+        binding = adapter.get_request_cookie(signed_state.binding_cookie)
+        if not binding:
+            binding = uuid4().hex
+            adapter.set_response_cookie(signed_state.binding_cookie, binding, signed_state.max_age)
+        nonce = str(uuid4())
+        claims = {'n': nonce}
+        if b2c_policy:
+            claims['p'] = b2c_policy
+        if tenant:
+            claims['m'] = tenant
+        post_sign_in_url = post_sign_in_url or adapter.identity_context_data.post_sign_in_url
+        if post_sign_in_url:
+            claims['r'] = post_sign_in_url
+        state = signed_state.issue(claims, binding, adapter._secret_key)
+        req_param_dict[RequestParameter.STATE.value] = state
+        req_param_dict[RequestParameter.NONCE.value] = nonce
+        return state
+
+    @instrumented('verify_state')
+    @require_context_adapter
+    def _verify_state(self, req_params: dict) -> dict:
+        if self._signed_state is not None:
+            adapter = self._adapter
+            return self._signed_state.verify(req_params.get('state', None),
+                                             adapter.get_request_cookie(self._signed_state.binding_cookie),
+                                             adapter._secret_key)
         state = req_params.get('state', None)
         session_state = self._adapter.identity_context_data.state
         # don't allow re-use of state
@@ -257,6 +699,7 @@ class IdentityWebPython(object):
         # reject states that don't match
         if state is None or session_state != state:
             raise AuthSecurityError("Failed to match request state with session state")
+        return None
     
     @require_context_adapter
     def _generate_and_append_nonce_to_context_and_request(self, req_param_dict: dict) -> str:
@@ -275,19 +718,75 @@ class IdentityWebPython(object):
         if nonce is None or session_nonce != nonce:
             raise AuthSecurityError("Failed to match ID token nonce with session nonce")
 
-    # TODO: enforce ID token expiry.
+    # clock skew tolerated when checking ID token exp/nbf claims, in seconds
+    ID_TOKEN_LEEWAY = 60
+
+    @classmethod
+    def _id_token_is_current(cls, id_token_claims: dict) -> bool:
+        # local check of the claims only: the token's signature was validated when it was redeemed
+        now = time.time()
+        exp = id_token_claims.get('exp', None)
+        nbf = id_token_claims.get('nbf', None)
+        if exp is not None and now > exp + cls.ID_TOKEN_LEEWAY:
+            return False
+        if nbf is not None and now < nbf - cls.ID_TOKEN_LEEWAY:
+            return False
+        return True
+
+    def _refresh_id_token_silently(self) -> bool:
+        """redeem the refresh token in the user's token cache for a new ID token. no interaction"""
+        try:
+            self.acquire_token_silently(force_refresh=True)
+        except Exception as ex:
+            self._logger.info(f"_refresh_id_token_silently: silent refresh failed, user must sign in again\n{ex}")
+            return False
+        return self._id_token_is_current(self.id_data.id_token_claims)
+
     # @decorator to ensure the user is authenticated
     # wrap this around your route    
     def login_required(self,f):
         @wraps(f)
         def assert_login(*args, **kwargs):
-            if not self._adapter.identity_context_data.authenticated:
+            id_data = self._adapter.identity_context_data
+            if not id_data.authenticated:
+                from .errors import NotAuthenticatedError
                 raise NotAuthenticatedError
-            # TODO: check if ID token is expired
-            # if it is, take user to get re-authenticated.
-            # TODO: upon returning from re-auth, user should get back to
-            # where they were trying to go.
+            if not self._id_token_is_current(id_data.id_token_claims) and not self._refresh_id_token_silently():
+                # ID token expired and couldn't be refreshed: re-authenticate, then come back here
+                try:
+                    requested_url = self._adapter.get_request_url()
+                    sign_in_url = self._adapter.get_sign_in_url()
+                except NotImplementedError:
+                    from .errors import NotAuthenticatedError
+                    raise NotAuthenticatedError
+                self._logger.info(f"login_required: ID token expired, redirecting to sign in. will return to {requested_url}")
+                id_data.post_sign_in_url = requested_url
+                return self._adapter.redirect_to_absolute_url(sign_in_url)
             return f(*args, **kwargs)
         return assert_login
 
+    # @decorators to ensure the user is authenticated and has (any of, or all of with require_all=True)
+    # the app roles or security groups in their ID token. the policy is compiled here, once per route:
+    # requests only do a set operation on the user's claim index (see authorization.py)
+    # wrap these around your route, e.g. @ms_identity_web.roles_required('Admin')
+    def roles_required(self, *roles: str, require_all: bool = False):
+        return self._authorization_required(ClaimPolicy('roles', roles, require_all))
+
+    def groups_required(self, *group_ids: str, require_all: bool = False):
+        return self._authorization_required(ClaimPolicy('groups', group_ids, require_all))
 
+    def _authorization_required(self, policy: ClaimPolicy):
+        def decorator(f):
+            @wraps(f)
+            def assert_authorized(*args, **kwargs):
+                id_token_claims = self._adapter.identity_context_data.id_token_claims
+                if not policy.allows(self._claim_index.get(id_token_claims)):
+                    if policy.claim == 'groups' and 'groups' in id_token_claims.get('_claim_names', {}):
+                        # group overage: too many groups to fit in the ID token, which then has none
+                        self._logger.warning(f"{f.__name__}: the ID token has no groups claim (group overage)")
+                    self._logger.info(f"{f.__name__}: user lacks {policy}, access denied")
+                    from .errors import NotAuthorizedError
+                    raise NotAuthorizedError
+                return f(*args, **kwargs)
+            return self.login_required(assert_authorized)
+        return decorator
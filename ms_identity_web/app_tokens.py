@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable
+import os
+
+from .single_flight import SingleFlight
+from .token_cache_stores import TokenCacheStore, SQLiteTokenCacheStore, FileSystemTokenCacheStore
+from .token_index import AccessTokenIndex
+
+try:
+    import fcntl
+except ImportError: # e.g. windows: workers still share the store, but may each fetch a token
+    fcntl = None
+
+class AppTokenCache(object):
+    """Process-wide cache of the app-only (client credentials) tokens of acquire_token_for_app:
+    - one msal token cache per process, shared by every request, thread and background job
+    - tokens are answered from an AccessTokenIndex while they are valid for more than `refresh_margin`
+      seconds; concurrent misses for the same scopes share one acquisition
+    - with a `store` (SQLite or file system), the msal cache is shared by all worker processes: a miss
+      takes an exclusive file lock (`lock_path`), reloads the store and only then lets msal ask the token
+      endpoint, so N prefork workers fetch each app token once rather than N times."""
+    STORE_KEY = 'ms_identity_web.app_tokens'
+
+    def __init__(self, store: TokenCacheStore = None, lock_path: str = None,
+                 refresh_margin: float = AccessTokenIndex.DEFAULT_REFRESH_MARGIN) -> None:
+        self.store = store
+        self.lock_path = lock_path or self.default_lock_path(store)
+        self._index = AccessTokenIndex(refresh_margin=refresh_margin)
+        self._single_flight = SingleFlight()
+        self._lock = Lock()
+        self._token_cache = None
+        self.token_requests = 0 # acquisitions msal answered from the token endpoint
+
+    @staticmethod
+    def from_config(app_tokens_config) -> 'AppTokenCache':
+        """build a cache from the optional 'app_tokens' section of the aad config file"""
+        if not app_tokens_config:
+            return AppTokenCache()
+        store_config = getattr(app_tokens_config, 'store', None)
+        return AppTokenCache(TokenCacheStore.from_config(store_config) if store_config else None,
+                             getattr(app_tokens_config, 'lock_path', None),
+                             getattr(app_tokens_config, 'refresh_margin', None) or AccessTokenIndex.DEFAULT_REFRESH_MARGIN)
+
+    @staticmethod
+    def default_lock_path(store: TokenCacheStore) -> str:
+        if isinstance(store, SQLiteTokenCacheStore):
+            return f'{store.path}.lock'
+        if isinstance(store, FileSystemTokenCacheStore):
+            return os.path.join(store.directory, 'app_tokens.lock')
+        return None
+
+    @property
+    def token_cache(self) -> 'SerializableTokenCache':
+        if self._token_cache is None:
+            from msal import SerializableTokenCache
+            with self._lock:
+                if self._token_cache is None:
+                    self._token_cache = SerializableTokenCache()
+        return self._token_cache
+
+    @property
+    def hits(self) -> int:
+        return self._index.hits
+
+    @property
+    def misses(self) -> int:
+        return self._index.misses
+
+    def acquire(self, scopes: list, client_factory: Callable[['SerializableTokenCache'], 'ConfidentialClientApplication'],
+                client_key: str = None) -> dict:
+        """client_factory(token_cache).acquire_token_for_client(scopes), from this cache when possible.
+        client_key: which client that is (e.g. the tenant: None for the configured authority)"""
+        access_token = self._index.get(('app', client_key), scopes)
+        if access_token is not None:
+            return {'access_token': access_token, 'token_type': 'Bearer', 'token_source': 'index'}
+        result, _ = self._single_flight.do((client_key, AccessTokenIndex.normalize_scopes(scopes)),
+                                           self._acquire, list(scopes), client_factory, client_key)
+        return result
+
+    def _acquire(self, scopes: list, client_factory: Callable, client_key: str) -> dict:
+        token_cache = self.token_cache
+        client = client_factory(token_cache)
+        if self.store is None:
+            result = client.acquire_token_for_client(scopes) # msal looks in the shared cache first
+        else:
+            with self._store_lock():
+                # another worker may have fetched the token meanwhile: start from the store's cache
+                serialized_cache = self.store.load(self.STORE_KEY)
+                if serialized_cache:
+                    token_cache.deserialize(serialized_cache)
+                result = client.acquire_token_for_client(scopes)
+                if token_cache.has_state_changed:
+                    self.store.save(self.STORE_KEY, token_cache.serialize())
+        if result.get('token_source', None) == 'identity_provider':
+            self.token_requests += 1
+        if 'access_token' in result and 'expires_in' in result:
+            self._index.put(('app', client_key), scopes, result['access_token'], result['expires_in'])
+        return result
+
+    @contextmanager
+    def _store_lock(self):
+        if fcntl is None or not self.lock_path:
+            with self._lock:
+                yield
+            return
+        # flock: held by one process (and one thread: each call opens the file anew) at a time
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
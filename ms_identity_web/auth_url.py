@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from threading import RLock
+from typing import Callable
+from urllib.parse import quote_plus
+from uuid import uuid4
+
+class AuthUrlTemplate(object):
+    """An authorization request url as msal builds it, with the per-request parameters (state, nonce,
+    login_hint) left as slots. Compiled from msal's own output for marker values, so the parameter
+    order, the scope decoration and the encoding of everything else are msal's; rendering only
+    url-encodes the slot values (as urlencode does) and joins the pieces."""
+    __slots__ = ('_pieces', '_tail')
+    SLOTS = ('state', 'nonce', 'login_hint')
+
+    def __init__(self, pieces: tuple, tail: str) -> None:
+        self._pieces = pieces # (text before the value, slot name, that text without '&name=')
+        self._tail = tail
+
+    @classmethod
+    def compile(cls, client: 'ConfidentialClientApplication', auth_req_options: dict) -> 'AuthUrlTemplate':
+        """the template of client.get_authorization_request_url(**auth_req_options), or None if msal's
+        output can't be reproduced from one (it is checked against msal before it is returned)"""
+        markers = {name: f'{name}{uuid4().hex}' for name in cls.SLOTS} # url-safe: encoded as they are
+        url = client.get_authorization_request_url(**auth_req_options, **markers)
+        if any(url.count(marker) != 1 for marker in markers.values()):
+            return None
+        pieces, position = [], 0
+        for index, name, marker in sorted((url.index(marker), name, marker) for name, marker in markers.items()):
+            before, param = url[position:index], f'&{name}='
+            if not before.endswith(param):
+                return None
+            pieces.append((before, name, before[:-len(param)]))
+            position = index + len(marker)
+        template = cls(tuple(pieces), url[position:])
+
+        # msal leaves out the parameters that are None: check that, and the encoding of awkward values
+        samples = ({'state': str(uuid4()), 'nonce': 'n&=+/ %é', 'login_hint': 'first.last+tag@contoso.com'},
+                   {'state': 'state?#&', 'nonce': None, 'login_hint': None})
+        for sample in samples:
+            expected = client.get_authorization_request_url(
+                **auth_req_options, **{name: value for name, value in sample.items() if value is not None})
+            if template.render(sample) != expected:
+                return None
+        return template
+
+    def render(self, values: dict) -> str:
+        parts = []
+        for before, name, before_without_param in self._pieces:
+            value = values.get(name, None)
+            if value is None:
+                parts.append(before_without_param)
+            else:
+                parts.append(before)
+                parts.append(quote_plus(value if isinstance(value, (str, bytes)) else str(value)))
+        parts.append(self._tail)
+        return ''.join(parts)
+
+class AuthUrlTemplateCache(object):
+    """Size-bounded LRU of AuthUrlTemplates per (client: b2c policy or tenant, auth request options other than
+    the slots), e.g. per policy, redirect_uri and scopes. get_auth_url renders the url from here, so after the first
+    sign in for a policy/redirect_uri no msal client is involved. Options that msal's output couldn't be
+    reproduced for are remembered too, and always go to msal."""
+    DEFAULT_MAX_SIZE = 64 # redirect_uris are built from the request's host: don't keep unbounded numbers
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self._lock = RLock()
+        self._templates = OrderedDict() # key -> AuthUrlTemplate, or None: use msal
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def from_config(templates_config) -> 'AuthUrlTemplateCache':
+        """build a cache from the optional 'auth_url_templates' section of the aad config file"""
+        if not templates_config:
+            return AuthUrlTemplateCache()
+        return AuthUrlTemplateCache(getattr(templates_config, 'max_size', None) or AuthUrlTemplateCache.DEFAULT_MAX_SIZE)
+
+    @staticmethod
+    def make_key(client_key: str, auth_req_options: dict) -> tuple:
+        return (client_key, tuple(sorted((k, repr(v)) for k, v in auth_req_options.items())))
+
+    def get_url(self, client_key: str, auth_req_options: dict,
+                client_factory: Callable[[], 'ConfidentialClientApplication']) -> str:
+        """what client_factory().get_authorization_request_url(**auth_req_options) returns.
+        client_key: which client that is, i.e. the b2c policy or the tenant (None: the configured authority)"""
+        options = dict(auth_req_options)
+        values = {name: options.pop(name, None) for name in AuthUrlTemplate.SLOTS}
+        key = self.make_key(client_key, options)
+        with self._lock:
+            compiled = key in self._templates
+            template = self._templates.get(key, None)
+            if compiled:
+                self._templates.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not compiled:
+            template = AuthUrlTemplate.compile(client_factory(), options)
+            with self._lock:
+                self._templates[key] = template
+                self._templates.move_to_end(key)
+                while len(self._templates) > self.max_size:
+                    self._templates.popitem(last=False)
+
+        if template is not None:
+            return template.render(values)
+        return client_factory().get_authorization_request_url(**auth_req_options)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+    def __len__(self) -> int:
+        return len(self._templates)
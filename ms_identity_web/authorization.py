@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from threading import RLock
+
+class ClaimIndex(object):
+    """LRU cache of the frozenset of (claim, value) pairs of the `roles` and `groups` claims of ID tokens,
+    which roles_required and groups_required check their policies against with set operations instead of
+    scanning the claim lists on every request. An index is built once per ID token (a new sign in or
+    refresh changes the token's `iat`) and shared by every request of that session in the process.
+    Holds at most `max_size` entries."""
+    DEFAULT_MAX_SIZE = 4096
+    CLAIMS = ('roles', 'groups')
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self._lock = RLock()
+        self._entries = OrderedDict() # ID token key -> frozenset of (claim, value)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def from_config(claim_index_config) -> 'ClaimIndex':
+        """build an index from the optional 'claim_index' section of the aad config file"""
+        if not claim_index_config:
+            return ClaimIndex()
+        return ClaimIndex(getattr(claim_index_config, 'max_size', None) or ClaimIndex.DEFAULT_MAX_SIZE)
+
+    @staticmethod
+    def token_key(id_token_claims: dict) -> tuple:
+        # the ID token the claims come from: who, from which tenant, issued when
+        iat = id_token_claims.get('iat', None)
+        if iat is None:
+            return None
+        return (id_token_claims.get('tid', None), id_token_claims.get('oid', None) or id_token_claims.get('sub', None),
+                iat, id_token_claims.get('uti', None))
+
+    @classmethod
+    def build(cls, id_token_claims: dict) -> frozenset:
+        return frozenset((claim, value) for claim in cls.CLAIMS for value in id_token_claims.get(claim, None) or ())
+
+    def get(self, id_token_claims: dict) -> frozenset:
+        """the (claim, value) pairs of the roles and groups in id_token_claims"""
+        if not id_token_claims:
+            return frozenset()
+        key = self.token_key(id_token_claims)
+        if key is None:
+            return self.build(id_token_claims)
+        with self._lock:
+            index = self._entries.get(key, None)
+            if index is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return index
+            self.misses += 1
+        index = self.build(id_token_claims)
+        with self._lock:
+            self._entries[key] = index
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class ClaimPolicy(object):
+    """A route's authorization policy, compiled when its decorator is applied: the required values of
+    one claim (`roles` or `groups`), any (the default) or all of which the user must have."""
+    __slots__ = ('claim', 'values', 'required', 'require_all')
+
+    def __init__(self, claim: str, values: tuple, require_all: bool = False) -> None:
+        if claim not in ClaimIndex.CLAIMS:
+            raise ValueError(f"ClaimPolicy: claim must be one of {ClaimIndex.CLAIMS}, not {claim!r}")
+        if not values:
+            raise ValueError(f"ClaimPolicy: at least one of the {claim} is required")
+        self.claim = claim
+        self.values = tuple(values)
+        self.required = frozenset((claim, value) for value in values)
+        self.require_all = require_all
+
+    def allows(self, claim_index: frozenset) -> bool:
+        if self.require_all:
+            return self.required <= claim_index
+        return not self.required.isdisjoint(claim_index)
+
+    def __repr__(self) -> str:
+        return f"{self.claim} {'all' if self.require_all else 'any'} of {self.values}"
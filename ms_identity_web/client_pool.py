@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+from threading import RLock
+import json
+import os
+
+# the token cache that pooled clients read from / write to in the current request (or thread/task)
+_bound_token_cache = ContextVar('ms_identity_web_bound_token_cache', default=None)
+
+class RequestBoundTokenCache(object):
+    """Stand-in token cache that pooled clients are built with. Every call is forwarded to
+    the cache bound to the current context, so one ConfidentialClientApplication can be
+    shared by all requests while each request keeps using its own token cache."""
+
+    @staticmethod
+    def bind(token_cache: 'SerializableTokenCache') -> None:
+        _bound_token_cache.set(token_cache)
+
+    @property
+    def target(self) -> 'SerializableTokenCache':
+        token_cache = _bound_token_cache.get()
+        if token_cache is None:
+            from msal import SerializableTokenCache
+            token_cache = SerializableTokenCache()
+            _bound_token_cache.set(token_cache)
+        return token_cache
+
+    # msal grabs these bound methods once when the client is built,
+    # so they must look up the current target on every call
+    def add(self, event, *args, **kwargs):
+        return self.target.add(event, *args, **kwargs)
+
+    def remove_rt(self, rt_item):
+        return self.target.remove_rt(rt_item)
+
+    def update_rt(self, rt_item, new_rt):
+        return self.target.update_rt(rt_item, new_rt)
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+class ConfidentialClientPool(object):
+    """Process-wide, size-bounded LRU pool of ConfidentialClientApplication instances keyed by
+    (client_id, authority, b2c policy, credential) and the http_client they're built with: each
+    IdentityWebPython gets clients using its own transport and metadata cache, even with the same
+    config. Reusing a client skips authority discovery on every request. The pool empties itself in forked children (e.g. gunicorn prefork workers)
+    so that no client or http connection is shared across processes."""
+    DEFAULT_MAX_SIZE = 16
+    _process_pool = None
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    @classmethod
+    def process_pool(cls) -> 'ConfidentialClientPool':
+        if cls._process_pool is None:
+            cls._process_pool = cls()
+        return cls._process_pool
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = RLock()
+        self._clients = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_pid(self) -> None:
+        # fallback for platforms without os.register_at_fork
+        if self._pid != os.getpid():
+            self._reset()
+
+    @staticmethod
+    def make_key(client_config: dict, b2c_policy: str = None) -> tuple:
+        credential = client_config.get('client_credential', None)
+        if not isinstance(credential, str):
+            credential = json.dumps(credential, sort_keys=True, default=str)
+        return (client_config.get('client_id'), client_config.get('authority'), b2c_policy or '', credential)
+
+    def resize(self, max_size: int) -> None:
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._clients) > self.max_size:
+            self._clients.popitem(last=False)
+
+    def get(self, client_config: dict, b2c_policy: str = None, key: tuple = None, http_client=None) -> 'ConfidentialClientApplication':
+        """get the pooled client for this config, building (outside the lock) one if necessary.
+        client_config holds the ConfidentialClientApplication kwargs with the final authority;
+        key is its make_key(), if precomputed (see CompiledAADConfig.client_config)."""
+        self._check_pid()
+        if key is None:
+            key = self.make_key(client_config, b2c_policy)
+        if http_client is not None:
+            # pooled clients hold on to their http_client, so its id isn't reused while they're in the pool
+            key = key + (id(http_client),)
+        with self._lock:
+            client = self._clients.get(key, None)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return client
+            self.misses += 1
+
+        from msal import ConfidentialClientApplication
+        if http_client is not None:
+            client_config = dict(client_config, http_client=http_client)
+        client = ConfidentialClientApplication(token_cache=RequestBoundTokenCache(), **client_config)
+
+        with self._lock:
+            # another thread may have built the same client in the meantime: keep the first one
+            client = self._clients.setdefault(key, client)
+            self._clients.move_to_end(key)
+            self._evict()
+        return client
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self) -> int:
+        return len(self._clients)
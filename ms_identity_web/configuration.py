@@ -1,7 +1,8 @@
 from configparser import ConfigParser
 import os
-from .constants import AuthorityType, ClientType
-from types import SimpleNamespace
+from .constants import AuthorityType, ClientType, TokenCacheStoreType, MetricsExporter, SignOut
+from .client_pool import ConfidentialClientPool
+from types import SimpleNamespace, MappingProxyType
 
 class AADConfig(SimpleNamespace): # faster access to attributes with slots.
     @staticmethod
@@ -13,6 +14,13 @@ class AADConfig(SimpleNamespace): # faster access to attributes with slots.
         AADConfig.sanity_check_configs(parsed_config)
         return parsed_config
 
+    @staticmethod
+    def compile(parsed_config) -> 'CompiledAADConfig':
+        """freeze a parsed (and sanity checked) config, precomputing what requests derive from it"""
+        if isinstance(parsed_config, CompiledAADConfig):
+            return parsed_config
+        return CompiledAADConfig(parsed_config)
+
     @staticmethod
     def parse_yml(file_path: str):
         raise NotImplementedError
@@ -56,6 +64,41 @@ class AADConfig(SimpleNamespace): # faster access to attributes with slots.
         else:
             setattr(parsed_config, 'b2c', None)
 
+        # optional sections:
+        if getattr(parsed_config, 'token_cache_store', None):
+            store_config = parsed_config.token_cache_store
+            assert TokenCacheStoreType.has_key(getattr(store_config, 'type', None)), (
+                "'token_cache_store.type' must be one of MEMORY, SQLITE, FILE_SYSTEM")
+            if TokenCacheStoreType(store_config.type) is not TokenCacheStoreType.MEMORY:
+                assert getattr(store_config, 'path', None), (
+                    "'token_cache_store.path' must be non-empty string for SQLITE and FILE_SYSTEM stores")
+        else:
+            setattr(parsed_config, 'token_cache_store', None)
+
+        if getattr(parsed_config, 'app_tokens', None) and getattr(parsed_config.app_tokens, 'store', None):
+            store_config = parsed_config.app_tokens.store
+            assert TokenCacheStoreType.has_key(getattr(store_config, 'type', None)), (
+                "'app_tokens.store.type' must be one of MEMORY, SQLITE, FILE_SYSTEM")
+            if TokenCacheStoreType(store_config.type) is not TokenCacheStoreType.MEMORY:
+                assert getattr(store_config, 'path', None), (
+                    "'app_tokens.store.path' must be non-empty string for SQLITE and FILE_SYSTEM stores")
+
+        if getattr(parsed_config, 'multi_tenant', None):
+            assert AuthorityType(parsed_config.type.authority_type) is AuthorityType.MULTI_TENANT, (
+                "'multi_tenant' section requires 'authority_type' MULTI_TENANT")
+            allowed_tenants = getattr(parsed_config.multi_tenant, 'allowed_tenants', None)
+            assert allowed_tenants is None or isinstance(allowed_tenants, list), (
+                "'multi_tenant.allowed_tenants' must be a list of tenant ids")
+        else:
+            setattr(parsed_config, 'multi_tenant', None)
+
+        if getattr(parsed_config, 'instrumentation', None):
+            exporter = getattr(parsed_config.instrumentation, 'exporter', None)
+            assert exporter is None or MetricsExporter.has_key(exporter), (
+                "'instrumentation.exporter' must be one of PROMETHEUS, OPENTELEMETRY")
+        else:
+            setattr(parsed_config, 'instrumentation', None)
+
         if parsed_config.type.framework == 'FLASK':
             assert parsed_config.flask.id_web_configs
             required_keys = ['prefix', 'sign_in', 'edit_profile', 'redirect', 'sign_out', 'post_sign_out']
@@ -69,3 +112,93 @@ class AADConfig(SimpleNamespace): # faster access to attributes with slots.
             for key in required_keys:
                 assert getattr(parsed_config.django.auth_endpoints, key), (f"The `{key}` value under 'django.auth_endpoints'"
                 "must be non-empty string if 'framework' is DJANGO")
+
+class FrozenNamespace(SimpleNamespace):
+    """read-only SimpleNamespace: the sections of a compiled config"""
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError(f"compiled aad config is read-only: can't set '{name}'")
+
+    def __delattr__(self, name) -> None:
+        raise AttributeError(f"compiled aad config is read-only: can't delete '{name}'")
+
+    @classmethod
+    def freeze(cls, value):
+        # lists (e.g. scopes) are left as they are: msal asserts it is given lists
+        if isinstance(value, SimpleNamespace):
+            return cls(**{k: cls.freeze(v) for k, v in value.__dict__.items()})
+        return value
+
+class CompiledAADConfig(object):
+    """Immutable, slotted form of a parsed aad config, built once by AADConfig.compile when
+    IdentityWebPython is instantiated. The sections (client, auth_request, b2c, flask, ...) read
+    as before, frozen; the values that requests derive from them (per-policy authorities and
+    msal client kwargs, logout urls, endpoint paths, enum members) are computed here instead
+    of on every request. Optional sections that have no slot are looked up in `sections`."""
+    __slots__ = ('sections', 'type', 'client', 'auth_request', 'b2c', 'flask', 'django',
+                 'authority_type', 'is_b2c', 'is_multi_tenant', 'authority', 'b2c_policies', 'authorities',
+                 'scopes', 'redirect_uri', 'response_type', 'auth_request_options',
+                 'logout_url', 'logout_redirect_url_prefix', 'endpoints', 'endpoint_paths',
+                 '_client_configs')
+
+    def __init__(self, parsed_config) -> None:
+        sections = FrozenNamespace.freeze(parsed_config)
+        _set = lambda name, value: object.__setattr__(self, name, value)
+        _set('sections', sections)
+        for name in ('type', 'client', 'auth_request', 'b2c', 'flask', 'django'):
+            _set(name, getattr(sections, name, None))
+
+        authority_type = AuthorityType(sections.type.authority_type)
+        is_b2c = authority_type is AuthorityType.B2C
+        _set('authority_type', authority_type)
+        _set('is_b2c', is_b2c)
+        _set('is_multi_tenant', authority_type is AuthorityType.MULTI_TENANT)
+        _set('authority', sections.client.authority)
+        # None: the plain authority (all non-B2C requests)
+        b2c_policies = (sections.b2c.susi, sections.b2c.password, sections.b2c.profile) if is_b2c else ()
+        _set('b2c_policies', b2c_policies)
+        _set('_client_configs', MappingProxyType({policy: self._compile_client_config(policy)
+                                                  for policy in (None,) + b2c_policies}))
+        _set('authorities', MappingProxyType({policy: client_config['authority']
+                                              for policy, (client_config, _) in self._client_configs.items()}))
+
+        auth_request = sections.auth_request
+        _set('scopes', auth_request.scopes)
+        _set('redirect_uri', auth_request.redirect_uri)
+        _set('response_type', auth_request.response_type)
+        _set('auth_request_options', MappingProxyType(dict(auth_request.__dict__)))
+
+        logout_authority = self.authorities[sections.b2c.susi] if is_b2c else self.authority
+        _set('logout_url', f'{logout_authority}{SignOut.ENDPOINT.value}')
+        _set('logout_redirect_url_prefix', f'{self.logout_url}?{SignOut.REDIRECT_PARAM_KEY.value}=')
+
+        framework = sections.flask if sections.type.framework == 'FLASK' else sections.django
+        endpoints = framework.auth_endpoints
+        _set('endpoints', endpoints)
+        # full paths of the auth endpoints, e.g. '/auth/sign_in' (flask) or 'auth/sign_in' (django)
+        separator = '' if sections.type.framework == 'FLASK' else '/'
+        _set('endpoint_paths', FrozenNamespace(**{name: f'{endpoints.prefix}{separator}{value}'
+                                                  for name, value in endpoints.__dict__.items() if name != 'prefix'}))
+
+    def _compile_client_config(self, b2c_policy: str = None) -> tuple:
+        client_config = dict(self.client.__dict__)
+        client_config['authority'] = f'{self.client.authority}{b2c_policy or ""}'
+        return MappingProxyType(client_config), ConfidentialClientPool.make_key(client_config, b2c_policy)
+
+    def client_config(self, b2c_policy: str = None) -> tuple:
+        """(ConfidentialClientApplication kwargs, client pool key) for b2c_policy"""
+        compiled = self._client_configs.get(b2c_policy, None)
+        if compiled is None: # a policy that isn't in the config file
+            compiled = self._compile_client_config(b2c_policy)
+        return compiled
+
+    def __getattr__(self, name: str):
+        # only called for names without a slot: the optional sections (executor, metadata_cache, ...)
+        if name == 'sections':
+            raise AttributeError(name)
+        return getattr(self.sections, name)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError(f"compiled aad config is read-only: can't set '{name}'")
+
+    def __delattr__(self, name) -> None:
+        raise AttributeError(f"compiled aad config is read-only: can't delete '{name}'")
@@ -78,6 +78,28 @@ class AuthorityType(Enum):
     B2C = 'B2C'
     
 
+### Server-side Token Cache Store Type ###
+class TokenCacheStoreType(Enum):
+    def __str__(self):
+        return str(self.value)
+    @classmethod
+    def has_key(cls, name):
+        return name in cls.__members__
+    MEMORY = 'MEMORY'
+    SQLITE = 'SQLITE'
+    FILE_SYSTEM = 'FILE_SYSTEM'
+
+### Instrumentation Exporter ###
+class MetricsExporter(Enum):
+    def __str__(self):
+        return str(self.value)
+    @classmethod
+    def has_key(cls, name):
+        return name in cls.__members__
+    PROMETHEUS = 'PROMETHEUS'
+    OPENTELEMETRY = 'OPENTELEMETRY'
+
+
 ### AZURE ACTIVE DIRECTORY ERROR HANDLING CONSTANTS ###
 class AADErrorResponse(Enum):
     def __str__(self):
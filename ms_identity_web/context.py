@@ -1,35 +1,104 @@
-from msal import SerializableTokenCache
-import json
-
-# TODO: make this a @dataclass ?
+from typing import Any
 
 class IdentityContextData(object):
     SESSION_KEY='identity_context_data' #TODO: make configurable
-
-    def __init__(self) -> None:
+    # the token cache is deserialized at most once per request; these count how often that saved a parse
+    token_cache_parses = 0
+    token_cache_parses_avoided = 0
+
+    # session encoding: bump ENCODING_VERSION whenever FIELDS change incompatibly.
+    # attribute name -> (short session key, default value). Fields at their default aren't written.
+    ENCODING_VERSION = 1
+    VERSION_KEY = 'v'
+    FIELDS = {
+        '_authenticated': ('a', False),
+        '_username': ('u', 'anonymous'),
+        '_token_cache': ('c', None),
+        '_home_account_id': ('h', None),
+        '_nonce': ('n', None),
+        '_state': ('s', None),
+        '_id_token_claims': ('i', {}), # does this belong here? yes, Token/claims customization. ID tokens aren't cached so store this here?
+        '_access_token': ('t', None),
+        '_last_used_b2c_policy': ('p', []),
+        '_post_sign_in_url': ('r', None),
+        '_last_used_tenant': ('m', None),
+    }
+    # token_cache_store: when set (by the adapter, from its IdentityWebPython), token caches live server-side
+    # in this TokenCacheStore and the session only keeps the home_account_id they are keyed by
+    __slots__ = tuple(FIELDS) + ('_deserialized_token_cache', '_dirty', 'token_cache_store')
+
+    def __init__(self, token_cache_store: 'TokenCacheStore' = None) -> None:
+        self.token_cache_store = token_cache_store
+        self._dirty = set()
         self.clear()
         self.has_changed = False
 
     def clear(self) -> None:
-        self._authenticated = False
-        self._username = "anonymous"
-        self._token_cache = None
-        self._nonce = None
-        self._state = None
-        self._id_token_claims = {} # does this belong here? yes, Token/claims customization. TODO: if it does, add getter/setter, # ID tokens aren't cached so store this here? 
-        self._access_token = None
-        self._last_used_b2c_policy = []
-        self._post_sign_in_url = None
+        for attr, (_, default) in self.FIELDS.items():
+            # copy mutable defaults so instances never share them
+            setattr(self, attr, default.copy() if isinstance(default, (dict, list)) else default)
+        self.discard_token_cache()
         self.has_changed = True
 
+    @property
+    def has_changed(self) -> bool:
+        return bool(self._dirty)
+
+    @has_changed.setter
+    def has_changed(self, value: bool) -> None:
+        # setting this by hand marks every field as changed
+        if value:
+            self._dirty.update(self.FIELDS)
+        else:
+            self._dirty.clear()
+
+    def _set(self, attr: str, value: Any) -> None:
+        setattr(self, attr, value)
+        self._dirty.add(attr)
+
+    def encode(self, previous: dict = None) -> dict:
+        """compact session encoding. If `previous` is this context's current encoding (as found in the session),
+        only the changed fields are written into it. Resets the change tracking."""
+        if previous is None or previous.get(self.VERSION_KEY, None) != self.ENCODING_VERSION:
+            previous = {self.VERSION_KEY: self.ENCODING_VERSION}
+            attrs = self.FIELDS
+        else:
+            attrs = self._dirty
+        for attr in attrs:
+            key, default = self.FIELDS[attr]
+            value = getattr(self, attr)
+            if value == default:
+                previous.pop(key, None)
+            else:
+                previous[key] = value
+        self._dirty.clear()
+        return previous
+
+    @classmethod
+    def decode(cls, encoded: dict) -> 'IdentityContextData':
+        """build a context from its session encoding. Also reads sessions written by
+        older versions, which stored the instance __dict__"""
+        id_context_data = cls()
+        if not encoded:
+            return id_context_data
+        if encoded.get(cls.VERSION_KEY, None) == cls.ENCODING_VERSION:
+            for attr, (key, _) in cls.FIELDS.items():
+                if key in encoded:
+                    setattr(id_context_data, attr, encoded[key])
+        elif cls.VERSION_KEY not in encoded:
+            for attr in cls.FIELDS:
+                if attr in encoded:
+                    setattr(id_context_data, attr, encoded[attr])
+            id_context_data.has_changed = True # re-write it in the current encoding
+        return id_context_data
+
     @property
     def authenticated(self) -> bool:
         return self._authenticated
 
     @authenticated.setter
     def authenticated(self, value: bool) -> None:
-        self._authenticated = value
-        self.has_changed = True
+        self._set('_authenticated', value)
 
     @property
     def username(self) -> str:
@@ -37,21 +106,69 @@ class IdentityContextData(object):
 
     @username.setter
     def username(self, value: str) -> None:
-        self._username = value
-        self.has_changed = True
+        self._set('_username', value)
 
     @property
-    def token_cache(self) -> str:
+    def home_account_id(self) -> str:
+        return self._home_account_id
+
+    @home_account_id.setter
+    def home_account_id(self, value: str) -> None:
+        self._set('_home_account_id', value)
+
+    @property
+    def token_cache(self) -> 'SerializableTokenCache':
+        if self._deserialized_token_cache is not None:
+            IdentityContextData.token_cache_parses_avoided += 1
+            return self._deserialized_token_cache
+        from msal import SerializableTokenCache
         cache = SerializableTokenCache()
-        if self._token_cache:
-            cache.deserialize(self._token_cache)
+        if self.token_cache_store is not None:
+            serialized_cache = self.token_cache_store.load(self._home_account_id) if self._home_account_id else None
+        else:
+            serialized_cache = self._token_cache
+        if serialized_cache:
+            cache.deserialize(serialized_cache)
+            IdentityContextData.token_cache_parses += 1
+        self._deserialized_token_cache = cache
         return cache
 
     @token_cache.setter
-    def token_cache(self, value: SerializableTokenCache) -> None:
-        if value.has_state_changed:
-            self._token_cache = value.serialize()
-            self.has_changed = True
+    def token_cache(self, value: 'SerializableTokenCache') -> None:
+        # serializing is deferred to the end of the request: see commit_token_cache
+        self._deserialized_token_cache = value
+
+    def discard_token_cache(self) -> None:
+        """forget this request's token cache without committing it: whatever msal changed in it is dropped"""
+        self._deserialized_token_cache = None
+
+    def commit_token_cache(self) -> None:
+        """serialize this request's token cache, only if msal changed it. called by the adapters at the end of
+        requests that succeeded"""
+        cache = self._deserialized_token_cache
+        if cache is None or not cache.has_state_changed:
+            return
+        if self.token_cache_store is not None and self._home_account_id:
+            self.token_cache_store.save(self._home_account_id, cache.serialize())
+        else:
+            self._set('_token_cache', cache.serialize())
+        cache.has_state_changed = False
+
+    @property
+    def id_token_claims(self) -> dict:
+        return self._id_token_claims
+
+    @id_token_claims.setter
+    def id_token_claims(self, value: dict) -> None:
+        self._set('_id_token_claims', value)
+
+    @property
+    def access_token(self) -> str:
+        return self._access_token
+
+    @access_token.setter
+    def access_token(self, value: str) -> None:
+        self._set('_access_token', value)
 
     @property
     def state(self) -> str:
@@ -59,8 +176,7 @@ class IdentityContextData(object):
 
     @state.setter
     def state(self, value: str) -> None:
-        self._state = value
-        self.has_changed = True
+        self._set('_state', value)
 
     @property
     def nonce(self) -> str:
@@ -68,21 +184,20 @@ class IdentityContextData(object):
 
     @nonce.setter
     def nonce(self, value: str) -> None:
-        self._nonce = value
-        self.has_changed = True
+        self._set('_nonce', value)
 
     # TODO: talk to MSIDWEB team
     # or browse the code about how to implement the following:
     @property
     def last_used_b2c_policy(self) -> str:
         if len(self._last_used_b2c_policy):
+            self._dirty.add('_last_used_b2c_policy') # policies are used once
             return self._last_used_b2c_policy.pop()
         return None
 
     @last_used_b2c_policy.setter
     def last_used_b2c_policy(self, value: str) -> None:
-        self._last_used_b2c_policy = [value]
-        self.has_changed = True
+        self._set('_last_used_b2c_policy', [value])
 
     @property
     def post_sign_in_url(self) -> str:
@@ -90,5 +205,12 @@ class IdentityContextData(object):
 
     @post_sign_in_url.setter
     def post_sign_in_url(self, value: str) -> None:
-        self._post_sign_in_url = value
-        self.has_changed = True
+        self._set('_post_sign_in_url', value)
+
+    @property
+    def last_used_tenant(self) -> str:
+        return self._last_used_tenant
+
+    @last_used_tenant.setter
+    def last_used_tenant(self, value: str) -> None:
+        self._set('_last_used_tenant', value)
@@ -2,8 +2,12 @@ try:
     from ms_identity_web import IdentityWebPython
     from ms_identity_web.context import IdentityContextData
     from ms_identity_web.adapters import IdentityWebContextAdapter
+    from ms_identity_web.instrumentation import instrumented, phase
     from django.http.request import HttpRequest as DjangoHttpRequest
     from django.shortcuts import redirect as django_redirect
+    from django.urls import reverse as django_reverse
+    from django.conf import settings as django_settings
+    from django.utils.cache import patch_vary_headers
     import logging
 except:
     pass
@@ -14,6 +18,7 @@ class DjangoContextAdapter(IdentityWebContextAdapter):
         # TODO: remove the following and add a middleware loaded before this one for global request/session context?
         self.request = request
         self._session = request.session
+        self._response_cookies = [] # set on the response by _on_request_end
         self.logger = logging.getLogger('MsalMiddleWareLogger')
 
     @property
@@ -23,6 +28,7 @@ class DjangoContextAdapter(IdentityWebContextAdapter):
         identity_context_data = getattr(self.request, IdentityContextData.SESSION_KEY, None)
         if not identity_context_data:
             identity_context_data = self._deserialize_identity_context_data_from_session()
+            identity_context_data.token_cache_store = self._token_cache_store
             setattr(self.request, IdentityContextData.SESSION_KEY, identity_context_data)
         return identity_context_data
 
@@ -33,10 +39,15 @@ class DjangoContextAdapter(IdentityWebContextAdapter):
             self.logger.error(f'MsalMiddleware failed @ _on_request_init\n{ex}')
 
     # this is for saving any changes to the identity_context_data
-    def _on_request_end(self) -> None:
+    def _on_request_end(self, response=None) -> None:
         try:
             if getattr(self.request, IdentityContextData.SESSION_KEY, None):
-                self._serialize_identity_context_data_to_session()
+                self._serialize_identity_context_data_to_session(response)
+            settings = django_settings
+            for name, value, max_age in self._response_cookies:
+                response.set_cookie(name, value, max_age=max_age, domain=settings.SESSION_COOKIE_DOMAIN,
+                                    path=settings.SESSION_COOKIE_PATH, secure=settings.SESSION_COOKIE_SECURE or None,
+                                    httponly=True, samesite='Lax') # Lax: sent along with the identity provider's redirect
         except Exception as ex:
             self.logger.error(f'MsalMiddleware failed @ _on_request_ended\n{ex}')
 
@@ -49,6 +60,8 @@ class DjangoContextAdapter(IdentityWebContextAdapter):
         config_key = aad_config.django.id_web_configs
 
         setattr(self.request, config_key, aad_config)
+        self._identity_web = identity_web
+        self._sign_in_view_name = aad_config.django.auth_endpoints.sign_in
         
     @property
     def has_context(self) -> bool:
@@ -63,11 +76,30 @@ class DjangoContextAdapter(IdentityWebContextAdapter):
         """this function clears the session and refreshes context. TODO: only clear IdWebPy vars"""
         # TODO: clear ONLY msidweb session stuff
         self.session.flush()
+        # the request's identity context is written back at the end of the request (with the codec, to cookies
+        # that aren't part of the session): clear it too, memoized token cache included, as the flask adapter does
+        self.identity_context_data.clear()
 
     def redirect_to_absolute_url(self, absolute_url: str) -> None:
         """this function redirects to an absolute url"""
         return django_redirect(absolute_url)
         
+    def get_request_url(self) -> str:
+        return self.request.build_absolute_uri()
+
+    def get_sign_in_url(self) -> str:
+        return django_reverse(self._sign_in_view_name)
+
+    def get_request_cookie(self, name: str) -> str:
+        return self.request.COOKIES.get(name, None)
+
+    def set_response_cookie(self, name: str, value: str, max_age: int) -> None:
+        self._response_cookies.append((name, value, max_age))
+
+    @property
+    def _secret_key(self) -> str:
+        return django_settings.SECRET_KEY
+
     def get_request_params_as_dict(self) -> dict:
         try:
             if self.request.method == "GET":
@@ -82,22 +114,61 @@ class DjangoContextAdapter(IdentityWebContextAdapter):
             return dict()
 
     # does this need to be public method?
+    @instrumented('session_read')
     def _deserialize_identity_context_data_from_session(self) -> 'IdentityContextData':
-        blank_id_context_data = IdentityContextData()
         try:
-            id_context_from_session = self.session.get(IdentityContextData.SESSION_KEY, dict())
-            blank_id_context_data.__dict__.update(id_context_from_session)
+            codec = self._session_codec
+            if codec is not None:
+                return self._read_identity_context_cookies(codec)
+            return IdentityContextData.decode(self.session.get(IdentityContextData.SESSION_KEY, None))
         except Exception as exception:
             self.logger.warning(f"failed to deserialize identity context from session: creating empty one\n{exception}")
-        return blank_id_context_data
+        return IdentityContextData()
 
     # does this need to be public method?
-    def _serialize_identity_context_data_to_session(self) -> None:
+    @instrumented('session_write')
+    def _serialize_identity_context_data_to_session(self, response=None) -> None:
         try:
             identity_context = self.identity_context_data
-            if identity_context.has_changed:
-                identity_context.has_changed = False
-                identity_context = identity_context.__dict__
-                self.session[IdentityContextData.SESSION_KEY] = identity_context
+            with phase(self._instrumentation, 'token_cache_serialize'):
+                identity_context.commit_token_cache()
+            codec = self._session_codec
+            if codec is not None:
+                if identity_context.has_changed:
+                    self._write_identity_context_cookies(codec, identity_context, response)
+            elif identity_context.has_changed:
+                # only the changed fields are re-written into the encoding already in the session
+                previous = self.session.get(IdentityContextData.SESSION_KEY, None)
+                encoded = identity_context.encode(previous)
+                if len(encoded) > 1:
+                    self.session[IdentityContextData.SESSION_KEY] = encoded
+                else:
+                    # nothing but defaults (e.g. once cleared): leave a flushed session empty, which django
+                    # deletes the cookie of even on error responses, whereas it doesn't save them
+                    self.session.pop(IdentityContextData.SESSION_KEY, None)
         except Exception as exception:
             self.logger.error(f"failed to serialize identity context to session.\n{exception}")
+
+    def _read_identity_context_cookies(self, codec: 'SessionCodec') -> 'IdentityContextData':
+        encoded = codec.decode(self.request.COOKIES, self._secret_key)
+        if encoded is None and IdentityContextData.SESSION_KEY in self.session:
+            # first request since the codec was enabled: move the identity context out of the session
+            identity_context = IdentityContextData.decode(self.session.pop(IdentityContextData.SESSION_KEY))
+            identity_context.has_changed = True
+            return identity_context
+        return IdentityContextData.decode(encoded)
+
+    def _write_identity_context_cookies(self, codec: 'SessionCodec', identity_context: 'IdentityContextData', response) -> None:
+        # same scope and lifetime as django's session cookie
+        settings = django_settings
+        max_age = None if self.session.get_expire_at_browser_close() else self.session.get_expiry_age()
+        cookies = codec.encode(identity_context.encode(), self._secret_key, self._instrumentation)
+        for name, value in cookies.items():
+            response.set_cookie(name, value, max_age=max_age, domain=settings.SESSION_COOKIE_DOMAIN,
+                                path=settings.SESSION_COOKIE_PATH, secure=settings.SESSION_COOKIE_SECURE or None,
+                                httponly=settings.SESSION_COOKIE_HTTPONLY or None,
+                                samesite=settings.SESSION_COOKIE_SAMESITE)
+        for name in codec.stale_cookie_names(self.request.COOKIES, len(cookies)):
+            response.delete_cookie(name, path=settings.SESSION_COOKIE_PATH, domain=settings.SESSION_COOKIE_DOMAIN,
+                                   samesite=settings.SESSION_COOKIE_SAMESITE)
+        patch_vary_headers(response, ('Cookie',))
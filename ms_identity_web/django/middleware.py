@@ -1,5 +1,5 @@
 try:    
-    from ms_identity_web.errors import NotAuthenticatedError
+    from ms_identity_web.errors import NotAuthenticatedError, NotAuthorizedError
     from django.conf import settings
     from django.shortcuts import render
 except:
@@ -7,16 +7,15 @@ except:
 
 from .adapter import DjangoContextAdapter
 
-ms_identity_web = settings.MS_IDENTITY_WEB
-
 class MsalMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
         # One-time configuration and initialization.
-        self.ms_identity_web = ms_identity_web
+        # settings are read here rather than at import, so importing this module doesn't need configured settings
+        self.ms_identity_web = settings.MS_IDENTITY_WEB
     
     def process_exception(self, request, exception):
-        if isinstance(exception, NotAuthenticatedError):
+        if isinstance(exception, (NotAuthenticatedError, NotAuthorizedError)):
             if hasattr(settings, 'ERROR_TEMPLATE'):
                 return render(request, settings.ERROR_TEMPLATE.format(exception.code))                
         return None
@@ -26,14 +25,18 @@ class MsalMiddleware:
         # the view (and later middleware) are called.
 
         django_context_adapter = DjangoContextAdapter(request)
-        self.ms_identity_web.set_adapter(django_context_adapter)
-        django_context_adapter._on_request_init()
-        
-        response = self.get_response(request)
+        # bound to this thread/task only: concurrent requests each see their own adapter
+        token = self.ms_identity_web.bind_adapter(django_context_adapter)
+        try:
+            django_context_adapter._on_request_init()
+
+            response = self.get_response(request)
 
-        # Code to be executed for each request/response after
-        # the view is called.
+            # Code to be executed for each request/response after
+            # the view is called.
 
-        django_context_adapter._on_request_end()
+            django_context_adapter._on_request_end(response)
+        finally:
+            self.ms_identity_web.unbind_adapter(token)
 
         return response
\ No newline at end of file
@@ -2,6 +2,7 @@ try:
     from django.urls import path
     from django.shortcuts import redirect
     from django.urls import reverse
+    from django.http import Http404, HttpResponse
 except:
     pass
 import logging
@@ -12,39 +13,52 @@ class MsalViews:
         self.ms_identity_web = ms_identity_web
         self.prefix = self.ms_identity_web.aad_config.django.auth_endpoints.prefix + "/"
         self.endpoints = self.ms_identity_web.aad_config.django.auth_endpoints
+        self.paths = self.ms_identity_web.aad_config.endpoint_paths # e.g. 'auth/sign_in', for the log lines
 
     def url_patterns(self):
-        return [
+        patterns = [
             path(self.endpoints.sign_in, self.sign_in, name=self.endpoints.sign_in),
             path(self.endpoints.edit_profile, self.edit_profile, name=self.endpoints.edit_profile),
             path(self.endpoints.redirect, self.aad_redirect, name=self.endpoints.redirect),
             path(self.endpoints.sign_out, self.sign_out, name=self.endpoints.sign_out),
             path(self.endpoints.post_sign_out, self.post_sign_out, name=self.endpoints.post_sign_out),
         ]
+        # optional: only served if the config names a 'metrics' endpoint
+        if getattr(self.endpoints, 'metrics', None):
+            patterns.append(path(self.endpoints.metrics, self.metrics, name=self.endpoints.metrics))
+        return patterns
 
     def sign_in(self, request):
-        self.logger.debug(f"{self.prefix}{self.endpoints.sign_in}: request received. will redirect browser to login")
+        self.logger.debug("%s: request received. will redirect browser to login", self.paths.sign_in)
         auth_url = self.ms_identity_web.get_auth_url(redirect_uri=request.build_absolute_uri(reverse(self.endpoints.redirect)))
         return redirect(auth_url)
 
     def edit_profile(self, request):
-        self.logger.debug(f"{self.prefix}{self.endpoints.edit_profile}: request received. will redirect browser to edit profile")
+        self.logger.debug("%s: request received. will redirect browser to edit profile", self.paths.edit_profile)
         auth_url = self.ms_identity_web.get_auth_url(
                 redirect_uri=request.build_absolute_uri(reverse(self.endpoints.redirect)),
                 b2c_policy=self.ms_identity_web.aad_config.b2c.profile)
         return redirect(auth_url)
 
     def aad_redirect(self, request):
-        self.logger.debug(f"{self.prefix}{self.endpoints.redirect}: request received. will process params")
+        post_sign_in_url = self.ms_identity_web.id_data.post_sign_in_url or reverse('index')
+        self.logger.debug("%s: request received. will process params", self.paths.redirect)
+        self.logger.debug("%s: will redirect to %s afterwards", self.paths.redirect, post_sign_in_url)
         return self.ms_identity_web.process_auth_redirect(
             redirect_uri=request.build_absolute_uri(reverse(self.endpoints.redirect)),
-            afterwards_go_to_url=reverse('index'))
+            afterwards_go_to_url=post_sign_in_url)
 
     def sign_out(self, request):
-        self.logger.debug(f"{self.prefix}{self.endpoints.sign_out}: signing out username: {request.identity_context_data.username}")
+        self.logger.debug("%s: signing out username: %s", self.paths.sign_out, request.identity_context_data.username)
         return self.ms_identity_web.sign_out(request.build_absolute_uri(reverse(self.endpoints.post_sign_out)))    # send the user to Azure AD logout endpoint
 
     def post_sign_out(self, request):
-        self.logger.debug(f"{self.prefix}{self.endpoints.post_sign_out}: clearing session for username: {request.identity_context_data.username}")
+        self.logger.debug("%s: clearing session for username: %s", self.paths.post_sign_out, request.identity_context_data.username)
         self.ms_identity_web.remove_user(request.identity_context_data.username)  # remove user auth from session on successful logout
-        return redirect(reverse('index'))                   # take us back to the home page
\ No newline at end of file
+        return redirect(reverse('index'))                   # take us back to the home page
+
+    def metrics(self, request):
+        instrumentation = self.ms_identity_web.instrumentation
+        if not hasattr(instrumentation, 'prometheus_text'):
+            raise Http404 # instrumentation disabled, or exported elsewhere (e.g. OpenTelemetry)
+        return HttpResponse(instrumentation.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
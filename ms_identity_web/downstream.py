@@ -0,0 +1,65 @@
+from threading import Lock
+import os
+
+from .transport import pooled_session
+
+class DownstreamApiClient(object):
+    """Keep-alive http client for the APIs the app calls with its users' access tokens (e.g. Graph, its
+    own web APIs), used by IdentityWebPython.call_downstream_api:
+    - one pooled requests.Session per process (a new one in forked children): connections are reused
+      across requests and users
+    - at most `max_connections_per_host` connections to each of up to `max_hosts` hosts. Callers wait
+      for a free connection rather than opening more
+    - every call gets the (`connect_timeout`, `read_timeout`) timeouts unless it passes its own
+    - cookies are never kept: the session is shared by all users."""
+    DEFAULT_MAX_CONNECTIONS_PER_HOST = 10
+    DEFAULT_MAX_HOSTS = 10
+    DEFAULT_CONNECT_TIMEOUT = 3.05
+    DEFAULT_READ_TIMEOUT = 30
+
+    def __init__(self, max_connections_per_host: int = DEFAULT_MAX_CONNECTIONS_PER_HOST, max_hosts: int = DEFAULT_MAX_HOSTS,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT) -> None:
+        self.max_connections_per_host = max_connections_per_host
+        self.max_hosts = max_hosts
+        self.timeout = (connect_timeout, read_timeout)
+        self._lock = Lock()
+        self._session = None
+        self._pid = None
+        self.requests = 0
+        self.retries = 0 # calls repeated with a refreshed token after a 401
+
+    @staticmethod
+    def from_config(downstream_config) -> 'DownstreamApiClient':
+        """build a client from the optional 'downstream_api' section of the aad config file"""
+        if not downstream_config:
+            return DownstreamApiClient()
+        defaults = DownstreamApiClient
+        return DownstreamApiClient(
+            getattr(downstream_config, 'max_connections_per_host', None) or defaults.DEFAULT_MAX_CONNECTIONS_PER_HOST,
+            getattr(downstream_config, 'max_hosts', None) or defaults.DEFAULT_MAX_HOSTS,
+            getattr(downstream_config, 'connect_timeout', None) or defaults.DEFAULT_CONNECT_TIMEOUT,
+            getattr(downstream_config, 'read_timeout', None) or defaults.DEFAULT_READ_TIMEOUT)
+
+    @property
+    def session(self) -> 'requests.Session':
+        # built on first use (requests is imported then), and again in forked children: sockets aren't shared
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = pooled_session(self.max_hosts, self.max_connections_per_host)
+                    self._pid = os.getpid()
+        return self._session
+
+    def request(self, method: str, url: str, access_token: str, **kwargs) -> 'requests.Response':
+        """send the request with `Authorization: Bearer <access_token>`. kwargs are requests' (json, params, ...)"""
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['Authorization'] = f'Bearer {access_token}'
+        kwargs.setdefault('timeout', self.timeout)
+        self.requests += 1
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
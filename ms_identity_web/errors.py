@@ -22,17 +22,25 @@ class B2CPasswordError(AuthError):
     status = 300
     description = "password reset/redirect"
 
-try:
-    from werkzeug.exceptions import HTTPException
-    from flask import request
-    class NotAuthenticatedError(HTTPException, AuthError):
-        """Flask HTTPException Error + IdWebPy AuthError: User is not authenticated."""
-        code = 401
-        status = 401
-        description = 'User is not authenticated'
-except:
-    class NotAuthenticatedError(AuthError):
-        """IdWebPy AuthError: User is not authenticated."""
-        code = 401
-        status = 401
-        description = 'User is not authenticated'
+# the errors of rejected requests: built on first use, so importing this module doesn't import werkzeug
+# name -> (http status, description)
+_HTTP_ERRORS = {
+    'NotAuthenticatedError': (401, 'User is not authenticated'),
+    'NotAuthorizedError': (403, 'User is not authorized'), # signed in, but lacks the route's roles or groups
+}
+
+def _http_error(name: str) -> type:
+    status, description = _HTTP_ERRORS[name]
+    try:
+        from werkzeug.exceptions import HTTPException
+        bases, doc = (HTTPException, AuthError), f"Flask HTTPException Error + IdWebPy AuthError: {description}."
+    except:
+        bases, doc = (AuthError,), f"IdWebPy AuthError: {description}."
+    return type(name, bases, {'__doc__': doc, '__module__': __name__,
+                              'code': status, 'status': status, 'description': description})
+
+def __getattr__(name: str) -> type:
+    # setdefault: concurrent first uses must all get the same class
+    if name in _HTTP_ERRORS:
+        return globals().setdefault(name, _http_error(name))
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
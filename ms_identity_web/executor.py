@@ -0,0 +1,51 @@
+from functools import partial
+from threading import Lock
+import contextvars
+import os
+
+class BoundedExecutor(object):
+    """Runs blocking (msal network) calls for the asyncio API on a bounded thread pool.
+    At most max_workers calls run at once; further calls queue. Callers stop waiting after
+    `timeout` seconds (asyncio.TimeoutError), though the underlying call can't be interrupted.
+    The context (adapter binding, framework request context) is copied into the worker thread."""
+    DEFAULT_MAX_WORKERS = 8
+    DEFAULT_TIMEOUT = 30
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, timeout: float = DEFAULT_TIMEOUT) -> None:
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._lock = Lock()
+        self._executor = None
+        self._pid = None
+
+    @staticmethod
+    def from_config(executor_config) -> 'BoundedExecutor':
+        """build an executor from the optional 'executor' section of the aad config file"""
+        if not executor_config:
+            return BoundedExecutor()
+        return BoundedExecutor(getattr(executor_config, 'max_workers', None) or BoundedExecutor.DEFAULT_MAX_WORKERS,
+                               getattr(executor_config, 'timeout', None) or BoundedExecutor.DEFAULT_TIMEOUT)
+
+    @property
+    def executor(self) -> 'ThreadPoolExecutor':
+        # created lazily, and re-created in forked children: threads don't survive a fork
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    from concurrent.futures import ThreadPoolExecutor
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ms_identity_web')
+                    self._pid = os.getpid()
+        return self._executor
+
+    async def run(self, f, *args, **kwargs):
+        import asyncio # already loaded if we got here: imported on use to keep it off the startup path
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self.executor, partial(context.run, f, *args, **kwargs))
+        return await asyncio.wait_for(future, self.timeout)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
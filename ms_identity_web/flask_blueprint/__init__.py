@@ -1,9 +1,8 @@
 from flask import (
     Blueprint, redirect,
+    abort,
     url_for,
-    current_app,
     g,
-    session,
     request,
     )
 
@@ -14,6 +13,7 @@ class FlaskAADEndpoints(Blueprint):
         config = id_web.aad_config
         logger = id_web._logger
         endpoints = config.flask.auth_endpoints
+        paths = config.endpoint_paths # e.g. '/auth/sign_in', for the log lines
         prefix = endpoints.prefix
         name = prefix.strip('/')
         super().__init__(name, __name__, url_prefix=prefix)
@@ -21,16 +21,16 @@ class FlaskAADEndpoints(Blueprint):
         @self.route(endpoints.sign_in)
         def sign_in():
             post_sign_in_url = request.values.get('post_sign_in_url', None)
-            logger.debug(f"{name}{endpoints.sign_in}: request received. will redirect browser to login")
+            logger.debug("%s: request received. will redirect browser to login", paths.sign_in)
             if post_sign_in_url:
-                id_web.id_data.post_sign_in_url = post_sign_in_url
-                logger.debug(f"{name}{endpoints.sign_in}: will redirect to {post_sign_in_url} afterwards")
-            auth_url = id_web.get_auth_url(redirect_uri=url_for('.aad_redirect', _external=True))
+                logger.debug("%s: will redirect to %s afterwards", paths.sign_in, post_sign_in_url)
+            auth_url = id_web.get_auth_url(redirect_uri=url_for('.aad_redirect', _external=True),
+                                           post_sign_in_url=post_sign_in_url)
             return redirect(auth_url)
 
         @self.route(endpoints.edit_profile)
         def edit_profile():
-            logger.debug(f"{name}{endpoints.edit_profile}: request received. will redirect browser to edit profile")
+            logger.debug("%s: request received. will redirect browser to edit profile", paths.edit_profile)
             auth_url = id_web.get_auth_url(
                     redirect_uri=url_for('.aad_redirect', _external=True),
                     b2c_policy=config.b2c.profile)
@@ -39,21 +39,30 @@ class FlaskAADEndpoints(Blueprint):
         @self.route(endpoints.redirect)
         def aad_redirect():
             post_sign_in_url = id_web.id_data.post_sign_in_url or url_for('index')
-            logger.debug(f"{name}{endpoints.redirect}: request received. will process params")
-            logger.debug(f"{name}{endpoints.redirect}: will redirect to {post_sign_in_url} afterwards")
+            logger.debug("%s: request received. will process params", paths.redirect)
+            logger.debug("%s: will redirect to %s afterwards", paths.redirect, post_sign_in_url)
             return id_web.process_auth_redirect(redirect_uri=url_for('.aad_redirect',_external=True),
                                                 afterwards_go_to_url=post_sign_in_url)
 
         @self.route(endpoints.sign_out)
         def sign_out():
-            logger.debug(f"{name}{endpoints.sign_out}: signing out username: {g.identity_context_data.username}")
+            logger.debug("%s: signing out username: %s", paths.sign_out, g.identity_context_data.username)
             return id_web.sign_out(url_for('.post_sign_out', _external = True))    # send the user to Azure AD logout endpoint
 
         @self.route(endpoints.post_sign_out)
         def post_sign_out():
-            logger.debug(f"{name}{endpoints.post_sign_out}: clearing session for username: {g.identity_context_data.username}")
+            logger.debug("%s: clearing session for username: %s", paths.post_sign_out, g.identity_context_data.username)
             id_web.remove_user(g.identity_context_data.username)  # remove user auth from session on successful logout
             return redirect(url_for('index'))                   # take us back to the home page
+
+        # optional: only served if the config names a 'metrics' endpoint
+        if getattr(endpoints, 'metrics', None):
+            @self.route(endpoints.metrics)
+            def metrics():
+                instrumentation = id_web.instrumentation
+                if not hasattr(instrumentation, 'prometheus_text'):
+                    abort(404) # instrumentation disabled, or exported elsewhere (e.g. OpenTelemetry)
+                return instrumentation.prometheus_text(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
         
     def url_for(self, destination, _external=False):
         return url_for(f'{self.name}.{destination}', _external=_external)
@@ -0,0 +1,192 @@
+try:
+    from flask import (
+        Flask as flask_app,
+        has_request_context as flask_has_request_context,
+        session as flask_session,
+        request as flask_request,
+        redirect as flask_redirect,
+        g as flask_g,
+        after_this_request as flask_after_this_request,
+        )
+    from . import FlaskAADEndpoints # this is where our auth-related endpoints are defined
+except:
+    pass
+
+from typing import Any
+
+from ..adapters import IdentityWebContextAdapter, require_request_context
+from ..context import IdentityContextData
+from ..instrumentation import instrumented, phase
+
+class FlaskContextAdapter(IdentityWebContextAdapter):
+    """Context Adapter to enable IdentityWebPython to work within the Flask environment"""
+    def __init__(self, app) -> None:
+        assert isinstance(app, flask_app)
+        super().__init__()
+        self.app = app
+        with self.app.app_context():
+            self.logger = app.logger
+            app.before_request(self._on_request_init)
+            app.after_request(self._on_request_end)
+
+    @property
+    @require_request_context
+    def identity_context_data(self) -> 'IdentityContextData':
+        # TODO: make the key name configurable
+        self.logger.debug("Getting identity_context from g")
+        identity_context_data = flask_g.get(IdentityContextData.SESSION_KEY)
+        if not identity_context_data:
+            identity_context_data = self._deserialize_identity_context_data_from_session()
+            identity_context_data.token_cache_store = self._token_cache_store
+            setattr(flask_g, IdentityContextData.SESSION_KEY, identity_context_data)
+        return identity_context_data
+
+    # method is called when flask gets an app/request context
+    # Flask-specific startup here?    
+    def _on_request_init(self) -> None:
+        try:
+            idx = self.identity_context_data # initialize it so it is available to request context
+        except Exception as ex:
+            self.logger.error(f'Adapter failed @ _on_request_init\n{ex}')
+
+    # this is for saving any changes to the identity_context_data
+    def _on_request_end(self, response_to_return=None) -> None:
+        try:
+            if IdentityContextData.SESSION_KEY in flask_g:
+                self._serialize_identity_context_data_to_session(response_to_return)
+        except Exception as ex:
+            self.logger.error(f'flask adapter failed @ _on_request_ended\n{ex}')
+
+        return response_to_return
+
+    # TODO: order is reveresed? create id web first, then attach flask adapter to it!?
+    def attach_identity_web_util(self, identity_web: 'IdentityWebPython') -> None:
+        """attach the identity web instance to session so it is accessible everywhere.
+        e.g., ms_id_web = current_app.config.get("ms_identity_web")\n
+        Also attaches the application logger."""
+        aad_config = identity_web.aad_config
+        config_key = aad_config.flask.id_web_configs
+
+        with self.app.app_context():
+            self.app.config[config_key] = aad_config
+
+        identity_web.set_logger(self.logger)
+        self._identity_web = identity_web
+        auth_endpoints = FlaskAADEndpoints(identity_web)
+        self.auth_endpoints = auth_endpoints
+        self.app.context_processor(lambda: dict(ms_id_url_for=auth_endpoints.url_for))
+        self.app.register_blueprint(auth_endpoints)        
+
+    @property
+    def has_context(self) -> bool:
+        return flask_has_request_context()
+
+    ### not sure if this method needs to be public yet :/
+    @property
+    @require_request_context
+    def session(self) -> None:
+        return flask_session
+
+    # TODO: only clear IdWebPy vars
+    @require_request_context
+    def clear_session(self) -> None:
+        """this function clears the session and refreshes context. TODO: only clear IdWebPy vars"""
+        self.identity_context_data.clear()
+
+    @require_request_context
+    def redirect_to_absolute_url(self, absolute_url: str) -> None:
+        """this function redirects to an absolute url"""
+        return flask_redirect(absolute_url)
+
+    @require_request_context
+    def get_request_url(self) -> str:
+        return flask_request.url
+
+    @require_request_context
+    def get_sign_in_url(self) -> str:
+        return self.auth_endpoints.url_for('sign_in')
+
+    @require_request_context
+    def get_request_cookie(self, name: str) -> str:
+        return flask_request.cookies.get(name, None)
+
+    @require_request_context
+    def set_response_cookie(self, name: str, value: str, max_age: int) -> None:
+        interface = self.app.session_interface
+        @flask_after_this_request
+        def set_cookie(response):
+            response.set_cookie(name, value, max_age=max_age, domain=interface.get_cookie_domain(self.app),
+                                path=interface.get_cookie_path(self.app), secure=interface.get_cookie_secure(self.app),
+                                httponly=True, samesite='Lax') # Lax: sent along with the identity provider's redirect
+            return response
+
+    @property
+    def _secret_key(self) -> Any:
+        return self.app.secret_key
+
+    @require_request_context
+    def get_request_params_as_dict(self) -> dict:
+        """this function returns the params dict from any flask request"""
+        try:
+            # this is query and form-post params merged,
+            # preferring query param if there is a key collision
+            return flask_request.values
+        except:
+            if self.logger is not None:
+                self.logger.warning("failed to get param dict from request, substituting empty dict instead")
+            return dict()
+
+    # does this need to be public method?
+    @instrumented('session_read')
+    @require_request_context
+    def _deserialize_identity_context_data_from_session(self) -> 'IdentityContextData':
+        try:
+            codec = self._session_codec
+            if codec is not None:
+                return self._read_identity_context_cookies(codec)
+            return IdentityContextData.decode(self.session.get(IdentityContextData.SESSION_KEY, None))
+        except Exception as exception:
+            self.logger.warning(f"failed to deserialize identity context from session: creating empty one\n{exception}")
+        return IdentityContextData()
+
+    # does this need to be public method?
+    @instrumented('session_write')
+    @require_request_context
+    def _serialize_identity_context_data_to_session(self, response=None) -> None:
+        try:
+            identity_context = self.identity_context_data
+            with phase(self._instrumentation, 'token_cache_serialize'):
+                identity_context.commit_token_cache()
+            codec = self._session_codec
+            if codec is not None:
+                if identity_context.has_changed:
+                    self._write_identity_context_cookies(codec, identity_context, response)
+            elif identity_context.has_changed:
+                # only the changed fields are re-written into the encoding already in the session
+                previous = self.session.get(IdentityContextData.SESSION_KEY, None)
+                self.session[IdentityContextData.SESSION_KEY] = identity_context.encode(previous)
+        except Exception as exception:
+            self.logger.error(f"failed to serialize identity context to session.\n{exception}")
+
+    def _read_identity_context_cookies(self, codec: 'SessionCodec') -> 'IdentityContextData':
+        encoded = codec.decode(flask_request.cookies, self._secret_key)
+        if encoded is None and IdentityContextData.SESSION_KEY in self.session:
+            # first request since the codec was enabled: move the identity context out of the session
+            identity_context = IdentityContextData.decode(self.session.pop(IdentityContextData.SESSION_KEY))
+            identity_context.has_changed = True
+            return identity_context
+        return IdentityContextData.decode(encoded)
+
+    def _write_identity_context_cookies(self, codec: 'SessionCodec', identity_context: 'IdentityContextData', response) -> None:
+        # same scope and lifetime as flask's session cookie
+        interface = self.app.session_interface
+        domain, path = interface.get_cookie_domain(self.app), interface.get_cookie_path(self.app)
+        cookies = codec.encode(identity_context.encode(), self._secret_key, self._instrumentation)
+        for name, value in cookies.items():
+            response.set_cookie(name, value, expires=interface.get_expiration_time(self.app, flask_session),
+                                domain=domain, path=path, secure=interface.get_cookie_secure(self.app),
+                                httponly=interface.get_cookie_httponly(self.app),
+                                samesite=interface.get_cookie_samesite(self.app))
+        for name in codec.stale_cookie_names(flask_request.cookies, len(cookies)):
+            response.delete_cookie(name, domain=domain, path=path)
+        response.vary.add('Cookie')
@@ -0,0 +1,229 @@
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+from threading import Lock
+from typing import ContextManager
+import time
+
+from .constants import MetricsExporter
+
+# what phase() hands out when instrumentation is disabled: no clock reads, no allocation
+_DISABLED = nullcontext()
+
+def phase(instrumentation: 'Instrumentation', name: str) -> ContextManager:
+    """time the enclosed block as phase `name`, if instrumentation is enabled"""
+    if instrumentation is None:
+        return _DISABLED
+    return _Phase(instrumentation, name)
+
+def instrumented(name: str):
+    """method decorator: time the call as phase `name` with the instance's `_instrumentation`"""
+    def decorator(f):
+        @wraps(f)
+        def timed(self, *args, **kwargs):
+            instrumentation = self._instrumentation
+            if instrumentation is None:
+                return f(self, *args, **kwargs)
+            with _Phase(instrumentation, name):
+                return f(self, *args, **kwargs)
+        return timed
+    return decorator
+
+class _Phase(object):
+    __slots__ = ('_instrumentation', '_name', '_start')
+
+    def __init__(self, instrumentation: 'Instrumentation', name: str) -> None:
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        seconds = time.perf_counter() - self._start
+        outcome = 'ok' if exc_type is None else exc_type.__name__ # e.g. AuthSecurityError, TokenExchangeError
+        try:
+            self._instrumentation.record(self._name, seconds, outcome)
+        except Exception:
+            pass # instrumentation must never break sign in
+        return False
+
+class Instrumentation(object):
+    """Hook for the timings of the sign-in and token phases (verify_state, token_exchange,
+    token_cache_serialize, session_write, ...). Each phase is recorded once per call with its duration
+    and its outcome: 'ok', or the name of the exception it raised. Subclass and override `record` to
+    forward the timings elsewhere."""
+
+    def record(self, phase: str, seconds: float, outcome: str) -> None:
+        pass
+
+    def record_session_size(self, raw_bytes: int, encoded_bytes: int, cookies: int) -> None:
+        """an identity context written to cookies by a SessionCodec: its json size, the size of
+        the cookie values and the number of cookies"""
+        pass
+
+    def record_http_request(self, reused: bool) -> None:
+        """a request msal sent through the PooledTransport: whether it reused a connection"""
+        pass
+
+    @staticmethod
+    def from_config(instrumentation_config) -> 'Instrumentation':
+        """build the exporter named in the optional 'instrumentation' section of the aad config file"""
+        exporter = MetricsExporter(getattr(instrumentation_config, 'exporter', None) or str(MetricsExporter.PROMETHEUS))
+        if exporter is MetricsExporter.OPENTELEMETRY:
+            return OpenTelemetryInstrumentation()
+        return PhaseMetrics(getattr(instrumentation_config, 'buckets', None) or PhaseMetrics.DEFAULT_BUCKETS)
+
+class PhaseMetrics(Instrumentation):
+    """In-process histograms (and outcome counters) per (phase, outcome), rendered in the Prometheus
+    text exposition format by `prometheus_text` for the optional metrics endpoint. Also keeps the
+    sizes of the identity context cookies written by a SessionCodec, if one is used, and counts the
+    requests of msal's transport by connection (new or reused)."""
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+    PREFIX = 'ms_identity_web_phase'
+    SESSION_PREFIX = 'ms_identity_web_session'
+    HTTP_PREFIX = 'ms_identity_web_http'
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._lock = Lock()
+        self._series = {} # (phase, outcome) -> [per-bucket counts (last one is +Inf), sum, count]
+        # per-bucket counts of the cookie bytes (last one is +Inf), cookie bytes, json bytes, cookies, writes
+        self._session_sizes = [[0] * (len(self.SIZE_BUCKETS) + 1), 0, 0, 0, 0]
+        self._http_requests = {'new': 0, 'reused': 0} # by connection
+
+    def record(self, phase: str, seconds: float, outcome: str) -> None:
+        key = (phase, outcome)
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key, None)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def record_session_size(self, raw_bytes: int, encoded_bytes: int, cookies: int) -> None:
+        index = bisect_left(self.SIZE_BUCKETS, encoded_bytes)
+        with self._lock:
+            sizes = self._session_sizes
+            sizes[0][index] += 1
+            sizes[1] += encoded_bytes
+            sizes[2] += raw_bytes
+            sizes[3] += cookies
+            sizes[4] += 1
+
+    def record_http_request(self, reused: bool) -> None:
+        with self._lock:
+            self._http_requests['reused' if reused else 'new'] += 1
+
+    def http_request_snapshot(self) -> dict:
+        """{'new': requests that set up a connection, 'reused': requests over an already set up one}"""
+        with self._lock:
+            return dict(self._http_requests)
+
+    def session_size_snapshot(self) -> dict:
+        """{'writes', 'cookie_bytes', 'raw_bytes', 'cookies', 'compression_ratio', 'buckets': {upper bound: cumulative count}}"""
+        with self._lock:
+            counts, encoded_bytes, raw_bytes, cookies, writes = list(self._session_sizes[0]), *self._session_sizes[1:]
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip(self.SIZE_BUCKETS + (float('inf'),), counts):
+            cumulative += bucket_count
+            buckets[bound] = cumulative
+        return {'writes': writes, 'cookie_bytes': encoded_bytes, 'raw_bytes': raw_bytes, 'cookies': cookies,
+                'compression_ratio': raw_bytes / encoded_bytes if encoded_bytes else 0.0, 'buckets': buckets}
+
+    def snapshot(self) -> dict:
+        """{(phase, outcome): {'count', 'sum', 'buckets': {upper bound: cumulative count}}}"""
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        snapshot = {}
+        for key, (counts, total, count) in series.items():
+            cumulative, buckets = 0, {}
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                buckets[bound] = cumulative
+            snapshot[key] = {'count': count, 'sum': total, 'buckets': buckets}
+        return snapshot
+
+    def prometheus_text(self) -> str:
+        duration, outcomes = f'{self.PREFIX}_duration_seconds', f'{self.PREFIX}_outcomes_total'
+        lines = [f'# HELP {duration} Duration of ms_identity_web phases.',
+                 f'# TYPE {duration} histogram']
+        snapshot = sorted(self.snapshot().items())
+        for (phase, outcome), series in snapshot:
+            labels = f'phase="{phase}",outcome="{outcome}"'
+            for bound, cumulative in series['buckets'].items():
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{duration}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{duration}_sum{{{labels}}} {series["sum"]}')
+            lines.append(f'{duration}_count{{{labels}}} {series["count"]}')
+        lines += [f'# HELP {outcomes} ms_identity_web phases by outcome.',
+                  f'# TYPE {outcomes} counter']
+        for (phase, outcome), series in snapshot:
+            lines.append(f'{outcomes}{{phase="{phase}",outcome="{outcome}"}} {series["count"]}')
+
+        sizes = self.session_size_snapshot()
+        if sizes['writes']:
+            size, prefix = f'{self.SESSION_PREFIX}_cookie_bytes', self.SESSION_PREFIX
+            lines += [f'# HELP {size} Size of the identity context cookies written per response.',
+                      f'# TYPE {size} histogram']
+            for bound, cumulative in sizes['buckets'].items():
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{size}_bucket{{le="{le}"}} {cumulative}')
+            lines += [f'{size}_sum {sizes["cookie_bytes"]}',
+                      f'{size}_count {sizes["writes"]}',
+                      f'# HELP {prefix}_raw_bytes_total Uncompressed (json) size of the identity contexts written.',
+                      f'# TYPE {prefix}_raw_bytes_total counter',
+                      f'{prefix}_raw_bytes_total {sizes["raw_bytes"]}',
+                      f'# HELP {prefix}_cookies_total Identity context cookies written.',
+                      f'# TYPE {prefix}_cookies_total counter',
+                      f'{prefix}_cookies_total {sizes["cookies"]}',
+                      f'# HELP {prefix}_compression_ratio Uncompressed over cookie bytes of the identity contexts written.',
+                      f'# TYPE {prefix}_compression_ratio gauge',
+                      f'{prefix}_compression_ratio {sizes["compression_ratio"]}']
+
+        http_requests = self.http_request_snapshot()
+        if any(http_requests.values()):
+            requests = f'{self.HTTP_PREFIX}_requests_total'
+            lines += [f'# HELP {requests} Requests of msal\'s transport, by connection (new or reused).',
+                      f'# TYPE {requests} counter']
+            for connection, count in sorted(http_requests.items()):
+                lines.append(f'{requests}{{connection="{connection}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """Forwards the timings to OpenTelemetry metrics: a histogram 'ms_identity_web.phase.duration'
+    and a counter 'ms_identity_web.phase.outcomes', both with 'phase' and 'outcome' attributes.
+    Exported by whichever MeterProvider the application configures. Requires opentelemetry-api."""
+
+    def __init__(self, meter=None) -> None:
+        if meter is None:
+            from opentelemetry import metrics
+            meter = metrics.get_meter('ms_identity_web')
+        self._duration = meter.create_histogram('ms_identity_web.phase.duration', unit='s',
+                                                description='Duration of ms_identity_web phases')
+        self._outcomes = meter.create_counter('ms_identity_web.phase.outcomes', unit='1',
+                                              description='ms_identity_web phases by outcome')
+        self._cookie_size = meter.create_histogram('ms_identity_web.session.cookie_size', unit='By',
+                                                   description='Size of the identity context cookies written per response')
+        self._raw_size = meter.create_histogram('ms_identity_web.session.raw_size', unit='By',
+                                                description='Uncompressed (json) size of the identity contexts written')
+        self._cookies = meter.create_histogram('ms_identity_web.session.cookies', unit='1',
+                                               description='Identity context cookies written per response')
+        self._http_requests = meter.create_counter('ms_identity_web.http.requests', unit='1',
+                                                   description="Requests of msal's transport, by connection (new or reused)")
+
+    def record(self, phase: str, seconds: float, outcome: str) -> None:
+        attributes = {'phase': phase, 'outcome': outcome}
+        self._duration.record(seconds, attributes)
+        self._outcomes.add(1, attributes)
+
+    def record_session_size(self, raw_bytes: int, encoded_bytes: int, cookies: int) -> None:
+        self._cookie_size.record(encoded_bytes)
+        self._raw_size.record(raw_bytes)
+        self._cookies.record(cookies)
+
+    def record_http_request(self, reused: bool) -> None:
+        self._http_requests.add(1, {'connection': 'reused' if reused else 'new'})
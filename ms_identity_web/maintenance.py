@@ -0,0 +1,123 @@
+from logging import Logger
+from typing import Iterator
+import json
+import time
+
+from .token_cache_stores import TokenCacheStore
+from .app_tokens import AppTokenCache
+
+class TokenStoreMaintenance(object):
+    """Bulk operations on every user's tokens in the token cache store, for when a client secret is
+    rotated, a tenant is revoked or stale accounts are purged (remove_user only acts on the current
+    request's user):
+    - evict(), refresh() and inspect() select the accounts by `tenant` (their home tenant: the `utid` of
+      the `uid.utid` home_account_id caches are keyed by), `account` (a home_account_id) and/or
+      `older_than` (seconds since their cache was last saved)
+    - the store is read `batch_size` accounts at a time, so memory stays bounded however many users it holds
+    - refresh() redeems refresh tokens on at most `max_workers` threads
+    usage: TokenStoreMaintenance(ms_identity_web).evict(tenant='<tenant id>')"""
+    DEFAULT_BATCH_SIZE = TokenCacheStore.DEFAULT_BATCH_SIZE
+    DEFAULT_MAX_WORKERS = 8
+
+    def __init__(self, identity_web: 'IdentityWebPython', batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_workers: int = DEFAULT_MAX_WORKERS, logger: Logger = None) -> None:
+        self.identity_web = identity_web
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._logger = logger or identity_web._logger
+
+    @property
+    def store(self) -> TokenCacheStore:
+        store = self.identity_web.token_cache_store
+        if store is None:
+            raise RuntimeError("TokenStoreMaintenance: requires a token cache store")
+        return store
+
+    def select(self, tenant: str = None, account: str = None, older_than: float = None) -> Iterator[list]:
+        """the selected accounts, as lists of at most batch_size (home_account_id, updated_at)"""
+        store = self.store
+        if account and older_than is None:
+            if store.load(account) is not None:
+                yield [(account, None)]
+            return
+        updated_before = time.time() - older_than if older_than is not None else None
+        # the store filters by the key's end: the account itself, or its tenant
+        key_suffix = account or (f'.{tenant}' if tenant else None)
+        for batch in store.iter_batches(self.batch_size, updated_before, key_suffix):
+            batch = [(key, updated_at) for key, updated_at in batch
+                     if key != AppTokenCache.STORE_KEY # in case the app tokens share the store
+                     and (not account or key == account) and (not tenant or key.endswith(f'.{tenant}'))]
+            if batch:
+                yield batch
+
+    def evict(self, tenant: str = None, account: str = None, older_than: float = None) -> int:
+        """delete the selected accounts' token caches, and what this process keeps about them (indexed
+        access tokens, scheduled refreshes). Their users sign in again. Returns how many were evicted"""
+        if not (tenant or account or older_than is not None):
+            raise ValueError("TokenStoreMaintenance.evict: select accounts by tenant, account or older_than")
+        store, evicted = self.store, 0
+        for batch in self.select(tenant, account, older_than):
+            home_account_ids = [key for key, _ in batch]
+            store.delete_many(home_account_ids)
+            self.identity_web._forget_accounts(set(home_account_ids))
+            evicted += len(home_account_ids)
+        return evicted
+
+    def refresh(self, scopes: list = None, tenant: str = None, account: str = None, older_than: float = None) -> dict:
+        """force-refresh the selected accounts' tokens for scopes (by default the configured ones), e.g. to
+        check that they still can be once a client secret is rotated. Returns the counts of accounts
+        {'refreshed', 'skipped' (no refresh token for scopes), 'failed'}; failures are logged"""
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        scopes = tuple(scopes or self.identity_web.aad_config.scopes)
+        counts = {'refreshed': 0, 'skipped': 0, 'failed': 0}
+
+        def collect(done: set) -> None:
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as ex:
+                    counts['failed'] += 1
+                    self._logger.warning(f"TokenStoreMaintenance: refresh of {future.home_account_id} failed\n{ex}")
+                else:
+                    counts['skipped' if result is None else 'refreshed'] += 1
+
+        # at most 2 * max_workers refreshes are queued: the accounts are read no faster than they're refreshed
+        pending = set()
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix='TokenStoreMaintenance') as executor:
+            for batch in self.select(tenant, account, older_than):
+                for home_account_id, _ in batch:
+                    if len(pending) >= 2 * self.max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    future = executor.submit(self.identity_web._refresh_account_tokens, home_account_id, scopes)
+                    future.home_account_id = home_account_id
+                    pending.add(future)
+            collect(wait(pending)[0])
+        return counts
+
+    def inspect(self, tenant: str = None, account: str = None, older_than: float = None) -> Iterator[dict]:
+        """describe each selected account's token cache, without its secrets:
+        {'home_account_id', 'updated_at', 'usernames', 'tenants',
+         'access_tokens': [{'scopes', 'tenant', 'expires_on'}], 'refresh_tokens': count}"""
+        store = self.store
+        for batch in self.select(tenant, account, older_than):
+            for home_account_id, updated_at in batch:
+                serialized_cache = store.load(home_account_id)
+                if serialized_cache:
+                    yield self.describe(home_account_id, updated_at, serialized_cache)
+
+    @staticmethod
+    def describe(home_account_id: str, updated_at: float, serialized_cache: str) -> dict:
+        # read as plain json: inspecting needs no msal client
+        cache = json.loads(serialized_cache)
+        accounts = cache.get('Account', {}).values()
+        access_tokens = cache.get('AccessToken', {}).values()
+        return {
+            'home_account_id': home_account_id,
+            'updated_at': updated_at,
+            'usernames': sorted({a['username'] for a in accounts if a.get('username', None)}),
+            'tenants': sorted({a['realm'] for a in accounts if a.get('realm', None)}),
+            'access_tokens': [{'scopes': at.get('target', '').split(), 'tenant': at.get('realm', None),
+                               'expires_on': int(at.get('expires_on', 0))} for at in access_tokens],
+            'refresh_tokens': len(cache.get('RefreshToken', {})),
+        }
@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from logging import Logger
+from threading import RLock, Thread
+from typing import Any
+import json
+import os
+import time
+
+class CachedResponse(object):
+    """the subset of a requests.Response that msal reads"""
+    def __init__(self, status_code: int, text: str, headers: dict = None) -> None:
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def json(self) -> dict:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        pass # only successful responses are cached
+
+class MetadataCache(object):
+    """http_client for msal that caches OpenID Connect metadata and instance discovery responses.
+    - entries are fresh for `ttl` seconds. A stale entry is served right away while it is re-fetched
+      in the background; if re-fetching fails, the stale entry keeps being served.
+    - with a `path`, entries are persisted to that json file, so cold workers and restarts (and all
+      workers on a host) start from the metadata other workers already fetched.
+    - at most `max_entries` entries are held in memory (LRU).
+    Every other request is passed on to the wrapped http_client."""
+    DEFAULT_TTL = 24 * 60 * 60
+    DEFAULT_MAX_ENTRIES = 256
+    METADATA_URL_MARKERS = ('/.well-known/openid-configuration', '/discovery/instance')
+
+    def __init__(self, http_client=None, path: str = None, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, logger: Logger = None) -> None:
+        if http_client is None:
+            import requests
+            http_client = requests.Session()
+        self.http_client = http_client
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._logger = logger or Logger('MetadataCache')
+        self._lock = RLock()
+        self._entries = OrderedDict() # key -> {'status_code', 'text', 'fetched_at'}
+        self._refreshing = set()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._load()
+
+    @staticmethod
+    def from_config(metadata_cache_config, http_client=None, logger: Logger = None) -> 'MetadataCache':
+        """build a cache from the optional 'metadata_cache' section of the aad config file"""
+        return MetadataCache(http_client,
+                             path=getattr(metadata_cache_config, 'path', None),
+                             ttl=getattr(metadata_cache_config, 'ttl', None) or MetadataCache.DEFAULT_TTL,
+                             max_entries=getattr(metadata_cache_config, 'max_entries', None) or MetadataCache.DEFAULT_MAX_ENTRIES,
+                             logger=logger)
+
+    @classmethod
+    def is_metadata_request(cls, url: str) -> bool:
+        return any(marker in url for marker in cls.METADATA_URL_MARKERS)
+
+    @staticmethod
+    def _key(url: str, params: dict = None) -> str:
+        if not params:
+            return url
+        return url + '?' + '&'.join(f'{k}={v}' for k, v in sorted(params.items()))
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                persisted = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        with self._lock:
+            for key, entry in persisted.items():
+                current = self._entries.get(key, None)
+                if current is None or current['fetched_at'] < entry['fetched_at']:
+                    self._store(key, entry)
+
+    def _persist(self) -> None:
+        if not self.path:
+            return
+        self._load() # merge with what other workers wrote
+        with self._lock:
+            snapshot = dict(self._entries)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        import tempfile
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except OSError as ex:
+            self._logger.warning(f"MetadataCache: failed to persist metadata to {self.path}\n{ex}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _store(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _fetch(self, key: str, url: str, params: dict = None, headers: dict = None, **kwargs) -> Any:
+        response = self.http_client.get(url, params=params, headers=headers, **kwargs)
+        if response.status_code == 200:
+            self._store(key, {'status_code': 200, 'text': response.text, 'fetched_at': time.time()})
+            self._persist()
+        return response
+
+    def _refresh_in_background(self, key: str, url: str, params: dict = None, headers: dict = None, **kwargs) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch(key, url, params, headers, **kwargs)
+            except Exception as ex:
+                self._logger.warning(f"MetadataCache: failed to refresh {url}, serving stale metadata\n{ex}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        Thread(target=refresh, daemon=True).start()
+
+    def get(self, url: str, params: dict = None, headers: dict = None, **kwargs) -> Any:
+        if not self.is_metadata_request(url):
+            return self.http_client.get(url, params=params, headers=headers, **kwargs)
+        key = self._key(url, params)
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None and self.path:
+                self._load() # another worker may have fetched it already
+                entry = self._entries.get(key, None)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            self.misses += 1
+            return self._fetch(key, url, params, headers, **kwargs)
+        if time.time() - entry['fetched_at'] < self.ttl:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+            self._refresh_in_background(key, url, params, headers, **kwargs)
+        return CachedResponse(entry['status_code'], entry['text'])
+
+    def post(self, url: str, params: dict = None, data: Any = None, headers: dict = None, **kwargs) -> Any:
+        return self.http_client.post(url, params=params, data=data, headers=headers, **kwargs)
+
+    def close(self) -> None:
+        self.http_client.close()
@@ -0,0 +1,115 @@
+from logging import Logger
+from threading import Condition, Thread
+from typing import Callable, Hashable
+import heapq
+import itertools
+import os
+import random
+import time
+
+class TokenRefreshScheduler(object):
+    """Opt-in background refresher. Jobs are scheduled `lead_time` seconds before the token they refresh
+    expires, minus a random jitter of up to `jitter` seconds, so that refreshes are spread out instead of
+    all landing on the IdP at once (e.g. after an outage, overdue jobs are spread over the jitter window).
+    At most `max_workers` refreshes run at the same time. Scheduling a key again replaces its previous job."""
+    DEFAULT_LEAD_TIME = 5 * 60
+    DEFAULT_JITTER = 60
+    DEFAULT_MAX_WORKERS = 4
+
+    def __init__(self, lead_time: float = DEFAULT_LEAD_TIME, jitter: float = DEFAULT_JITTER,
+                 max_workers: int = DEFAULT_MAX_WORKERS, logger: Logger = None) -> None:
+        self.lead_time = lead_time
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self._logger = logger or Logger('TokenRefreshScheduler')
+        self._after_fork()
+        self.completed = 0
+        self.failed = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # the scheduler thread and pool don't exist in a forked child, and the lock may have been held
+        self._condition = Condition()
+        self._pid = None
+
+    @staticmethod
+    def from_config(refresh_config, logger: Logger = None) -> 'TokenRefreshScheduler':
+        """build a scheduler from the optional 'token_refresh' section of the aad config file"""
+        return TokenRefreshScheduler(getattr(refresh_config, 'lead_time', None) or TokenRefreshScheduler.DEFAULT_LEAD_TIME,
+                                     getattr(refresh_config, 'jitter', None) or TokenRefreshScheduler.DEFAULT_JITTER,
+                                     getattr(refresh_config, 'max_workers', None) or TokenRefreshScheduler.DEFAULT_MAX_WORKERS,
+                                     logger)
+
+    def _start(self) -> None:
+        # started lazily, and again in forked children: threads don't survive a fork
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._heap = [] # (due at, sequence, key)
+        self._jobs = {} # key -> (due at, job)
+        self._sequence = itertools.count()
+        self._stopped = False
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ms_identity_web_refresh')
+        Thread(target=self._run, name='ms_identity_web_refresh_scheduler', daemon=True).start()
+
+    def schedule(self, key: Hashable, expires_on: float, job: Callable[[], None]) -> None:
+        now = time.time()
+        due_at = expires_on - self.lead_time - random.uniform(0, self.jitter)
+        if due_at < now:
+            due_at = now + random.uniform(0, self.jitter)
+        with self._condition:
+            self._start()
+            self._jobs[key] = (due_at, job)
+            heapq.heappush(self._heap, (due_at, next(self._sequence), key))
+            self._condition.notify()
+
+    def cancel(self, key: Hashable) -> None:
+        with self._condition:
+            if self._pid == os.getpid():
+                self._jobs.pop(key, None)
+
+    def cancel_matching(self, predicate: Callable[[Hashable], bool]) -> None:
+        with self._condition:
+            if self._pid == os.getpid():
+                for key in [key for key in self._jobs if predicate(key)]:
+                    del self._jobs[key]
+
+    def _run(self) -> None:
+        with self._condition:
+            while not self._stopped:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                due_at, _, key = self._heap[0]
+                wait = due_at - time.time()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                scheduled = self._jobs.get(key, None)
+                if scheduled is None or scheduled[0] != due_at:
+                    continue # cancelled or re-scheduled
+                del self._jobs[key]
+                self._executor.submit(self._run_job, key, scheduled[1])
+
+    def _run_job(self, key: Hashable, job: Callable[[], None]) -> None:
+        try:
+            job()
+            self.completed += 1
+        except Exception as ex:
+            self.failed += 1
+            self._logger.warning(f"TokenRefreshScheduler: background refresh of {key} failed\n{ex}")
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._condition:
+            if self._pid != os.getpid():
+                return
+            self._stopped = True
+            self._pid = None
+            self._condition.notify()
+        self._executor.shutdown(wait=wait)
+
+    def __len__(self) -> int:
+        return len(self._jobs) if self._pid == os.getpid() else 0
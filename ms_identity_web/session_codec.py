@@ -0,0 +1,125 @@
+from threading import Lock
+from typing import Mapping
+import base64
+import hashlib
+import hmac
+import json
+import time
+import zlib
+
+def derive_key(secret_key, purpose: bytes) -> bytes:
+    """signing key for `purpose`, derived from the app's secret key: our signatures can't be
+    replayed where the framework (or another purpose) signs with the secret key"""
+    if not secret_key:
+        raise RuntimeError(f"the app has no secret key to sign {purpose.decode()} with")
+    secret = secret_key.encode() if isinstance(secret_key, str) else secret_key
+    return hashlib.sha256(b'ms_identity_web.' + purpose + b'|' + secret).digest()
+
+class SessionCodec(object):
+    """Keeps the identity context in its own cookies instead of the framework's session, for apps on
+    client-side (cookie) sessions: the session encoding of the context is compressed (zlib), signed
+    (HMAC-SHA256 with a key derived from the app's secret key) and split over as many cookies as
+    needed, `cookie_name`, `cookie_name.1`, ... The first cookie starts with the number of cookies.
+    Like the framework's cookie sessions, the cookies are signed, not encrypted.
+
+    Keeps counters of what it wrote: `writes`, `raw_bytes` (the json encoding), `encoded_bytes` (all
+    cookie values) and `overflows` (encodings that needed more than `max_cookies` cookies and weren't
+    written), plus `compression_ratio`."""
+    DEFAULT_COOKIE_NAME = 'ms_identity_web'
+    DEFAULT_CHUNK_SIZE = 3800 # browsers cap a cookie (name, value and attributes) at 4096 bytes
+    DEFAULT_MAX_COOKIES = 8 # servers commonly cap the request headers at 8 KiB
+    DEFAULT_MAX_AGE = 31 * 24 * 3600 # as flask's session lifetime. None: no limit
+    DEFAULT_COMPRESSION_LEVEL = 6
+    VERSION = '1'
+
+    def __init__(self, cookie_name: str = DEFAULT_COOKIE_NAME, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_cookies: int = DEFAULT_MAX_COOKIES, max_age: int = DEFAULT_MAX_AGE,
+                 compression_level: int = DEFAULT_COMPRESSION_LEVEL) -> None:
+        self.cookie_name = cookie_name
+        self.chunk_size = chunk_size
+        self.max_cookies = max_cookies
+        self.max_age = max_age
+        self.compression_level = compression_level
+        self._keys = {} # app secret key -> signing key
+        self._lock = Lock()
+        self.writes = 0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+        self.overflows = 0
+
+    @staticmethod
+    def from_config(codec_config) -> 'SessionCodec':
+        """build a codec from the optional 'session_codec' section of the aad config file"""
+        defaults = SessionCodec
+        return SessionCodec(getattr(codec_config, 'cookie_name', None) or defaults.DEFAULT_COOKIE_NAME,
+                            getattr(codec_config, 'chunk_size', None) or defaults.DEFAULT_CHUNK_SIZE,
+                            getattr(codec_config, 'max_cookies', None) or defaults.DEFAULT_MAX_COOKIES,
+                            getattr(codec_config, 'max_age', defaults.DEFAULT_MAX_AGE),
+                            getattr(codec_config, 'compression_level', None) or defaults.DEFAULT_COMPRESSION_LEVEL)
+
+    @property
+    def compression_ratio(self) -> float:
+        """json bytes per cookie byte written, over all writes"""
+        return self.raw_bytes / self.encoded_bytes if self.encoded_bytes else 0.0
+
+    def cookie_names(self, count: int) -> list:
+        return [self.cookie_name] + [f'{self.cookie_name}.{index}' for index in range(1, count)]
+
+    def _signature(self, body: str, secret_key) -> str:
+        key = self._keys.get(secret_key, None)
+        if key is None:
+            key = self._keys[secret_key] = derive_key(secret_key, b'session_codec')
+        digest = hmac.new(key, body.encode('ascii'), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+    def encode(self, encoded: dict, secret_key, instrumentation: 'Instrumentation' = None) -> dict:
+        """the cookies (name -> value) holding `encoded`, the session encoding of an identity context"""
+        raw = json.dumps(encoded, separators=(',', ':')).encode('utf-8')
+        payload = base64.urlsafe_b64encode(zlib.compress(raw, self.compression_level)).rstrip(b'=').decode('ascii')
+        body = f'{self.VERSION}.{int(time.time())}.{payload}'
+        signed = f'{body}.{self._signature(body, secret_key)}'
+        chunks = [signed[index:index + self.chunk_size] for index in range(0, len(signed), self.chunk_size)]
+        if len(chunks) > self.max_cookies:
+            with self._lock:
+                self.overflows += 1
+            raise ValueError(f"SessionCodec: the identity context needs {len(chunks)} cookies, "
+                             f"more than max_cookies ({self.max_cookies}). not written")
+        chunks[0] = f'{len(chunks)}.{chunks[0]}'
+        encoded_bytes = sum(len(chunk) for chunk in chunks)
+        with self._lock:
+            self.writes += 1
+            self.raw_bytes += len(raw)
+            self.encoded_bytes += encoded_bytes
+        if instrumentation is not None:
+            try:
+                instrumentation.record_session_size(len(raw), encoded_bytes, len(chunks))
+            except Exception:
+                pass # instrumentation must never break sign in
+        return dict(zip(self.cookie_names(len(chunks)), chunks))
+
+    def decode(self, cookies: Mapping, secret_key) -> dict:
+        """the session encoding of the identity context in the request's cookies, or None if there is none.
+        Raises ValueError if the cookies are incomplete, tampered with, or expired."""
+        first = cookies.get(self.cookie_name, None)
+        if not first:
+            return None
+        count, _, chunk = first.partition('.')
+        if not count.isdigit() or not 1 <= int(count) <= self.max_cookies:
+            raise ValueError("SessionCodec: malformed identity context cookie")
+        chunks = [chunk] + [cookies.get(name, None) for name in self.cookie_names(int(count))[1:]]
+        if None in chunks:
+            raise ValueError("SessionCodec: identity context cookies are incomplete")
+        body, _, signature = ''.join(chunks).rpartition('.')
+        if not hmac.compare_digest(signature, self._signature(body, secret_key)):
+            raise ValueError("SessionCodec: identity context cookies have an invalid signature")
+        version, issued_at, payload = body.split('.', 2)
+        if version != self.VERSION:
+            return None # written by an incompatible version: start over
+        if self.max_age is not None and time.time() - int(issued_at) > self.max_age:
+            raise ValueError("SessionCodec: identity context cookies have expired")
+        return json.loads(zlib.decompress(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))))
+
+    def stale_cookie_names(self, cookies: Mapping, count: int) -> list:
+        """the chunk cookies in the request that a new encoding of `count` cookies leaves over"""
+        names = self.cookie_names(self.max_cookies)
+        return [name for name in names[count:] if name in cookies]
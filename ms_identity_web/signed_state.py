@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from threading import Lock
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+from .errors import AuthSecurityError
+from .session_codec import derive_key
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+class SignedState(object):
+    """Stateless auth request state: instead of a uuid kept in the session, the `state` sent to the identity
+    provider is a token signed (HMAC-SHA256, key derived from the app's secret key) and time-limited, which
+    carries what the redirect needs: the nonce, the B2C policy and the post sign in url. Starting a sign in
+    then neither reads nor writes the session, and any app instance can verify the redirect.
+
+    Tokens are bound to the browser that started the sign in: each carries the hash of a random value held
+    in the `binding_cookie` (HttpOnly, SameSite=Lax), which the redirect must present. This keeps the login
+    CSRF protection of session-bound state: someone else's state and code can't be completed in your browser.
+
+    Tokens are redeemed once: verify() rejects a token this process has already verified (it remembers them
+    until they expire, at most `max_redeemed`), and a completed sign in clears the binding cookie, which
+    spends the browser's tokens on every worker."""
+    DEFAULT_MAX_AGE = 600 # seconds a user may take to sign in
+    DEFAULT_BINDING_COOKIE = 'ms_identity_web_state'
+    DEFAULT_MAX_REDEEMED = 100000
+
+    def __init__(self, max_age: int = DEFAULT_MAX_AGE, binding_cookie: str = DEFAULT_BINDING_COOKIE,
+                 max_redeemed: int = DEFAULT_MAX_REDEEMED) -> None:
+        self.max_age = max_age
+        self.binding_cookie = binding_cookie
+        self.max_redeemed = max_redeemed
+        self._keys = {} # app secret key -> signing key
+        self._lock = Lock()
+        self._redeemed = OrderedDict() # signature of a verified token -> when the token expires
+
+    @staticmethod
+    def from_config(state_config) -> 'SignedState':
+        """build it from the optional 'signed_state' section of the aad config file"""
+        return SignedState(getattr(state_config, 'max_age', None) or SignedState.DEFAULT_MAX_AGE,
+                           getattr(state_config, 'binding_cookie', None) or SignedState.DEFAULT_BINDING_COOKIE,
+                           getattr(state_config, 'max_redeemed', None) or SignedState.DEFAULT_MAX_REDEEMED)
+
+    def _signature(self, body: str, secret_key) -> str:
+        key = self._keys.get(secret_key, None)
+        if key is None:
+            key = self._keys[secret_key] = derive_key(secret_key, b'signed_state')
+        return _b64encode(hmac.new(key, body.encode('ascii'), hashlib.sha256).digest())
+
+    @staticmethod
+    def _binding_hash(binding: str) -> str:
+        return _b64encode(hashlib.sha256(binding.encode('utf-8')).digest()[:16])
+
+    def issue(self, claims: dict, binding: str, secret_key) -> str:
+        """a state token carrying `claims` (short keys: it travels in urls), bound to the binding cookie's value"""
+        payload = dict(claims, t=int(time.time()), b=self._binding_hash(binding))
+        body = _b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        return f'{body}.{self._signature(body, secret_key)}'
+
+    def _redeem(self, signature: str, expires_at: float) -> bool:
+        """record a token as redeemed. False if it already was"""
+        now = time.time()
+        with self._lock:
+            # expired tokens are rejected anyway: forget them (roughly in redemption order)
+            while self._redeemed and next(iter(self._redeemed.values())) <= now:
+                self._redeemed.popitem(last=False)
+            if signature in self._redeemed:
+                return False
+            self._redeemed[signature] = expires_at
+            while len(self._redeemed) > self.max_redeemed:
+                self._redeemed.popitem(last=False)
+            return True
+
+    def verify(self, token: str, binding: str, secret_key) -> dict:
+        """the claims of a state token issued by this app to this browser (binding: the binding cookie's
+        value) no longer than max_age ago, and not verified before. Raises AuthSecurityError otherwise."""
+        body, _, signature = (token or '').rpartition('.')
+        try:
+            valid = bool(body) and hmac.compare_digest(signature, self._signature(body, secret_key))
+            claims = json.loads(_b64decode(body)) if valid else None
+        except (ValueError, TypeError): # not ascii, not base64, not json: not ours
+            valid = False
+        if not valid:
+            raise AuthSecurityError("Failed to verify the signature of the request state")
+        if time.time() - claims.get('t', 0) > self.max_age:
+            raise AuthSecurityError("Request state has expired")
+        if not binding or not hmac.compare_digest(claims.get('b', ''), self._binding_hash(binding)):
+            raise AuthSecurityError("Request state was issued to another browser")
+        if not self._redeem(signature, claims.get('t', 0) + self.max_age):
+            raise AuthSecurityError("Request state has already been used")
+        return claims
@@ -0,0 +1,74 @@
+from threading import Event, Lock
+from typing import Any, Callable, Hashable, Tuple
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight(object):
+    """Coalesces concurrent calls with the same key: the first caller runs the call, callers that arrive
+    while it is in flight wait for it and share its result (or exception). Nothing is cached: a call
+    arriving after the first one finished runs again. Both methods return (result, shared)."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._calls = {} # key -> _Call
+        self._async_calls = {} # (event loop id, key) -> asyncio.Future
+        self.coalesced = 0
+
+    def do(self, key: Hashable, f: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """for threaded callers: waiting callers block until the first one is done"""
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = f(*args, **kwargs)
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: Hashable, coroutine_factory: Callable) -> Tuple[Any, bool]:
+        """for asyncio callers: waiting callers await the first one's future on the event loop"""
+        import asyncio # already loaded if we got here: imported on use to keep it off the startup path
+        loop = asyncio.get_running_loop()
+        async_key = (id(loop), key)
+        future = self._async_calls.get(async_key, None)
+        if future is not None:
+            self.coalesced += 1
+            # shield: a cancelled waiter mustn't cancel the call the others are waiting on
+            return await asyncio.shield(future), True
+
+        future = self._async_calls[async_key] = loop.create_future()
+        try:
+            result = await coroutine_factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as ex:
+            future.set_exception(ex)
+            future.exception() # mark as retrieved: there may be no waiters
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._async_calls[async_key]
+        return result, False
@@ -0,0 +1,77 @@
+from typing import Mapping
+
+from .client_pool import ConfidentialClientPool
+from .errors import AuthSecurityError
+
+class TenantResolver(object):
+    """Multi-tenant mode (authority_type MULTI_TENANT, with a multi-tenant authority such as
+    https://login.microsoftonline.com/organizations):
+    - resolves the tenant of a request from the signed-in user's ID token (`tid`), or from the domain of a
+      `login_hint` (`domains`: domain -> tenant id), so sign ins and token requests go to that tenant's authority
+    - validates the issuer of the ID tokens that sign users in: it must be their tenant's own issuer and, with
+      `allowed_tenants`, one of the allowed ones. Both are precomputed frozensets: the check is a set lookup
+    - keeps the per-tenant clients (and with each, its tenant's OpenID metadata) in a ConfidentialClientPool of
+      its own, bounded to `max_tenants`, so memory stays flat however many tenants sign in."""
+    DEFAULT_MAX_TENANTS = 256
+    DEFAULT_ISSUER = '{instance}/{tenant}/v2.0' # issuer of the v2.0 endpoint's tokens
+
+    def __init__(self, authority: str, allowed_tenants: list = None, domains: Mapping = None,
+                 max_tenants: int = DEFAULT_MAX_TENANTS, issuer: str = DEFAULT_ISSUER) -> None:
+        # e.g. https://login.microsoftonline.com/organizations -> https://login.microsoftonline.com
+        self.instance = authority.rstrip('/').rsplit('/', 1)[0]
+        self.issuer_template = issuer
+        # empty: any tenant may sign in
+        self.allowed_tenants = frozenset(tenant.lower() for tenant in allowed_tenants or ())
+        self._allowed_issuers = frozenset(self.issuer(tenant) for tenant in self.allowed_tenants)
+        self.domains = {domain.lower(): tenant.lower() for domain, tenant in (domains or {}).items()}
+        self.clients = ConfidentialClientPool(max_tenants)
+        self.rejected = 0
+
+    @staticmethod
+    def from_config(authority: str, tenants_config) -> 'TenantResolver':
+        """build it from the optional 'multi_tenant' section of the aad config file"""
+        if not tenants_config:
+            return TenantResolver(authority)
+        domains = getattr(tenants_config, 'domains', None)
+        return TenantResolver(authority,
+                              getattr(tenants_config, 'allowed_tenants', None),
+                              vars(domains) if domains is not None else None,
+                              getattr(tenants_config, 'max_tenants', None) or TenantResolver.DEFAULT_MAX_TENANTS,
+                              getattr(tenants_config, 'issuer', None) or TenantResolver.DEFAULT_ISSUER)
+
+    def issuer(self, tenant: str) -> str:
+        return self.issuer_template.format(instance=self.instance, tenant=tenant)
+
+    def authority(self, tenant: str) -> str:
+        return f'{self.instance}/{tenant}'
+
+    def is_allowed(self, tenant: str) -> bool:
+        return not self.allowed_tenants or tenant in self.allowed_tenants
+
+    def resolve(self, id_token_claims: dict = None, login_hint: str = None) -> str:
+        """the (allowed) tenant id for a signed-in user's claims or a login_hint, or None: the multi-tenant authority"""
+        tenant = id_token_claims.get('tid', None) if id_token_claims else None
+        if tenant:
+            tenant = tenant.lower()
+            return tenant if self.is_allowed(tenant) else None
+        if login_hint and '@' in login_hint:
+            return self.domains.get(login_hint.rpartition('@')[2].lower(), None)
+        return None
+
+    def validate_issuer(self, id_token_claims: dict) -> str:
+        """the tenant of an ID token whose issuer is its tenant's and allowed. Raises AuthSecurityError otherwise"""
+        claims = id_token_claims or {}
+        tenant, issuer = (claims.get('tid', None) or '').lower(), claims.get('iss', None)
+        if self.allowed_tenants:
+            valid = issuer in self._allowed_issuers and issuer == self.issuer(tenant)
+        else:
+            valid = bool(tenant) and issuer == self.issuer(tenant)
+        if not valid:
+            self.rejected += 1
+            raise AuthSecurityError(f"ID token issuer {issuer} is not an allowed tenant")
+        return tenant
+
+    def client_config(self, tenant: str, client_config: Mapping) -> tuple:
+        """(ConfidentialClientApplication kwargs, client pool key) for the tenant's authority"""
+        client_config = dict(client_config, authority=self.authority(tenant))
+        return client_config, ConfidentialClientPool.make_key(client_config)
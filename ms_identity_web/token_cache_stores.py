@@ -0,0 +1,224 @@
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from threading import RLock, local
+from hashlib import sha256
+from typing import Iterator
+import json
+import os
+import time
+
+from .constants import TokenCacheStoreType
+
+class TokenCacheStore(metaclass=ABCMeta):
+    """Server-side home for serialized msal token caches, keyed by the account's home_account_id.
+    With a store configured, the session only carries the home_account_id instead of the whole cache.
+    Extend this to add more backends (e.g. redis)."""
+
+    @abstractmethod
+    def load(self, key: str) -> str:
+        """return the serialized token cache saved under key, or None"""
+        pass
+
+    @abstractmethod
+    def save(self, key: str, serialized_cache: str) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    def contains(self, key: str) -> bool:
+        """whether a cache is saved under key. Cheaper than load() in the stores below"""
+        return self.load(key) is not None
+
+    DEFAULT_BATCH_SIZE = 500
+
+    def iter_batches(self, batch_size: int = DEFAULT_BATCH_SIZE, updated_before: float = None,
+                     key_suffix: str = None) -> Iterator[list]:
+        """the (key, updated_at) of the saved caches, in lists of at most batch_size, read from the store
+        batch by batch. Only those saved before `updated_before` (a timestamp) and whose key ends with
+        `key_suffix`, if given. Deleting the keys of a batch while iterating is fine."""
+        raise NotImplementedError
+
+    def delete_many(self, keys: list) -> None:
+        for key in keys:
+            self.delete(key)
+
+    @staticmethod
+    def from_config(store_config) -> 'TokenCacheStore':
+        """build a store from the optional 'token_cache_store' section of the aad config file"""
+        store_type = TokenCacheStoreType(store_config.type)
+        if store_type is TokenCacheStoreType.MEMORY:
+            return InMemoryTokenCacheStore(getattr(store_config, 'max_size', None) or InMemoryTokenCacheStore.DEFAULT_MAX_SIZE)
+        if store_type is TokenCacheStoreType.SQLITE:
+            return SQLiteTokenCacheStore(store_config.path)
+        return FileSystemTokenCacheStore(store_config.path)
+
+class InMemoryTokenCacheStore(TokenCacheStore):
+    """Per-process LRU store. Only suitable for single-process deployments (or dev)."""
+    DEFAULT_MAX_SIZE = 1024
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self._lock = RLock()
+        self._entries = OrderedDict() # key -> (serialized cache, updated at)
+
+    def load(self, key: str) -> str:
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def save(self, key: str, serialized_cache: str) -> None:
+        with self._lock:
+            self._entries[key] = (serialized_cache, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def contains(self, key: str) -> bool:
+        return key in self._entries
+
+    def iter_batches(self, batch_size: int = TokenCacheStore.DEFAULT_BATCH_SIZE, updated_before: float = None,
+                     key_suffix: str = None) -> Iterator[list]:
+        # a snapshot of the keys: no more than the max_size entries the store holds anyway
+        with self._lock:
+            entries = [(key, updated_at) for key, (_, updated_at) in self._entries.items()
+                       if (updated_before is None or updated_at < updated_before)
+                       and (not key_suffix or key.endswith(key_suffix))]
+        for index in range(0, len(entries), batch_size):
+            yield entries[index:index + batch_size]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteTokenCacheStore(TokenCacheStore):
+    """Store backed by a sqlite database file, which can be shared by all worker processes on a host."""
+    TABLE = 'ms_identity_web_token_cache'
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = local()
+        with self._connection() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.TABLE} '
+                         '(key TEXT PRIMARY KEY, cache TEXT NOT NULL, updated_at REAL NOT NULL)')
+
+    def _connection(self) -> 'sqlite3.Connection':
+        # sqlite connections must not be shared across threads or forked processes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, key: str) -> str:
+        row = self._connection().execute(f'SELECT cache FROM {self.TABLE} WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, key: str, serialized_cache: str) -> None:
+        with self._connection() as conn:
+            conn.execute(f'INSERT OR REPLACE INTO {self.TABLE} (key, cache, updated_at) VALUES (?, ?, ?)',
+                         (key, serialized_cache, time.time()))
+
+    def delete(self, key: str) -> None:
+        with self._connection() as conn:
+            conn.execute(f'DELETE FROM {self.TABLE} WHERE key = ?', (key,))
+
+    def contains(self, key: str) -> bool:
+        return self._connection().execute(f'SELECT 1 FROM {self.TABLE} WHERE key = ?', (key,)).fetchone() is not None
+
+    def delete_many(self, keys: list) -> None:
+        with self._connection() as conn:
+            conn.executemany(f'DELETE FROM {self.TABLE} WHERE key = ?', [(key,) for key in keys])
+
+    def iter_batches(self, batch_size: int = TokenCacheStore.DEFAULT_BATCH_SIZE, updated_before: float = None,
+                     key_suffix: str = None) -> Iterator[list]:
+        # keyset pagination on the primary key: each batch is one indexed range query
+        conditions, params = ['key > ?'], []
+        if updated_before is not None:
+            conditions.append('updated_at < ?')
+            params.append(updated_before)
+        if key_suffix:
+            conditions.append("key LIKE ? ESCAPE '\\'")
+            escaped = key_suffix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f'%{escaped}')
+        query = f'SELECT key, updated_at FROM {self.TABLE} WHERE {" AND ".join(conditions)} ORDER BY key LIMIT ?'
+        last_key = ''
+        while True:
+            batch = self._connection().execute(query, (last_key, *params, batch_size)).fetchall()
+            if not batch:
+                return
+            yield batch
+            last_key = batch[-1][0]
+
+class FileSystemTokenCacheStore(TokenCacheStore):
+    """Store keeping one file per account in a directory (e.g. on a volume shared by workers).
+    File names are hashes of the key; writes are atomic."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, key: str) -> str:
+        try:
+            with open(self._path(key), 'r') as f:
+                return json.load(f)['cache']
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def save(self, key: str, serialized_cache: str) -> None:
+        import tempfile
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'key': key, 'cache': serialized_cache}, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def iter_batches(self, batch_size: int = TokenCacheStore.DEFAULT_BATCH_SIZE, updated_before: float = None,
+                     key_suffix: str = None) -> Iterator[list]:
+        # the directory is scanned lazily; a file's mtime is when its cache was saved
+        batch = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    updated_at = entry.stat().st_mtime
+                    if updated_before is not None and updated_at >= updated_before:
+                        continue
+                    with open(entry.path, 'r') as f:
+                        key = json.load(f)['key']
+                except (FileNotFoundError, ValueError, KeyError):
+                    continue # deleted meanwhile, or not one of ours
+                if key_suffix and not key.endswith(key_suffix):
+                    continue
+                batch.append((key, updated_at))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
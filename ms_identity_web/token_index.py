@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from threading import RLock
+from typing import Callable, Hashable
+import time
+
+class AccessTokenIndex(object):
+    """In-process index of the access tokens acquired for each (home_account_id, tenant, scopes), with their
+    expiry. acquire_token_silently answers from here in O(1) while the token is valid for at least another
+    `refresh_margin` seconds, without touching (deserializing, searching, re-serializing) the msal
+    token cache. `tenant` is the tenant the token is from in multi-tenant mode (a guest account has
+    tokens from several), None otherwise. Holds at most `max_size` entries (LRU)."""
+    DEFAULT_MAX_SIZE = 4096
+    DEFAULT_REFRESH_MARGIN = 5 * 60
+    # msal adds these to every request and doesn't report them as access token scopes
+    RESERVED_SCOPES = frozenset(('openid', 'profile', 'offline_access'))
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, refresh_margin: float = DEFAULT_REFRESH_MARGIN) -> None:
+        self.max_size = max_size
+        self.refresh_margin = refresh_margin
+        self._lock = RLock()
+        self._entries = OrderedDict() # (home_account_id, tenant, scopes) -> [access_token, expires_on, read since put]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def from_config(index_config) -> 'AccessTokenIndex':
+        """build an index from the optional 'access_token_index' section of the aad config file"""
+        if not index_config:
+            return AccessTokenIndex()
+        return AccessTokenIndex(getattr(index_config, 'max_size', None) or AccessTokenIndex.DEFAULT_MAX_SIZE,
+                                getattr(index_config, 'refresh_margin', None) or AccessTokenIndex.DEFAULT_REFRESH_MARGIN)
+
+    @classmethod
+    def normalize_scopes(cls, scopes: list) -> frozenset:
+        return frozenset(scope.strip().lower() for scope in scopes or ()) - cls.RESERVED_SCOPES
+
+    def get(self, home_account_id: str, scopes: list, tenant: str = None) -> str:
+        """the indexed access token if it is valid for at least refresh_margin more seconds, else None"""
+        key = (home_account_id, tenant, self.normalize_scopes(scopes))
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None and entry[1] - self.refresh_margin > time.time():
+                self._entries.move_to_end(key)
+                entry[2] = True
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, home_account_id: str, scopes: list, access_token: str, expires_in: int, tenant: str = None) -> None:
+        key = (home_account_id, tenant, self.normalize_scopes(scopes))
+        with self._lock:
+            self._entries[key] = [access_token, time.time() + int(expires_in), False]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def was_read(self, home_account_id: str, scopes: list, tenant: str = None) -> bool:
+        """whether the indexed token has been handed out since it was indexed (i.e. the user is active)"""
+        entry = self._entries.get((home_account_id, tenant, self.normalize_scopes(scopes)), None)
+        return entry is not None and entry[2]
+
+    def invalidate(self, home_account_id: str) -> None:
+        self.invalidate_matching(lambda account_key: account_key == home_account_id)
+
+    def invalidate_matching(self, predicate: Callable[[Hashable], bool]) -> None:
+        """drop the tokens of every account whose key predicate(key) is true"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key[0])]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
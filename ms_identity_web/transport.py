@@ -0,0 +1,148 @@
+from threading import Lock, local
+from typing import Callable
+import os
+
+def pooled_session(max_hosts: int, max_connections_per_host: int, max_retries: int = 0,
+                   on_connect: Callable[[], None] = None) -> 'requests.Session':
+    """a requests.Session that keeps up to max_connections_per_host keep-alive connections to each of
+    up to max_hosts hosts, and makes callers wait for a free connection rather than open more. It keeps
+    no cookies. on_connect is called whenever a connection (TCP, and TLS for https) is set up."""
+    from http.cookiejar import DefaultCookiePolicy # imports urllib.request: kept off the startup path, as requests
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    class PooledAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs) -> None:
+            super().init_poolmanager(*args, **kwargs)
+            if on_connect is not None:
+                self.poolmanager.pool_classes_by_scheme = _connect_counting_pool_classes(on_connect)
+
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = PooledAdapter(pool_connections=max_hosts, pool_maxsize=max_connections_per_host,
+                            pool_block=True, max_retries=max_retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def _connect_counting_pool_classes(on_connect: Callable[[], None]) -> dict:
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def counting(pool_class: type) -> type:
+        class ConnectCountingConnection(pool_class.ConnectionCls):
+            def connect(self) -> None:
+                on_connect()
+                super().connect()
+
+        return type(pool_class.__name__, (pool_class,), {'ConnectionCls': ConnectCountingConnection})
+    return {'http': counting(HTTPConnectionPool), 'https': counting(HTTPSConnectionPool)}
+
+class PooledTransport(object):
+    """The http_client of every msal client (see _client_factory): authority discovery, OpenID metadata,
+    code redemption and token refreshes all go over one keep-alive requests.Session per process (a new one
+    in forked children), so they reuse connections instead of setting up TCP and TLS on the sign-in path.
+    - at most `max_connections_per_host` connections to each of up to `max_hosts` hosts; callers wait for
+      a free connection rather than opening more
+    - every call gets the (`connect_timeout`, `read_timeout`) timeouts unless msal passes its own
+    - `requests`, `connections` (set up) and `reused` counters, `reuse_ratio`; each request is also
+      reported to the `instrumentation` (see instrumentation.py), if any
+    msal ignores the client's `verify`, `proxies` and `timeout` options when it is given an http_client:
+    from_config applies them here."""
+    DEFAULT_MAX_CONNECTIONS_PER_HOST = 10
+    DEFAULT_MAX_HOSTS = 10
+    DEFAULT_CONNECT_TIMEOUT = 3.05
+    DEFAULT_READ_TIMEOUT = 30
+    MAX_RETRIES = 1 # connection errors, as msal's default transport
+
+    def __init__(self, max_connections_per_host: int = DEFAULT_MAX_CONNECTIONS_PER_HOST, max_hosts: int = DEFAULT_MAX_HOSTS,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 verify=True, proxies: dict = None) -> None:
+        self.max_connections_per_host = max_connections_per_host
+        self.max_hosts = max_hosts
+        self.timeout = (connect_timeout, read_timeout)
+        self.verify = verify
+        self.proxies = proxies
+        self.instrumentation = None
+        self._lock = Lock()
+        self._local = local() # whether the current thread's request set up a connection
+        self._session = None
+        self._pid = None
+        self.requests = 0
+        self.connections = 0
+
+    @staticmethod
+    def from_config(transport_config, client_config=None) -> 'PooledTransport':
+        """build a transport from the optional 'http_transport' section of the aad config file,
+        with the `verify`, `proxies` and `timeout` msal options of its 'client' section"""
+        defaults = PooledTransport
+        client_timeout = getattr(client_config, 'timeout', None)
+        if isinstance(client_timeout, (int, float)):
+            client_timeout = (client_timeout, client_timeout)
+        connect_timeout, read_timeout = client_timeout or (defaults.DEFAULT_CONNECT_TIMEOUT, defaults.DEFAULT_READ_TIMEOUT)
+        verify, proxies = getattr(client_config, 'verify', True), getattr(client_config, 'proxies', None)
+        return PooledTransport(
+            getattr(transport_config, 'max_connections_per_host', None) or defaults.DEFAULT_MAX_CONNECTIONS_PER_HOST,
+            getattr(transport_config, 'max_hosts', None) or defaults.DEFAULT_MAX_HOSTS,
+            getattr(transport_config, 'connect_timeout', None) or connect_timeout,
+            getattr(transport_config, 'read_timeout', None) or read_timeout,
+            True if verify is None else verify,
+            vars(proxies) if proxies is not None and not isinstance(proxies, dict) else proxies)
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.connections, 0)
+
+    @property
+    def reuse_ratio(self) -> float:
+        """share of the requests sent over a connection that was already set up"""
+        return self.reused / self.requests if self.requests else 0.0
+
+    @property
+    def session(self) -> 'requests.Session':
+        # built on first use (requests is imported then), and again in forked children: sockets aren't shared
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = pooled_session(self.max_hosts, self.max_connections_per_host, self.MAX_RETRIES, self._on_connect)
+                    session.verify = self.verify
+                    if self.proxies:
+                        session.proxies.update(self.proxies)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _on_connect(self) -> None:
+        self._local.connected = True
+        with self._lock:
+            self.connections += 1
+
+    def _send(self, method: str, url: str, **kwargs) -> 'requests.Response':
+        if kwargs.get('timeout', None) is None:
+            kwargs['timeout'] = self.timeout
+        session = self.session
+        self._local.connected = False
+        try:
+            return session.request(method, url, **kwargs)
+        finally:
+            reused = not self._local.connected
+            with self._lock:
+                self.requests += 1
+            instrumentation = self.instrumentation
+            if instrumentation is not None:
+                try:
+                    instrumentation.record_http_request(reused)
+                except Exception:
+                    pass # instrumentation must never break sign in
+
+    # msal http_client interface
+    def get(self, url: str, params: dict = None, headers: dict = None, **kwargs) -> 'requests.Response':
+        return self._send('GET', url, params=params, headers=headers, **kwargs)
+
+    def post(self, url: str, params: dict = None, data=None, headers: dict = None, **kwargs) -> 'requests.Response':
+        return self._send('POST', url, params=params, data=data, headers=headers, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -7,6 +7,14 @@ setup(name='ms_identity_web',
       url='https://github.com/azure-samples/ms-identity-python-utilities',
       packages=find_packages(),
       install_requires=['msal>=1.6.0,<2'],
+      # framework integrations and exporters are optional, and imported only when used
+      extras_require={
+          'flask': ['flask>=1.0'],
+          'django': ['django>=2.2'],
+          'opentelemetry': ['opentelemetry-api>=1.0'],
+          # tests/ run against the mock identity provider and stub API in benchmarks/
+          'test': ['pytest', 'flask>=1.0', 'django>=2.2', 'requests', 'cryptography'],
+      },
      )
 
 
@@ -0,0 +1,133 @@
+"""Shared fixtures: the mock identity provider and stub API of benchmarks/, served in-process over loopback,
+and Flask apps wired up to them the way the README describes."""
+from urllib.parse import urlencode, urlparse, parse_qs
+import os
+import sys
+
+import pytest
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, BENCHMARKS_DIR)
+
+@pytest.fixture(scope='session')
+def mock_idp():
+    """a MockIdentityProviderServer: signs a new user in on every authorize request (round-robin)"""
+    from mock_idp_server import MockIdentityProviderServer
+    server = MockIdentityProviderServer(users=100000).start()
+    previous = os.environ.get('REQUESTS_CA_BUNDLE', None)
+    os.environ['REQUESTS_CA_BUNDLE'] = server.ca_bundle # msal requires https authorities
+    yield server
+    server.shutdown()
+    if previous is None:
+        os.environ.pop('REQUESTS_CA_BUNDLE', None)
+    else:
+        os.environ['REQUESTS_CA_BUNDLE'] = previous
+
+@pytest.fixture(scope='session')
+def stub_api():
+    """a StubApiServer: a downstream API that answers 401 to tokens revoked through its POST /revoke"""
+    from stub_api_server import StubApiServer
+    server = StubApiServer().start()
+    yield server
+    server.shutdown()
+
+@pytest.fixture
+def aad_config(mock_idp):
+    """the sample flask config, pointed at the mock identity provider"""
+    from load_test_apps import load_config
+    return load_config('flask', mock_idp.authority)
+
+@pytest.fixture
+def flask_app(aad_config):
+    """make(config=None, **IdentityWebPython kwargs) -> (app, ms_identity_web). The app serves '/' and
+    '/token', which returns the signed-in user's oid and access token from acquire_token_silently"""
+    def make(config=None, **identity_web_kwargs):
+        from flask import Flask
+        from ms_identity_web import IdentityWebPython
+        from ms_identity_web.adapters import FlaskContextAdapter
+        app = Flask(__name__)
+        app.secret_key = 'test-secret-key'
+        ms_identity_web = IdentityWebPython(config or aad_config, FlaskContextAdapter(app), **identity_web_kwargs)
+
+        @app.route('/')
+        def index():
+            return 'index'
+
+        @app.route('/token')
+        def token():
+            result = ms_identity_web.acquire_token_silently()
+            return {'oid': ms_identity_web.id_data.id_token_claims.get('oid', None),
+                    'access_token': result.get('access_token', None), 'error': result.get('error', None)}
+
+        return app, ms_identity_web
+    return make
+
+@pytest.fixture
+def sign_in():
+    """sign_in(test_client, login_hint=None, sign_in_path='/auth/sign_in') -> the response to the auth redirect.
+    Goes through the identity provider as a browser would. The mock signs a new user in, or the one of
+    login_hint `user<index>@contoso.example`, whoever is signed in already"""
+    import requests
+
+    def sign_in(client, login_hint: str = None, sign_in_path: str = '/auth/sign_in'):
+        authorize_url = urlparse(client.get(sign_in_path).headers['Location'])
+        params = parse_qs(authorize_url.query)
+        params.pop('login_hint', None)
+        if login_hint:
+            params['login_hint'] = [login_hint]
+        authorize_url = authorize_url._replace(query=urlencode(params, doseq=True)).geturl()
+        redirect_url = urlparse(requests.get(authorize_url, allow_redirects=False).headers['Location'])
+        return client.get(f'{redirect_url.path}?{redirect_url.query}')
+    return sign_in
+
+@pytest.fixture
+def django_app(mock_idp):
+    """make(config=None, **IdentityWebPython kwargs) -> (django test client, ms_identity_web). Serves '/' (named
+    'index'), the MsalViews under /auth, '/token' as the flask app does, and '/sign_in_as?login_hint=' (sign in with a login_hint).
+    Django is configured once per process: each app swaps in its own IdentityWebPython and urls"""
+    import django
+    from django.conf import settings
+    from django.http import HttpResponse, JsonResponse
+    from django.shortcuts import redirect
+    from django.test import Client
+    from django.urls import clear_url_caches, include, path, reverse
+    import load_test_apps
+    if not settings.configured:
+        settings.configure(SECRET_KEY='test-secret-key', ALLOWED_HOSTS=['*'], ROOT_URLCONF='load_test_apps',
+                           INSTALLED_APPS=['django.contrib.sessions'],
+                           SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+                           MIDDLEWARE=['django.contrib.sessions.middleware.SessionMiddleware',
+                                       'ms_identity_web.django.middleware.MsalMiddleware'])
+        django.setup()
+
+    def make(config=None, **identity_web_kwargs):
+        from ms_identity_web import IdentityWebPython
+        from ms_identity_web.django.msal_views_and_urls import MsalViews
+        ms_identity_web = IdentityWebPython(config or load_test_apps.load_config('django', mock_idp.authority),
+                                            **identity_web_kwargs)
+        settings.MS_IDENTITY_WEB = ms_identity_web # read by each client's MsalMiddleware
+
+        def token(request):
+            try:
+                result = ms_identity_web.acquire_token_silently()
+            except Exception as ex:
+                result = {'error': str(ex)}
+            return JsonResponse({'oid': ms_identity_web.id_data.id_token_claims.get('oid', None),
+                                 'access_token': result.get('access_token', None), 'error': result.get('error', None)})
+
+        def sign_in_as(request):
+            return redirect(ms_identity_web.get_auth_url(redirect_uri=request.build_absolute_uri(reverse('redirect')),
+                                                         login_hint=request.GET['login_hint']))
+
+        prefix = ms_identity_web.aad_config.django.auth_endpoints.prefix
+        load_test_apps.urlpatterns[:] = [
+            path('', lambda request: HttpResponse('index'), name='index'),
+            path('token', token),
+            path('sign_in_as', sign_in_as),
+            path(f'{prefix}/', include(MsalViews(ms_identity_web).url_patterns())),
+        ]
+        clear_url_caches()
+        return Client(raise_request_exception=False), ms_identity_web
+    yield make
+    load_test_apps.urlpatterns.clear()
+    clear_url_caches()
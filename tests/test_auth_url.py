@@ -0,0 +1,60 @@
+"""Auth urls rendered from AuthUrlTemplates must be byte-identical to msal's get_authorization_request_url."""
+from msal import ConfidentialClientApplication
+import pytest
+
+from fake_idp import FakeIdentityProvider
+from ms_identity_web.auth_url import AuthUrlTemplate, AuthUrlTemplateCache
+
+AUTHORITIES = {
+    'single tenant': 'https://login.fake/fake-tenant-id',
+    'organizations': 'https://login.fake/organizations',
+    'common': 'https://login.fake/common',
+    'b2c sign up sign in': 'https://contoso.b2clogin.com/contoso.onmicrosoft.com/B2C_1_susi',
+    'b2c password reset': 'https://contoso.b2clogin.com/tfp/contoso.onmicrosoft.com/B2C_1_password_reset',
+}
+OPTIONS = { # the scopes are always passed: get_auth_url has the configured ones
+    'no scopes': {'scopes': []},
+    'scopes': {'scopes': ['User.Read', 'https://graph.microsoft.com/Mail.Read']},
+    'redirect uri': {'scopes': [], 'redirect_uri': 'https://app.example/auth/redirect?next=/a b'},
+    'prompt': {'scopes': ['User.Read'], 'prompt': 'select_account'},
+    'prompt login and domain hint': {'scopes': [], 'prompt': 'login', 'domain_hint': 'contoso.example',
+                                     'response_mode': 'form_post'},
+    'everything': {'scopes': ['api://app/.default'], 'redirect_uri': 'http://localhost:5000/auth/redirect',
+                   'prompt': 'consent', 'max_age': 600, 'response_type': 'code'},
+}
+SLOT_VALUES = [
+    {},
+    {'state': 'f7c8e1f2-5c1d-4bd8-9a33-2b3a4b6c8d9e'},
+    {'state': 'eyJhbGciOi.Jz~_-.sig==', 'nonce': 'n0nce', 'login_hint': 'user1@contoso.example'},
+    {'state': 'a&b=c d/é?#', 'login_hint': 'first.last+tag@contoso.com'},
+    {'nonce': '12345', 'login_hint': None},
+]
+
+@pytest.fixture(scope='module')
+def clients():
+    fake_idp = FakeIdentityProvider()
+    return {authority: ConfidentialClientApplication('client-id', client_credential='secret', authority=authority,
+                                                     validate_authority=False, http_client=fake_idp)
+            for authority in AUTHORITIES.values()}
+
+@pytest.mark.parametrize('options', OPTIONS.values(), ids=OPTIONS.keys())
+@pytest.mark.parametrize('authority', AUTHORITIES.values(), ids=AUTHORITIES.keys())
+def test_rendered_url_is_msals(clients, authority, options):
+    client = clients[authority]
+    template = AuthUrlTemplate.compile(client, options)
+    assert template is not None
+    for values in SLOT_VALUES:
+        expected = client.get_authorization_request_url(**options, **{k: v for k, v in values.items() if v is not None})
+        assert template.render(values) == expected
+
+@pytest.mark.parametrize('authority', AUTHORITIES.values(), ids=AUTHORITIES.keys())
+def test_template_cache_returns_msals_url(clients, authority):
+    client = clients[authority]
+    templates = AuthUrlTemplateCache()
+    for options in OPTIONS.values():
+        for values in SLOT_VALUES:
+            auth_req_options = dict(options, **values)
+            expected = client.get_authorization_request_url(**{k: v for k, v in auth_req_options.items() if v is not None})
+            assert templates.get_url(authority, auth_req_options, lambda: client) == expected
+    assert templates.misses == len(OPTIONS)
+    assert templates.hits == len(OPTIONS) * (len(SLOT_VALUES) - 1)
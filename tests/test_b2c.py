@@ -0,0 +1,40 @@
+"""B2C: every token request goes to the sign in policy's authority, on sign in as on silent, scheduled
+and bulk refreshes (the bare B2C authority has no token endpoint)."""
+from types import SimpleNamespace
+
+import pytest
+
+from ms_identity_web import TokenStoreMaintenance
+from ms_identity_web.token_cache_stores import InMemoryTokenCacheStore
+
+@pytest.fixture
+def token_requests(mock_idp, monkeypatch):
+    """paths of the token requests the mock identity provider receives"""
+    paths, respond = [], mock_idp.respond
+
+    def recording_respond(method, path, *args, **kwargs):
+        if path.endswith('/oauth2/v2.0/token'):
+            paths.append(path)
+        return respond(method, path, *args, **kwargs)
+    monkeypatch.setattr(mock_idp, 'respond', recording_respond)
+    return paths
+
+@pytest.fixture
+def b2c_app(flask_app, aad_config):
+    aad_config.type.authority_type = 'B2C'
+    aad_config.b2c = SimpleNamespace(susi='/b2c_1_susi', password='/b2c_1_reset', profile='/b2c_1_edit_profile')
+    app, ms_identity_web = flask_app(aad_config, token_cache_store=InMemoryTokenCacheStore())
+
+    @app.route('/refresh')
+    def refresh():
+        return {'access_token': ms_identity_web.acquire_token_silently(force_refresh=True)['access_token']}
+
+    return app, ms_identity_web
+
+def test_token_requests_go_to_the_sign_in_policy(b2c_app, mock_idp, sign_in, token_requests):
+    app, ms_identity_web = b2c_app
+    client = app.test_client()
+    sign_in(client)
+    assert client.get('/refresh').json['access_token']
+    assert TokenStoreMaintenance(ms_identity_web).refresh() == {'refreshed': 1, 'skipped': 0, 'failed': 0}
+    assert token_requests == [f'/{mock_idp.idp.tenant_id}/b2c_1_susi/oauth2/v2.0/token'] * 3
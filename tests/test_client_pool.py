@@ -0,0 +1,121 @@
+"""Concurrent requests share pooled msal clients (and their RequestBoundTokenCache): none may ever see
+another request's tokens."""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Lock
+
+from msal import SerializableTokenCache
+
+from fake_idp import FakeIdentityProvider
+from ms_identity_web.client_pool import ConfidentialClientPool, RequestBoundTokenCache
+
+THREADS = 16
+ROUNDS = 20
+
+class LockedIdentityProvider(FakeIdentityProvider):
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = Lock()
+
+    def handle(self, *args, **kwargs):
+        with self._lock:
+            return super().handle(*args, **kwargs)
+
+def test_pooled_client_reads_and_writes_each_threads_own_token_cache():
+    idp = LockedIdentityProvider()
+    pool = ConfidentialClientPool(max_size=1)
+    client_config = {'client_id': 'client-id', 'client_credential': 'secret',
+                     'authority': 'https://login.fake/fake-tenant-id', 'validate_authority': False}
+    barrier = Barrier(THREADS)
+
+    def request(index: int) -> list:
+        user = FakeIdentityProvider.make_user(index)
+        RequestBoundTokenCache.bind(SerializableTokenCache())
+        client = pool.get(client_config, http_client=idp)
+        barrier.wait() # every thread holds the same client from here on
+        seen = []
+        for _ in range(ROUNDS):
+            code = idp.issue_code(user)
+            result = client.acquire_token_by_authorization_code(code, ['User.Read'], 'http://localhost/redirect')
+            account, = client.get_accounts()
+            refreshed = client.acquire_token_silent(['User.Read'], account, force_refresh=True)
+            seen += [result['id_token_claims']['oid'], account['local_account_id'], refreshed['id_token_claims']['oid']]
+        return seen
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        results = list(executor.map(request, range(THREADS)))
+    assert len(pool) == 1
+    for index, seen in enumerate(results):
+        assert set(seen) == {FakeIdentityProvider.make_user(index)['oid']}
+
+def test_concurrent_requests_only_get_their_own_users_tokens(flask_app, sign_in):
+    app, ms_identity_web = flask_app()
+
+    @app.route('/refresh')
+    def refresh():
+        # through msal and the pooled client every time, never the access token index
+        result = ms_identity_web.acquire_token_silently(force_refresh=True)
+        return {'result_oid': result['id_token_claims']['oid'],
+                'context_oid': ms_identity_web.id_data.id_token_claims['oid'],
+                'access_token': result['access_token'], 'context_access_token': ms_identity_web.id_data.access_token}
+
+    barrier = Barrier(THREADS)
+
+    def browser(index: int) -> list:
+        client = app.test_client()
+        sign_in(client, f'user{910000 + index}@contoso.example')
+        barrier.wait()
+        responses = [client.get('/refresh').json for _ in range(ROUNDS)]
+        return [(r['result_oid'], r['context_oid'], r['access_token'] == r['context_access_token']) for r in responses]
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        results = list(executor.map(browser, range(THREADS)))
+    for index, seen in enumerate(results):
+        oid = FakeIdentityProvider.make_user(910000 + index)['oid']
+        assert set(seen) == {(oid, oid, True)}
+
+def test_instances_sharing_a_config_get_clients_on_their_own_transport(aad_config):
+    from types import SimpleNamespace
+    from ms_identity_web import IdentityWebPython
+    first = IdentityWebPython(aad_config)
+    aad_config.http_transport = SimpleNamespace(max_connections_per_host=2, read_timeout=5)
+    second = IdentityWebPython(aad_config)
+    assert first._transport is not second._transport
+
+    first.warm_up()
+    second.warm_up() # fetches the metadata again, over its own transport
+    assert first._transport.requests == second._transport.requests == 1
+    first_client, second_client = first._client_factory(), second._client_factory()
+    assert first_client is not second_client
+    assert first._client_factory() is first_client and second._client_factory() is second_client
+    assert second._transport.timeout[1] == 5
+
+def test_concurrent_django_requests_only_see_their_own_identity_context(django_app, sign_in):
+    from django.http import JsonResponse
+    from django.urls import clear_url_caches, path
+    import load_test_apps
+    client, ms_identity_web = django_app()
+    in_flight = Barrier(THREADS)
+
+    def whoami(request):
+        # every thread's request is inside its view (its adapter bound) before any of them reads its identity
+        in_flight.wait(timeout=10)
+        adapter = ms_identity_web._adapter
+        return JsonResponse({'adapter_request': adapter.request is request,
+                             'oid': ms_identity_web.id_data.id_token_claims.get('oid', None),
+                             'request_oid': request.identity_context_data.id_token_claims.get('oid', None)})
+
+    load_test_apps.urlpatterns.append(path('whoami', whoami))
+    clear_url_caches()
+    clients = [client.__class__() for _ in range(THREADS)] # a browser (and MsalMiddleware) each
+    for index, browser in enumerate(clients):
+        assert sign_in(browser, f'user{940000 + index}@contoso.example').status_code == 302
+
+    def browser(index: int) -> list:
+        return [clients[index].get('/whoami').json() for _ in range(ROUNDS)]
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        results = list(executor.map(browser, range(THREADS)))
+    for index, seen in enumerate(results):
+        oid = FakeIdentityProvider.make_user(940000 + index)['oid']
+        assert seen == [{'adapter_request': True, 'oid': oid, 'request_oid': oid}] * ROUNDS
+    assert ms_identity_web._bound_adapter.get() is None # unbound once the requests are done
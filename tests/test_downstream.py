@@ -0,0 +1,43 @@
+"""call_downstream_api against the stub API: a token the API rejects is refreshed, and the call retried once."""
+
+def downstream_app(flask_app, stub_api):
+    app, ms_identity_web = flask_app()
+
+    @app.route('/api', methods=['GET', 'POST'])
+    def api():
+        from flask import request
+        response = ms_identity_web.call_downstream_api(request.method, f'{stub_api.url}{request.args["path"]}')
+        return {'status': response.status_code, 'body': response.json()}
+
+    return app, ms_identity_web
+
+def test_calls_are_sent_with_the_users_access_token(flask_app, stub_api, sign_in):
+    app, ms_identity_web = downstream_app(flask_app, stub_api)
+    client = app.test_client()
+    sign_in(client)
+    access_token = client.get('/token').json['access_token']
+    responses = [client.get('/api?path=/me').json for _ in range(3)]
+    assert {(r['status'], r['body']['token']) for r in responses} == {(200, access_token)}
+    # over one kept-alive connection
+    assert [r['body']['connection_requests'] for r in responses] == [1, 2, 3]
+    assert ms_identity_web._downstream_api.retries == 0
+
+def test_rejected_token_is_refreshed_and_the_call_retried_once(flask_app, stub_api, sign_in):
+    app, ms_identity_web = downstream_app(flask_app, stub_api)
+    downstream_api = ms_identity_web._downstream_api
+    client = app.test_client()
+    sign_in(client)
+    revoked = client.get('/token').json['access_token']
+    assert client.post('/api?path=/revoke').json == {'status': 200, 'body': {'revoked': revoked}}
+
+    requests = downstream_api.requests
+    response = client.get('/api?path=/me').json
+    assert response['status'] == 200
+    refreshed = response['body']['token']
+    assert refreshed != revoked
+    assert (downstream_api.requests - requests, downstream_api.retries) == (2, 1)
+
+    # the refreshed token is the session's (and the index's) from now on: no more retries
+    assert client.get('/token').json['access_token'] == refreshed
+    assert client.get('/api?path=/me').json['body']['token'] == refreshed
+    assert (downstream_api.requests - requests, downstream_api.retries) == (3, 1)
@@ -0,0 +1,118 @@
+"""MetadataCache against the mock identity provider: fresh and stale (revalidated in the background) entries,
+and their persistence across workers."""
+import json
+import time
+
+from msal import ConfidentialClientApplication
+import pytest
+import requests
+
+from ms_identity_web.metadata_cache import MetadataCache
+
+class CountingClient(object):
+    """requests, counting the metadata requests that reach the identity provider. fail: raise instead"""
+    def __init__(self) -> None:
+        self.session = requests.Session()
+        self.metadata_requests = 0
+        self.fail = False
+
+    def get(self, url, **kwargs):
+        if self.fail:
+            raise requests.ConnectionError(f"identity provider unreachable: {url}")
+        self.metadata_requests += MetadataCache.is_metadata_request(url)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+@pytest.fixture
+def upstream():
+    client = CountingClient()
+    yield client
+    client.close()
+
+@pytest.fixture
+def metadata_url(mock_idp):
+    return f'{mock_idp.authority}/v2.0/.well-known/openid-configuration'
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_fresh_entries_are_served_from_memory(upstream, metadata_url):
+    cache = MetadataCache(upstream)
+    first = cache.get(metadata_url)
+    assert first.status_code == 200
+    for _ in range(3):
+        assert cache.get(metadata_url).json() == first.json()
+    assert upstream.metadata_requests == 1
+    assert (cache.misses, cache.hits, cache.stale_hits) == (1, 3, 0)
+
+def test_stale_entries_are_served_while_they_are_revalidated(upstream, metadata_url):
+    cache = MetadataCache(upstream, ttl=0.05)
+    metadata = cache.get(metadata_url).json()
+    fetched_at = cache._entries[metadata_url]['fetched_at']
+    time.sleep(0.1)
+
+    assert cache.get(metadata_url).json() == metadata # stale, answered without waiting for the identity provider
+    assert cache.stale_hits == 1
+    wait_for(lambda: cache._entries[metadata_url]['fetched_at'] > fetched_at and not cache._refreshing)
+    assert upstream.metadata_requests == 2
+    assert cache.get(metadata_url).json() == metadata
+    assert cache.hits == 1
+
+def test_stale_entries_are_served_while_the_identity_provider_is_unreachable(upstream, metadata_url):
+    cache = MetadataCache(upstream, ttl=0.05)
+    metadata = cache.get(metadata_url).json()
+    time.sleep(0.1)
+    upstream.fail = True
+    for _ in range(3):
+        assert cache.get(metadata_url).json() == metadata
+        wait_for(lambda: not cache._refreshing)
+    assert cache.stale_hits == 3
+
+def test_persisted_entries_are_shared_with_other_workers(upstream, metadata_url, mock_idp, tmp_path):
+    path = str(tmp_path / 'metadata.json')
+    metadata = MetadataCache(upstream, path=path).get(metadata_url).json()
+    assert json.loads(json.load(open(path))[metadata_url]['text']) == metadata
+
+    # a restarted (or other) worker starts from the file, even without the identity provider
+    upstream.fail = True
+    restarted = MetadataCache(upstream, path=path)
+    assert restarted.get(metadata_url).json() == metadata
+    assert (restarted.misses, restarted.hits) == (0, 1)
+
+    # what a worker fetches later is merged into the file, and read by running workers on their miss
+    upstream.fail = False
+    discovery_url = f'{mock_idp.authority}/discovery/instance'
+    params = {'api-version': '1.1', 'authorization_endpoint': f'{mock_idp.authority}/oauth2/v2.0/authorize'}
+    MetadataCache(upstream, path=path).get(discovery_url, params=params)
+    upstream.fail = True
+    assert restarted.get(discovery_url, params=params).status_code == 200
+    assert set(json.load(open(path))) == {metadata_url, MetadataCache._key(discovery_url, params)}
+    assert upstream.metadata_requests == 2
+
+def test_msal_clients_fetch_the_metadata_once(upstream, mock_idp):
+    cache = MetadataCache(upstream)
+    for _ in range(3):
+        client = ConfidentialClientApplication('client-id', client_credential='secret', authority=mock_idp.authority,
+                                               validate_authority=False, http_client=cache)
+        assert client.get_authorization_request_url([]).startswith(mock_idp.authority)
+    assert upstream.metadata_requests == 1
+
+def test_each_identity_web_uses_its_own_metadata_cache(aad_config, mock_idp, tmp_path):
+    from types import SimpleNamespace
+    from ms_identity_web import IdentityWebPython
+    instances = []
+    for name in ('first', 'second'): # same client config, different metadata caches
+        aad_config.metadata_cache = SimpleNamespace(path=str(tmp_path / f'{name}.json'), ttl=3600)
+        instances.append(IdentityWebPython(aad_config))
+    for ms_identity_web in instances:
+        ms_identity_web.warm_up()
+        assert ms_identity_web._http_client.misses == 1 # the instance's own prefetch
+        assert any(key.startswith(mock_idp.authority) for key in json.load(open(ms_identity_web._http_client.path)))
@@ -0,0 +1,52 @@
+"""Sign ins from tenants that aren't allowed must leave nothing behind that a later request could use."""
+from types import SimpleNamespace
+
+from ms_identity_web.context import IdentityContextData
+
+USER = 'user920001@contoso.example'
+
+def multi_tenant_config(mock_idp, allowed_tenants):
+    import load_test_apps
+    config = load_test_apps.load_config('django', mock_idp.authority)
+    config.type.authority_type = 'MULTI_TENANT'
+    config.client.authority = mock_idp.authority.rsplit('/', 1)[0] + '/organizations'
+    # users of contoso.example sign in through the mock's tenant authority
+    config.multi_tenant = SimpleNamespace(allowed_tenants=allowed_tenants, max_tenants=None,
+                                          domains=SimpleNamespace(**{'contoso.example': mock_idp.idp.tenant_id}))
+    return config
+
+def session_identity_context(client) -> IdentityContextData:
+    return IdentityContextData.decode(client.session.get(IdentityContextData.SESSION_KEY, None))
+
+def test_sign_in_from_an_allowed_tenant(mock_idp, django_app, sign_in):
+    client, ms_identity_web = django_app(multi_tenant_config(mock_idp, [mock_idp.idp.tenant_id]))
+    assert sign_in(client, USER, f'/sign_in_as?login_hint={USER}').status_code == 302
+    assert session_identity_context(client).authenticated
+    assert client.get('/token').json()['access_token']
+
+def test_sign_in_from_a_tenant_that_is_not_allowed_leaves_no_token_cache(mock_idp, django_app, sign_in):
+    client, ms_identity_web = django_app(multi_tenant_config(mock_idp, ['good-tenant']))
+    assert sign_in(client, USER, f'/sign_in_as?login_hint={USER}').status_code == 500
+    assert ms_identity_web._tenants.rejected == 1
+    identity_context = session_identity_context(client)
+    assert not identity_context.authenticated
+    assert not identity_context.token_cache.find('RefreshToken')
+
+    token = client.get('/token').json()
+    assert token['access_token'] is None and token['error']
+
+def test_rejected_sign_in_signs_the_previous_user_out(mock_idp, django_app, sign_in):
+    from ms_identity_web.tenants import TenantResolver
+    config = multi_tenant_config(mock_idp, [mock_idp.idp.tenant_id])
+    client, ms_identity_web = django_app(config)
+    sign_in(client, USER, f'/sign_in_as?login_hint={USER}')
+    assert client.get('/token').json()['access_token']
+
+    # the tenant is no longer allowed: the next sign in from it is rejected
+    config.multi_tenant.allowed_tenants = ['good-tenant']
+    ms_identity_web._tenants = TenantResolver.from_config(config.client.authority, config.multi_tenant)
+    assert sign_in(client, USER, f'/sign_in_as?login_hint={USER}').status_code == 500
+    identity_context = session_identity_context(client)
+    assert not identity_context.authenticated
+    assert not identity_context.token_cache.find('RefreshToken')
+    assert client.get('/token').json()['access_token'] is None
@@ -0,0 +1,63 @@
+"""Signed state tokens are redeemed once: a replayed redirect is rejected, by the worker that verified it
+and, through the spent binding cookie, by any other."""
+from urllib.parse import urlencode, urlparse, parse_qs
+
+import pytest
+import requests
+
+from ms_identity_web.errors import AuthSecurityError
+from ms_identity_web.signed_state import SignedState
+
+def test_a_token_is_verified_once():
+    signed_state = SignedState()
+    token = signed_state.issue({'n': 'nonce'}, 'binding', 'secret')
+    assert signed_state.verify(token, 'binding', 'secret')['n'] == 'nonce'
+    with pytest.raises(AuthSecurityError, match='already been used'):
+        signed_state.verify(token, 'binding', 'secret')
+    # others still are
+    assert signed_state.verify(signed_state.issue({'n': 'other nonce'}, 'binding', 'secret'), 'binding', 'secret')
+
+def test_redeemed_tokens_are_forgotten_once_expired(monkeypatch):
+    signed_state = SignedState(max_age=60, max_redeemed=2)
+    now = 1000000
+    monkeypatch.setattr('time.time', lambda: now)
+    tokens = [signed_state.issue({'n': str(i)}, 'binding', 'secret') for i in range(3)]
+    for token in tokens:
+        signed_state.verify(token, 'binding', 'secret')
+    assert len(signed_state._redeemed) == 2 # bounded
+    now += 61
+    signed_state.verify(signed_state.issue({}, 'binding', 'secret'), 'binding', 'secret')
+    assert len(signed_state._redeemed) == 1
+
+def redirect_url(client, login_hint: str) -> str:
+    """the url the identity provider sends the browser back to, once signed in"""
+    authorize_url = urlparse(client.get('/auth/sign_in').headers['Location'])
+    params = dict(parse_qs(authorize_url.query), login_hint=[login_hint])
+    authorize_url = authorize_url._replace(query=urlencode(params, doseq=True)).geturl()
+    redirect = urlparse(requests.get(authorize_url, allow_redirects=False).headers['Location'])
+    return f'{redirect.path}?{redirect.query}'
+
+def test_replayed_redirect_is_rejected(flask_app):
+    app, ms_identity_web = flask_app(signed_state=SignedState())
+    client = app.test_client()
+    url = redirect_url(client, 'user930001@contoso.example')
+    binding = client.get_cookie(SignedState.DEFAULT_BINDING_COOKIE).value
+    assert client.get(url).status_code == 302
+    assert client.get_cookie(SignedState.DEFAULT_BINDING_COOKIE) is None # spent
+
+    # the same worker remembers the token, even presented with the binding cookie
+    client.set_cookie(SignedState.DEFAULT_BINDING_COOKIE, binding)
+    assert client.get(url).status_code == 500
+
+    # another worker hasn't seen it, but the browser no longer holds the binding
+    other_app, _ = flask_app(signed_state=SignedState())
+    other_client = other_app.test_client()
+    other_client.set_cookie('session', client.get_cookie('session').value)
+    assert other_client.get(url).status_code == 500
+
+def test_next_sign_in_is_bound_anew(flask_app, sign_in):
+    app, ms_identity_web = flask_app(signed_state=SignedState())
+    client = app.test_client()
+    for index in range(2):
+        assert sign_in(client, f'user93001{index}@contoso.example').status_code == 302
+        assert client.get('/token').json['oid'].endswith(f'93001{index}')
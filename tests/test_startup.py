@@ -0,0 +1,16 @@
+"""import ms_identity_web (and each framework integration) stays within the startup budget of
+benchmarks/startup.py, and loads nothing it has no use for yet: msal, requests, the web frameworks..."""
+import statistics
+
+import pytest
+
+import startup
+
+@pytest.mark.parametrize('scenario', startup.SCENARIOS)
+def test_import_is_lazy_and_within_budget(scenario):
+    setup, statement, forbidden = startup.SCENARIOS[scenario]
+    if not startup.available(setup, statement):
+        pytest.skip(f"`{statement}` fails here (framework not installed?)")
+    runs = [startup.probe(setup, statement, forbidden) for _ in range(startup.RUNS)]
+    assert sorted({module for run in runs for module in run['loaded']}) == []
+    assert statistics.median(run['ms'] for run in runs) <= startup.MAX_MS
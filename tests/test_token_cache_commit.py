@@ -0,0 +1,56 @@
+from ms_identity_web.context import IdentityContextData
+from ms_identity_web.token_cache_stores import InMemoryTokenCacheStore
+
+def test_clear_drops_the_memoized_token_cache():
+    identity_context = IdentityContextData()
+    token_cache = identity_context.token_cache
+    token_cache.has_state_changed = True
+    identity_context.clear()
+    identity_context.commit_token_cache()
+    assert identity_context.token_cache is not token_cache
+    assert identity_context._token_cache is None
+
+def test_tokens_of_a_successful_acquisition_are_kept_when_the_view_fails(flask_app, sign_in):
+    # the identity provider may have rotated the refresh token: the new one must not be lost
+    store = InMemoryTokenCacheStore()
+    app, ms_identity_web = flask_app(token_cache_store=store)
+
+    @app.route('/refresh_then_fail')
+    def refresh_then_fail():
+        ms_identity_web.acquire_token_silently(force_refresh=True)
+        raise RuntimeError('the view fails after the refresh')
+
+    client = app.test_client()
+    sign_in(client)
+    assert client.get('/refresh_then_fail').status_code == 500
+    assert client.get('/token').json['access_token'] is not None
+    ms_identity_web._access_token_index.invalidate_matching(lambda key: True)
+    assert client.get('/token').json['access_token'] is not None
+
+def test_failed_silent_acquisition_commits_nothing(flask_app, sign_in, mock_idp):
+    store = InMemoryTokenCacheStore()
+    app, ms_identity_web = flask_app(token_cache_store=store)
+
+    @app.route('/fail')
+    def fail():
+        id_data = ms_identity_web.id_data
+        id_data.token_cache.has_state_changed = True # as if msal had changed it, then the acquisition failed
+        ms_identity_web.acquire_token_silently(force_refresh=True)
+        return 'not reached'
+
+    client = app.test_client()
+    sign_in(client)
+    (home_account_id, (signed_in_cache, updated_at)), = store._entries.items()
+    with mock_idp._lock:
+        mock_idp.idp._refresh_tokens.clear() # revoked: the refresh fails with invalid_grant
+    assert client.get('/fail').status_code == 500
+    assert store._entries[home_account_id] == (signed_in_cache, updated_at)
+
+def test_failed_sign_in_commits_no_token_cache(flask_app, sign_in):
+    app, _ = flask_app()
+    client = app.test_client()
+    sign_in(client)
+    response = client.get('/auth/redirect?code=some-code&state=forged-state')
+    assert response.status_code == 500
+    with client.session_transaction() as session:
+        assert 'c' not in session['identity_context_data']
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from ms_identity_web.errors import TokenExchangeError
+
+from ms_identity_web.token_cache_stores import InMemoryTokenCacheStore
+
+ALICE, BOB = 'user900001@contoso.example', 'user900002@contoso.example'
+
+def oid_of(index: int) -> str:
+    return f'00000000-0000-0000-0000-{index:012d}'
+
+def stored_accounts(store: InMemoryTokenCacheStore) -> dict:
+    """home_account_id -> the home_account_ids of the accounts in its stored cache"""
+    return {key: sorted(a['home_account_id'] for a in json.loads(cache).get('Account', {}).values())
+            for key, (cache, _) in store._entries.items()}
+
+def test_signing_in_over_another_user_starts_from_an_empty_cache(flask_app, sign_in):
+    store = InMemoryTokenCacheStore()
+    app, ms_identity_web = flask_app(token_cache_store=store)
+    laptop, kiosk = app.test_client(), app.test_client()
+    sign_in(laptop, BOB)
+    sign_in(kiosk, ALICE)
+    sign_in(kiosk, BOB) # without signing Alice out
+
+    for key, accounts in stored_accounts(store).items():
+        assert accounts == [key]
+
+    ms_identity_web._access_token_index.invalidate_matching(lambda key: True) # through msal, not the index
+    assert laptop.get('/token').json['oid'] == oid_of(900002)
+    assert kiosk.get('/token').json['oid'] == oid_of(900002)
+
+def test_silent_acquisition_only_uses_the_signed_in_users_account(flask_app, sign_in):
+    app, ms_identity_web = flask_app()
+    client = app.test_client()
+    sign_in(client, ALICE)
+    with client.session_transaction() as session:
+        alice_context = dict(session['identity_context_data'])
+    sign_in(client, BOB)
+    with client.session_transaction() as session:
+        # a session cache that holds Alice's account, while Bob is signed in
+        session['identity_context_data'] = dict(session['identity_context_data'], c=alice_context['c'])
+
+    ms_identity_web._access_token_index.invalidate_matching(lambda key: True)
+    app.testing = True # the error propagates to the test
+    with pytest.raises(TokenExchangeError, match='no_account'):
+        client.get('/token')
+
+def test_each_identity_web_keeps_its_own_store(flask_app, sign_in):
+    first_store, second_store = InMemoryTokenCacheStore(), InMemoryTokenCacheStore()
+    first_app, _ = flask_app(token_cache_store=first_store)
+    second_app, _ = flask_app(token_cache_store=second_store)
+    sign_in(first_app.test_client())
+    assert len(first_store) == 1
+    assert len(second_store) == 0
@@ -0,0 +1,33 @@
+"""The access token index: tokens are kept per tenant, and not served once the account's cache is gone from
+the token cache store, whichever worker removed it."""
+from ms_identity_web import IdentityWebPython, TokenStoreMaintenance
+from ms_identity_web.token_cache_stores import SQLiteTokenCacheStore
+from ms_identity_web.token_index import AccessTokenIndex
+
+def test_tokens_are_indexed_per_tenant():
+    index = AccessTokenIndex()
+    index.put('uid.home-tenant', ['User.Read'], 'home token', 3600)
+    index.put('uid.home-tenant', ['User.Read'], 'guest token', 3600, tenant='resource-tenant')
+    assert index.get('uid.home-tenant', ['user.read']) == 'home token'
+    assert index.get('uid.home-tenant', ['user.read'], 'resource-tenant') == 'guest token'
+    assert index.get('uid.home-tenant', ['user.read'], 'other-tenant') is None
+    assert not index.was_read('uid.home-tenant', ['User.Read'], 'other-tenant')
+    assert index.was_read('uid.home-tenant', ['User.Read'], 'resource-tenant')
+
+def test_index_serves_no_token_of_an_account_another_worker_removed(flask_app, aad_config, sign_in, tmp_path):
+    store_path = str(tmp_path / 'tokens.db')
+    app, ms_identity_web = flask_app(token_cache_store=SQLiteTokenCacheStore(store_path))
+    client = app.test_client()
+    sign_in(client)
+    (home_account_id, _), = next(ms_identity_web.token_cache_store.iter_batches())
+    assert client.get('/token').json['access_token']
+    hits = ms_identity_web._access_token_index.hits
+    assert client.get('/token').json['access_token']
+    assert ms_identity_web._access_token_index.hits == hits + 1
+
+    # another worker process, sharing the store
+    other_worker = IdentityWebPython(aad_config, token_cache_store=SQLiteTokenCacheStore(store_path))
+    assert TokenStoreMaintenance(other_worker).evict(account=home_account_id) == 1
+
+    assert client.get('/token').status_code == 500 # no_account: the user signs in again
+    assert len(ms_identity_web._access_token_index) == 0